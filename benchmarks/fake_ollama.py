@@ -0,0 +1,234 @@
+"""
+本地的 Ollama 替身服务，用于压测。
+
+实现 Ollama 的 /api/chat（NDJSON 流式与非流式）、/api/generate 和 /api/tags 接口，
+按配置的首 token 延迟、生成速度和抖动逐个返回 token，不需要 GPU 和真实模型。
+
+单独运行：
+    python benchmarks/fake_ollama.py --port 11435 --tokens-per-second 30 --latency 0.2
+然后设置 LM_OLLAMA_BASE_URL=http://127.0.0.1:11435 启动 LanguageMentor。
+"""
+import argparse
+import asyncio
+import json
+import random
+import socket
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+# 生成回复时循环使用的词表
+WORDS = (
+    "Great job! Let's keep practicing. Could you tell me a little more about your plan for the weekend? "
+    "Remember to use the past tense when you talk about what already happened, and try a new word today."
+).split()
+
+
+@dataclass
+class FakeOllamaConfig:
+    latency: float = 0.2  # 首 token 延迟（秒），模拟提示计算
+    tokens_per_second: float = 30.0  # 生成速度
+    jitter: float = 0.1  # 延迟和生成速度的随机抖动比例，0.1 表示 ±10%
+    reply_tokens: int = 60  # 每个回复的 token 数
+    max_parallel: int = 0  # 同时处理的请求数，模拟 OLLAMA_NUM_PARALLEL，0 表示不限制
+    model: str = "llama3.1:8b-instruct-q8_0"
+
+
+class FakeOllama:
+    """
+    Ollama 替身服务，记录收到的请求数，供压测结果核对。
+    """
+    def __init__(self, config=None):
+        self.config = config or FakeOllamaConfig()
+        self.requests = 0
+        self.active = 0
+        self.peak_active = 0
+        self._semaphore = None
+        self.app = Starlette(routes=[
+            Route("/api/chat", self.chat, methods=["POST"]),
+            Route("/api/generate", self.generate, methods=["POST"]),
+            Route("/api/tags", self.tags, methods=["GET"]),
+            Route("/", self.root, methods=["GET", "HEAD"]),
+        ])
+
+    def _jittered(self, value):
+        return max(0.0, value * (1 + random.uniform(-self.config.jitter, self.config.jitter)))
+
+    @staticmethod
+    def _now():
+        return datetime.now(timezone.utc).isoformat()
+
+    def _reply_tokens(self, body):
+        # 遵循请求中的 num_predict（即 ChatOllama 的 max_tokens）
+        limit = (body.get("options") or {}).get("num_predict")
+        count = self.config.reply_tokens if not limit or limit < 0 else min(limit, self.config.reply_tokens)
+        start = random.randrange(len(WORDS))
+        return [WORDS[(start + i) % len(WORDS)] + " " for i in range(count)]
+
+    async def _produce(self, prompt_chars, tokens, make_chunk):
+        """
+        按配置的延迟和速度逐个生成 NDJSON 行，最后一行携带与 Ollama 相同的统计字段。
+        """
+        if self._semaphore is None and self.config.max_parallel > 0:
+            self._semaphore = asyncio.Semaphore(self.config.max_parallel)
+        self.requests += 1
+        start = time.perf_counter()
+        if self._semaphore is not None:
+            await self._semaphore.acquire()
+        self.active += 1
+        self.peak_active = max(self.peak_active, self.active)
+        try:
+            prompt_start = time.perf_counter()
+            await asyncio.sleep(self._jittered(self.config.latency))
+            prompt_duration = time.perf_counter() - prompt_start
+            eval_start = time.perf_counter()
+            interval = 1.0 / self.config.tokens_per_second if self.config.tokens_per_second > 0 else 0.0
+            for token in tokens:
+                yield make_chunk(token, False)
+                if interval:
+                    await asyncio.sleep(self._jittered(interval))
+            final = make_chunk("", True)
+            final.update({
+                "done_reason": "stop",
+                "total_duration": int((time.perf_counter() - start) * 1e9),
+                "load_duration": 0,
+                "prompt_eval_count": max(1, prompt_chars // 4),
+                "prompt_eval_duration": int(prompt_duration * 1e9),
+                "eval_count": len(tokens),
+                "eval_duration": int((time.perf_counter() - eval_start) * 1e9),
+            })
+            yield final
+        finally:
+            self.active -= 1
+            if self._semaphore is not None:
+                self._semaphore.release()
+
+    async def _respond(self, body, chunks):
+        if body.get("stream", True):
+            async def lines():
+                async for chunk in chunks:
+                    yield json.dumps(chunk) + "\n"
+            return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+        # 非流式请求：合并所有片段后一次性返回
+        merged, text = None, []
+        async for chunk in chunks:
+            text.append(chunk.get("message", {}).get("content", "") or chunk.get("response", ""))
+            merged = chunk
+        if "message" in merged:
+            merged["message"]["content"] = "".join(text)
+        else:
+            merged["response"] = "".join(text)
+        return JSONResponse(merged)
+
+    async def chat(self, request):
+        body = await request.json()
+        model = body.get("model", self.config.model)
+        prompt_chars = sum(len(str(m.get("content", ""))) for m in body.get("messages", []))
+
+        def make_chunk(token, done):
+            return {
+                "model": model,
+                "created_at": self._now(),
+                "message": {"role": "assistant", "content": token},
+                "done": done,
+            }
+
+        return await self._respond(body, self._produce(prompt_chars, self._reply_tokens(body), make_chunk))
+
+    async def generate(self, request):
+        body = await request.json()
+        model = body.get("model", self.config.model)
+
+        def make_chunk(token, done):
+            return {"model": model, "created_at": self._now(), "response": token, "done": done}
+
+        tokens = self._reply_tokens(body) if body.get("prompt") else []  # 空提示只加载模型
+        return await self._respond(body, self._produce(len(body.get("prompt", "")), tokens, make_chunk))
+
+    async def tags(self, request):
+        return JSONResponse({"models": [{"name": self.config.model, "model": self.config.model, "size": 0}]})
+
+    async def root(self, request):
+        return JSONResponse("Ollama is running")
+
+
+class FakeOllamaServer:
+    """
+    在后台线程中运行的替身服务。
+    """
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.fake = FakeOllama(config)
+        self.host = host
+        self.port = port or self._free_port(host)
+        self._server = uvicorn.Server(uvicorn.Config(
+            self.fake.app, host=self.host, port=self.port, log_level="warning", lifespan="off",
+        ))
+        self._thread = None
+
+    @staticmethod
+    def _free_port(host):
+        with socket.socket() as sock:
+            sock.bind((host, 0))
+            return sock.getsockname()[1]
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def start(self, timeout=10.0):
+        self._thread = threading.Thread(target=self._server.run, name="fake-ollama", daemon=True)
+        self._thread.start()
+        deadline = time.monotonic() + timeout
+        while not self._server.started:
+            if time.monotonic() > deadline or not self._thread.is_alive():
+                raise RuntimeError("替身 Ollama 服务启动失败")
+            time.sleep(0.05)
+        return self
+
+    def stop(self):
+        self._server.should_exit = True
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+
+def add_arguments(parser):
+    """
+    添加替身服务的命令行参数，压测脚本复用同一组参数。
+    """
+    defaults = FakeOllamaConfig()
+    parser.add_argument("--latency", type=float, default=defaults.latency, help="首 token 延迟（秒）")
+    parser.add_argument("--tokens-per-second", type=float, default=defaults.tokens_per_second, help="生成速度")
+    parser.add_argument("--jitter", type=float, default=defaults.jitter, help="随机抖动比例，例如 0.1 表示 ±10%%")
+    parser.add_argument("--reply-tokens", type=int, default=defaults.reply_tokens, help="每个回复的 token 数")
+    parser.add_argument("--max-parallel", type=int, default=defaults.max_parallel,
+                        help="替身服务同时处理的请求数，模拟 OLLAMA_NUM_PARALLEL，0 表示不限制")
+
+
+def config_from_args(args):
+    return FakeOllamaConfig(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        jitter=args.jitter,
+        reply_tokens=args.reply_tokens,
+        max_parallel=args.max_parallel,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="用于压测的 Ollama 替身服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    uvicorn.run(FakeOllama(config_from_args(args)).app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
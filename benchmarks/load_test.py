@@ -0,0 +1,318 @@
+"""
+LanguageMentor 压测脚本。
+
+启动本地的 Ollama 替身服务（或使用 --base-url 指定的真实服务），
+用大量并发的模拟学习者驱动 ConversationAgent、ScenarioAgent 和 VocabAgent 进行多轮对话，
+统计吞吐量、延迟与首 token 延迟的 p50/p95/p99，以及会话存储的内存增长，结果输出为 JSON。
+
+示例：
+    python benchmarks/load_test.py --sessions 64 --turns 4 --output bench.json
+    python benchmarks/load_test.py --baseline bench.json --tolerance 0.2   # 与基线比较，退化时退出码为 1
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), "src"))
+
+import fake_ollama  # noqa: E402
+from utils.stats import percentile  # noqa: E402
+
+# 各类代理的多轮对话脚本，轮数超过脚本长度时循环使用
+CONVERSATION_SCRIPT = [
+    "Hi! Can we practice some daily conversation today?",
+    "I went to the park yesterday and played basketball with my friends.",
+    "What is the difference between 'fun' and 'funny'?",
+    "Could you correct this sentence: I am agree with you.",
+    "Let's talk about my favorite food. I like dumplings very much.",
+    "How do I politely ask my boss for a day off?",
+]
+SCENARIO_SCRIPT = [
+    "Hello, nice to meet you.",
+    "I have about three years of experience in this field.",
+    "Could you tell me more about it, please?",
+    "I think that sounds good. What should I do next?",
+    "Thank you very much for your help.",
+]
+VOCAB_SCRIPT = [
+    "I think 'abandon' means to leave something behind.",
+    "She decided to abandon the old car on the road.",
+    "Can you give me another example?",
+    "Next word, please.",
+]
+
+
+@dataclass
+class TurnResult:
+    agent: str
+    latency: float  # 从发送到收到完整回复的耗时（秒）
+    ttft: Optional[float]  # 首个片段的延迟（秒）
+    chunks: int  # 收到的片段数，约等于生成的 token 数
+    error: Optional[str] = None
+
+
+def distribution(values):
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "mean": sum(values) / len(values) if values else None,
+        "max": max(values) if values else None,
+    }
+
+
+def summarize(results, elapsed):
+    """
+    汇总一组对话轮次的结果。
+    """
+    ok = [r for r in results if r.error is None]
+    errors = {}
+    for r in results:
+        if r.error is not None:
+            errors[r.error] = errors.get(r.error, 0) + 1
+    chunks = sum(r.chunks for r in ok)
+    return {
+        "turns": len(results),
+        "ok": len(ok),
+        "errors": errors,
+        "throughput_turns_per_s": len(ok) / elapsed if elapsed else 0.0,
+        "throughput_chunks_per_s": chunks / elapsed if elapsed else 0.0,
+        "latency_s": distribution([r.latency for r in ok]),
+        "ttft_s": distribution([r.ttft for r in ok if r.ttft is not None]),
+    }
+
+
+def process_rss():
+    """
+    当前进程的常驻内存（字节），无法读取时返回 None。
+    """
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def session_store_footprint(session_manager):
+    """
+    估算会话存储中所有聊天历史占用的内存（紧凑存储的角色与文本内容）。
+    """
+    report = session_manager.memory_report(top=0)
+    report.pop("largest")
+    return report
+
+
+async def run_turn(agent, text, session_id, results):
+    from agents.concurrency import OverloadedError
+
+    start = time.perf_counter()
+    first = None
+    chunks = 0
+    try:
+        async for _ in agent.astream_with_history(text, session_id):
+            if first is None:
+                first = time.perf_counter()
+            chunks += 1
+    except OverloadedError:
+        results.append(TurnResult(agent.name, time.perf_counter() - start, None, chunks, "overloaded"))
+        return False
+    except Exception as e:
+        results.append(TurnResult(agent.name, time.perf_counter() - start, None, chunks, type(e).__name__))
+        return False
+    results.append(TurnResult(agent.name, time.perf_counter() - start, first - start if first else None, chunks))
+    return True
+
+
+async def run_session(index, kind, agent, args, results):
+    """
+    模拟一个学习者：开始会话后按脚本进行多轮对话，每轮之间有随机的思考时间。
+    """
+    await asyncio.sleep(random.uniform(0, args.ramp_up))  # 在预热时间内错开会话的开始时间
+    session_id = f"bench-{index}"
+    if kind == "scenario":
+        await agent.astart_new_session(session_id)
+        script = SCENARIO_SCRIPT
+    elif kind == "vocab":
+        await asyncio.to_thread(agent.restart_session, session_id)
+        script = [agent.level_message(session_id)] + VOCAB_SCRIPT  # 先发送列出本关单词的开场消息
+    else:
+        script = CONVERSATION_SCRIPT
+
+    for text in itertools.islice(itertools.cycle(script), args.turns):
+        if not await run_turn(agent, text, session_id, results) and args.stop_on_error:
+            return
+        if args.think_time:
+            await asyncio.sleep(random.uniform(0, args.think_time))
+
+
+def build_agents():
+    from agents.conversation_agent import ConversationAgent
+    from agents.scenario_agent import ScenarioAgent
+    from agents.vocab_agent import VocabAgent
+    from utils.asset_store import asset_store
+
+    pool = [("conversation", ConversationAgent()), ("vocab", VocabAgent())]
+    pool += [("scenario", ScenarioAgent(name)) for name in asset_store.scenarios()]
+    return pool
+
+
+async def run_load(args):
+    from agents.session_history import session_manager
+
+    pool = build_agents()
+    before_store = session_store_footprint(session_manager)
+    before_rss = process_rss()
+    if args.tracemalloc:
+        tracemalloc.start()
+    traced_before = tracemalloc.get_traced_memory()[0] if args.tracemalloc else None
+
+    results = []
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        run_session(i, *pool[i % len(pool)], args, results) for i in range(args.sessions)
+    ))
+    elapsed = time.perf_counter() - start
+
+    after_store = session_store_footprint(session_manager)
+    after_rss = process_rss()
+    memory = {
+        "session_store_before": before_store,
+        "session_store_after": after_store,
+        "session_store_growth_bytes": after_store["approx_bytes"] - before_store["approx_bytes"],
+        "rss_before_bytes": before_rss,
+        "rss_after_bytes": after_rss,
+        "rss_growth_bytes": after_rss - before_rss if before_rss and after_rss else None,
+    }
+    if args.tracemalloc:
+        memory["traced_growth_bytes"] = tracemalloc.get_traced_memory()[0] - traced_before
+        tracemalloc.stop()
+
+    per_agent = {}
+    for name in sorted({r.agent for r in results}):
+        per_agent[name] = summarize([r for r in results if r.agent == name], elapsed)
+    return {
+        "overall": summarize(results, elapsed),
+        "agents": per_agent,
+        "memory": memory,
+        "elapsed_s": elapsed,
+    }
+
+
+# 与基线比较时检查的指标：(路径, 越大越好)
+REGRESSION_CHECKS = [
+    (("overall", "throughput_turns_per_s"), True),
+    (("overall", "latency_s", "p50"), False),
+    (("overall", "latency_s", "p95"), False),
+    (("overall", "ttft_s", "p95"), False),
+    (("memory", "session_store_after", "approx_bytes_per_session"), False),
+]
+
+
+def compare(report, baseline, tolerance):
+    """
+    与基线结果比较，返回超出容忍比例的退化项列表。
+    """
+    regressions = []
+    for path, higher_is_better in REGRESSION_CHECKS:
+        current, previous = report, baseline
+        for key in path:
+            current = current.get(key) if isinstance(current, dict) else None
+            previous = previous.get(key) if isinstance(previous, dict) else None
+        if not current or not previous:
+            continue
+        change = (current - previous) / previous
+        if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+            regressions.append({"metric": ".".join(path), "baseline": previous, "current": current, "change": change})
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="LanguageMentor 并发压测")
+    parser.add_argument("--sessions", type=int, default=32, help="并发的模拟学习者数")
+    parser.add_argument("--turns", type=int, default=4, help="每个学习者的对话轮数")
+    parser.add_argument("--think-time", type=float, default=0.0, help="每轮之间的最长随机思考时间（秒）")
+    parser.add_argument("--ramp-up", type=float, default=1.0, help="在该时间内错开各会话的开始（秒）")
+    parser.add_argument("--stop-on-error", action="store_true", help="会话出错后不再继续后续轮次")
+    parser.add_argument("--base-url", help="使用已有的 Ollama 服务（或替身服务），不启动内置的替身服务")
+    parser.add_argument("--max-concurrency", type=int, help="覆盖 LM_MAX_CONCURRENCY")
+    parser.add_argument("--max-queue", type=int, help="覆盖 LM_MAX_QUEUE")
+    parser.add_argument("--tracemalloc", action="store_true", help="用 tracemalloc 精确统计内存增长（会降低吞吐量）")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--output", help="将 JSON 结果写入文件")
+    parser.add_argument("--baseline", help="与之比较的基线 JSON 结果")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的退化比例")
+    fake_ollama.add_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    random.seed(args.seed)
+
+    server = None
+    if args.base_url:
+        base_url = args.base_url
+    else:
+        server = fake_ollama.FakeOllamaServer(fake_ollama.config_from_args(args)).start()
+        base_url = server.url
+
+    # 代理在构造时读取环境变量，必须在导入和创建代理之前设置
+    os.environ["LM_OLLAMA_BASE_URL"] = base_url
+    os.environ.setdefault("LM_LOG_LEVEL", "WARNING")
+    os.environ.setdefault("LM_LOG_FILE", "none")
+    os.environ.setdefault("LM_ASSET_RELOAD_INTERVAL", "0")
+    if args.max_concurrency is not None:
+        os.environ["LM_MAX_CONCURRENCY"] = str(args.max_concurrency)
+    if args.max_queue is not None:
+        os.environ["LM_MAX_QUEUE"] = str(args.max_queue)
+
+    try:
+        report = asyncio.run(run_load(args))
+    finally:
+        if server is not None:
+            server.stop()
+
+    from agents.concurrency import model_limiter
+
+    report["config"] = {
+        "sessions": args.sessions,
+        "turns": args.turns,
+        "think_time": args.think_time,
+        "ramp_up": args.ramp_up,
+        "base_url": args.base_url or "fake",
+        "fake_ollama": asdict(fake_ollama.config_from_args(args)) if server else None,
+        "max_concurrency": model_limiter.max_concurrency,
+        "max_queue": model_limiter.max_queue,
+        "python": platform.python_version(),
+    }
+    if server is not None:
+        report["backend"] = {"requests": server.fake.requests, "peak_active": server.fake.peak_active}
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            regressions = compare(report, json.load(file), args.tolerance)
+        report["regressions"] = regressions
+        exit_code = 1 if regressions else 0
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(output + "\n")
+    print(output)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,68 +1,404 @@
-import json
+import asyncio
+import itertools
+import time
 from abc import ABC, abstractmethod
+from contextlib import aclosing, closing, contextmanager
 
-from langchain_ollama.chat_models import ChatOllama  # 导入 ChatOllama 模型
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder  # 导入提示模板相关类
-from langchain_core.messages import HumanMessage  # 导入消息类
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage  # 导入消息类
+from langchain_core.runnables import RunnableLambda  # 导入函数式可运行类
 from langchain_core.runnables.history import RunnableWithMessageHistory  # 导入带有消息历史的可运行类
 
 from .session_history import get_session_history  # 导入会话历史相关方法
+from .compact_history import count_messages, get_messages  # 不转换整段历史即可读取消息数与部分消息
+from .backend_pool import backend_pool as default_backend_pool  # 导入多后端的后端池
+from .concurrency import model_limiter  # 导入模型请求限流器
+from .agent_metrics import (  # 导入代理指标
+    CACHE_HITS, COMPLETION_TOKENS, HISTORY_LENGTH, PREFETCH_HITS, PROMPT_TOKENS, QUEUE_WAIT, RETRIES,
+    TIME_TO_FIRST_TOKEN, track_turn,
+)
+from .prefetch import default_prefetcher  # 导入推测式预生成器
+from .response_cache import ResponseCache  # 导入回复缓存（用于计算请求的键）
+from .resilience import ModelTimeoutError, RequestPolicy, translate_error  # 导入请求截止时间与重试策略
+from .history_policy import create_history_policy  # 导入历史消息策略
+from .model_registry import ModelConfig, model_registry  # 导入模型配置与共享的模型注册表
+from utils.asset_store import asset_store  # 导入资源仓库
 from utils.logger import LOG  # 导入日志工具
 
+
+class AtomicHistoryRunnable(RunnableWithMessageHistory):
+    """
+    只在一轮对话成功完成时写入历史的 RunnableWithMessageHistory。
+    langchain 的同步流在被提前关闭时会按正常结束处理，把不完整的回复写入历史；
+    调用方在中止本轮时把配置中的 "__turn" 标记为 aborted，写入历史前检查该标记。
+    """
+    @staticmethod
+    def _aborted(config):
+        turn = config.get("configurable", {}).get("__turn")
+        return turn is not None and turn.get("aborted", False)
+
+    def _exit_history(self, run, config):
+        if not self._aborted(config):
+            super()._exit_history(run, config)
+
+    async def _aexit_history(self, run, config):
+        if not self._aborted(config):
+            await super()._aexit_history(run, config)
+
+
+def extract_eval_stats(metadata):
+    """
+    从 Ollama 响应元数据中提取 token 计数和耗时，耗时由纳秒转换为秒。
+
+    参数:
+        metadata (dict): 响应元数据（response_metadata）
+
+    返回:
+        dict: 统计信息，元数据中没有相关字段时为空字典
+    """
+    stats = {}
+    for key in ("prompt_eval_count", "eval_count"):
+        if metadata.get(key) is not None:
+            stats[key] = metadata[key]
+    for key in ("prompt_eval_duration", "eval_duration", "load_duration", "total_duration"):
+        if metadata.get(key) is not None:
+            stats[key] = metadata[key] / 1e9
+    return stats
+
 class AgentBase(ABC):
     """
     抽象基类，提供代理的共有功能。
     """
-    def __init__(self, name, prompt_file, intro_file=None, session_id=None):
+    def __init__(self, name, prompt_file, intro_file=None, session_id=None, history_policy=None, model_config=None,
+                 response_cache=None, request_policy=None, backend_pool=None, prefetcher=None):
         self.name = name
         self.prompt_file = prompt_file
         self.intro_file = intro_file
         self.session_id = session_id if session_id else self.name
+        self.history_policy = history_policy if history_policy else create_history_policy()  # 历史消息裁剪策略
+        self.model_config = model_config if model_config else ModelConfig.from_env(name)  # 模型配置
+        self.response_cache = response_cache  # 开场轮次的回复缓存，None 表示不启用
+        self.request_policy = request_policy if request_policy else RequestPolicy.from_env(name)  # 截止时间与重试策略
+        self.backend_pool = backend_pool if backend_pool else default_backend_pool  # 多个 Ollama 后端，None 表示只用单个后端
+        self.prefetcher = prefetcher if prefetcher else default_prefetcher  # 推测式预生成，None 表示不启用
         self.prompt = self.load_prompt()
         self.intro_messages = self.load_intro() if self.intro_file else []
-        self.create_chatbot()
+        self._chatbot_with_history = None  # 聊天机器人在首次使用时才创建
+
+        # 提示词或初始消息文件被修改时自动重新加载
+        asset_store.subscribe(self.prompt_file, self.reload_assets)
+        if self.intro_file:
+            asset_store.subscribe(self.intro_file, self.reload_assets)
+        self.last_eval_stats = {}  # 最近一轮的 Ollama 提示计算与生成统计
+
+    @property
+    def chatbot_with_history(self):
+        """
+        带有消息历史的聊天机器人，首次访问时创建。
+        """
+        if self._chatbot_with_history is None:
+            self.create_chatbot()
+        return self._chatbot_with_history
 
     def load_prompt(self):
         """
-        从文件加载系统提示语。
+        从资源仓库加载系统提示语。
         """
         try:
-            with open(self.prompt_file, "r", encoding="utf-8") as file:
-                return file.read().strip()
+            return asset_store.get(self.prompt_file)
         except FileNotFoundError:
             raise FileNotFoundError(f"找不到提示文件 {self.prompt_file}!")
 
     def load_intro(self):
         """
-        从 JSON 文件加载初始消息。
+        从资源仓库加载初始消息（JSON 文件）。
         """
         try:
-            with open(self.intro_file, "r", encoding="utf-8") as file:
-                return json.load(file)
+            return asset_store.get(self.intro_file)
         except FileNotFoundError:
             raise FileNotFoundError(f"找不到初始消息文件 {self.intro_file}!")
-        except json.JSONDecodeError:
+        except ValueError:
             raise ValueError(f"初始消息文件 {self.intro_file} 包含无效的 JSON!")
 
+    def reload_assets(self, rel_path=None):
+        """
+        提示词或初始消息文件被修改后重新加载，并在下次使用时重建提示模板。
+        """
+        try:
+            self.prompt = self.load_prompt()
+            self.intro_messages = self.load_intro() if self.intro_file else []
+        except (FileNotFoundError, ValueError) as e:
+            LOG.error(f"[ChatBot][{self.name}] 重新加载资源失败，继续使用旧版本：{e}")
+            return
+        self._chatbot_with_history = None
+        LOG.info(f"[ChatBot][{self.name}] 已重新加载 {rel_path or '资源'}，提示模板将在下次请求时重建")
+
     def create_chatbot(self):
         """
         初始化聊天机器人，包括系统提示和消息历史记录。
         """
-        # 创建聊天提示模板，包括系统提示和消息占位符
+        # 创建聊天提示模板，包括系统提示和消息占位符。
+        # 系统提示作为固定消息而不是模板传入，保证每轮请求的提示前缀逐字节一致，
+        # 之后只追加历史消息，便于 Ollama 复用已计算的前缀（KV 缓存）。
         system_prompt = ChatPromptTemplate.from_messages([
-            ("system", self.prompt),  # 系统提示部分
+            SystemMessage(content=self.prompt),  # 系统提示部分
             MessagesPlaceholder(variable_name="messages"),  # 消息占位符
         ])
 
-        # 初始化 ChatOllama 模型，配置参数
-        self.chatbot = system_prompt | ChatOllama(
-            model="llama3.1:8b-instruct-q8_0",  # 使用的模型名称
-            max_tokens=8192,  # 最大生成的 token 数
-            temperature=0.8,  # 随机性配置
-        )
+        # 从注册表获取模型客户端，配置相同的代理共享同一个客户端；
+        # 配置了后端池时，每轮请求按会话绑定的后端选择对应地址的客户端
+        llm = self._model_with()
+        self.history_policy.bind(llm, self._model_with)
+
+        # 先按历史消息策略裁剪或压缩历史，再填入提示模板
+        self.chatbot = RunnableLambda(self._apply_history_policy) | system_prompt | llm
 
         # 将聊天机器人与消息历史记录关联
-        self.chatbot_with_history = RunnableWithMessageHistory(self.chatbot, get_session_history)
+        self._chatbot_with_history = AtomicHistoryRunnable(self.chatbot, get_session_history)
+
+    def _model_with(self, **changes):
+        """
+        返回在代理的模型配置上修改部分字段后的模型（例如历史摘要使用较小的 max_tokens）。
+        配置了后端池时返回按每次请求选择后端的可运行对象。
+        """
+        if self.backend_pool is None:
+            return model_registry.get(self.model_config.replace(**changes))
+        return RunnableLambda(lambda prompt, config: self._route_model(prompt, config, **changes))
+
+    def _route_model(self, prompt, config, **changes):
+        """
+        返回本轮请求所用后端对应的模型客户端。后端由 _use_backend 选定并通过配置传入，
+        未指定时（例如历史摘要、后台补齐缓存）选择当前最空闲的后端。
+        """
+        backend_url = config.get("configurable", {}).get("__backend")
+        if backend_url is None:
+            backend_url = self.backend_pool.choose().url
+        return model_registry.get(self.model_config.replace(base_url=backend_url, **changes))
+
+    @contextmanager
+    def _use_backend(self, session_id):
+        """
+        为本轮请求占用后端池中的后端，未配置后端池时返回 None。
+        """
+        if self.backend_pool is None:
+            yield None
+            return
+        with self.backend_pool.use(session_id) as backend:
+            yield backend
+
+    def _apply_history_policy(self, messages, config):
+        """
+        对「历史消息 + 本轮输入」应用历史消息策略，控制每轮送入模型的上下文长度。
+        """
+        session_id = config.get("configurable", {}).get("session_id")
+        HISTORY_LENGTH.observe(len(messages), agent=self.name)
+        return self.history_policy.apply(messages, session_id)
+
+    def _resolve_session_id(self, session_id):
+        """
+        解析实际使用的会话ID。外部传入的会话标识（如浏览器会话）会加上代理名称前缀，
+        保证同一用户在不同代理下的聊天历史互不干扰；未传入时使用实例默认的会话ID。
+        """
+        if session_id is None:
+            return self.session_id
+        return f"{self.name}:{session_id}"
+
+    def _run_config(self, session_id, turn=None, backend=None):
+        """
+        构造调用可运行对象时使用的配置，包括会话ID、本轮的状态标记和选定的后端，同时记录模型的最近使用时间。
+        """
+        model_registry.touch(self.model_config)
+        configurable = {"session_id": session_id}
+        if turn is not None:
+            configurable["__turn"] = turn
+        if backend is not None:
+            configurable["__backend"] = backend.url
+        return {"configurable": configurable}
+
+    def _record_eval_stats(self, session_id, metadata, eval_stats=None):
+        """
+        从 Ollama 响应元数据中提取本轮的提示计算与生成统计，用于观察提示前缀的复用情况。
+        prompt_eval_count 只包含本轮实际计算的提示 token，前缀命中缓存时会明显小于提示总长度。
+        传入 eval_stats 字典时同时写入其中，供并发调用方获取各自这一轮的统计。
+        """
+        stats = extract_eval_stats(metadata)
+        if not stats:
+            return
+        self.last_eval_stats = stats
+        if eval_stats is not None:
+            eval_stats.update(stats)
+        if "prompt_eval_count" in stats:
+            PROMPT_TOKENS.observe(stats["prompt_eval_count"], agent=self.name)
+        if "eval_count" in stats:
+            COMPLETION_TOKENS.observe(stats["eval_count"], agent=self.name)
+        LOG.info(
+            f"[ChatBot][{self.name}][{session_id}] 提示计算 {stats.get('prompt_eval_count', 0)} tokens / "
+            f"{stats.get('prompt_eval_duration', 0.0):.3f}s，生成 {stats.get('eval_count', 0)} tokens / "
+            f"{stats.get('eval_duration', 0.0):.3f}s"
+        )
+
+    def _request_key(self, messages):
+        """
+        计算一次请求（系统提示、消息列表与模型参数）的键，用于回复缓存与预生成的槽位。
+        """
+        return ResponseCache.make_key(self.name, self.prompt, messages, self.model_config)
+
+    def _lookup_cache(self, user_input, session_id):
+        """
+        查询为本会话预生成的回复与开场轮次的回复缓存，命中时直接将本轮问答写入会话历史。
+
+        返回:
+            tuple: (缓存键, 命中的回复, 本轮请求的消息列表)；不适用缓存时缓存键为 None，未命中时回复为 None
+        """
+        if self.response_cache is None and self.prefetcher is None:
+            return None, None, None
+        history = get_session_history(session_id)
+        # 先只看消息条数，确定缓存与预生成都用不上时不再转换历史、计算请求的键
+        message_count = count_messages(history)
+        use_cache = False
+        if self.response_cache is not None and message_count <= self.response_cache.max_opening:
+            history_messages = get_messages(history, 0, message_count)
+            use_cache = self.response_cache.cacheable(history_messages)
+        use_prefetch = self.prefetcher is not None and self.prefetcher.has_slots(session_id)
+        if not use_cache and not use_prefetch:
+            return None, None, None
+        if not use_cache:
+            history_messages = history.messages  # 只转换一次紧凑存储的历史
+        request_messages = history_messages + [HumanMessage(content=user_input)]
+
+        if use_prefetch:
+            # 只有为同一步（相同的历史消息条数）预生成过回复、但上下文不一致时才计为推测失败
+            prefetched = self.prefetcher.take(session_id, self._request_key(request_messages), step=len(history_messages))
+            if prefetched is not None:
+                history.add_messages([HumanMessage(content=user_input), AIMessage(content=prefetched)])
+                PREFETCH_HITS.inc(agent=self.name)
+                LOG.debug(f"[ChatBot][{self.name}] 使用会话 {session_id} 预生成的回复")
+                return None, prefetched, None
+
+        if not use_cache:
+            return None, None, None
+        key = self._request_key(request_messages)
+        cached = self.response_cache.get(key)
+        if cached is not None:
+            history.add_messages([HumanMessage(content=user_input), AIMessage(content=cached)])
+            CACHE_HITS.inc(agent=self.name)
+            LOG.debug(f"[ChatBot][{self.name}] 命中回复缓存 {key[:12]}")
+        return key, cached, request_messages
+
+    def _store_cache(self, key, request_messages, response):
+        """
+        将新生成的回复加入缓存，变体数不足时在后台补齐。
+        """
+        if key is None or not response:
+            return
+        if self.response_cache.add(key, response) > 0:
+            self.response_cache.prefill(key, lambda: self._idle_reply(None, request_messages))
+
+    def _idle_reply(self, session_id, messages, cancelled=None):
+        """
+        用已占用的空闲名额在后台流式生成对 messages 的回复。
+        一旦有实时请求开始排队（或任务被取消），立即关闭发往模型的请求并返回 None，把名额让给实时请求，
+        避免推测或补齐缓存的一次完整生成长时间占用名额。
+        """
+        if self._chatbot_with_history is None:
+            self.create_chatbot()
+        chunks = []
+        with self._use_backend(session_id) as backend:  # 使用会话绑定的后端，之后的请求可以复用其 KV 缓存
+            with closing(self.chatbot.stream(messages, self._run_config(None, backend=backend))) as stream:
+                for chunk in stream:
+                    if model_limiter.waiting or (cancelled is not None and cancelled.is_set()):
+                        return None
+                    chunks.append(chunk.content)
+        return "".join(chunks)
+
+    def _log_stream_latency(self, start_time, first_token_time, chunks):
+        """
+        记录流式生成的首 token 延迟、总耗时以及完整回复。
+        """
+        total_latency = time.perf_counter() - start_time
+        ttft = (first_token_time - start_time) if first_token_time else total_latency
+        TIME_TO_FIRST_TOKEN.observe(ttft, agent=self.name)
+        LOG.info(f"[ChatBot][{self.name}] 首 token 延迟 {ttft:.3f}s，总耗时 {total_latency:.3f}s")
+        LOG.opt(lazy=True).debug("[ChatBot][{}] {}", lambda: self.name, lambda: "".join(chunks))  # 只在调试级别启用时拼接回复
+
+    def _model_stream(self, user_input, session_id):
+        """
+        以流式方式调用带历史的聊天机器人，并应用请求策略：
+        超过截止时间时抛出 ModelTimeoutError；尚未输出任何片段时，连接类错误按指数退避重试。
+        本轮问答只在生成成功结束后写入历史，失败、超时或被取消的轮次不会留下半条历史。
+
+        生成:
+            AIMessageChunk: 模型输出的消息片段
+        """
+        deadline = self.request_policy.deadline(time.monotonic())
+        for attempt in itertools.count():
+            started = False
+            turn = {"aborted": False}
+            try:
+                with self._use_backend(session_id) as backend, closing(self.chatbot_with_history.stream(
+                    [HumanMessage(content=user_input)],  # 将用户输入封装为 HumanMessage
+                    self._run_config(session_id, turn, backend),  # 传入配置，包括会话ID
+                )) as stream:  # 提前结束时关闭流，同时关闭与 Ollama 的连接，停止生成
+                    try:
+                        for chunk in stream:
+                            if deadline is not None and time.monotonic() > deadline:
+                                raise ModelTimeoutError(f"[{self.name}] 生成超过 {self.request_policy.timeout}s")
+                            started = True
+                            yield chunk
+                    except BaseException:
+                        turn["aborted"] = True  # 本轮未完成，不写入历史
+                        raise
+                return
+            except Exception as e:
+                delay = self.request_policy.backoff(attempt)
+                if not self.request_policy.should_retry(e, attempt, started) or (
+                    deadline is not None and time.monotonic() + delay > deadline
+                ):
+                    raise translate_error(e) from e
+                RETRIES.inc(agent=self.name)
+                LOG.warning(f"[ChatBot][{self.name}] 连接模型服务失败（{e}），{delay:.2f}s 后重试")
+                time.sleep(delay)
+
+    async def _amodel_stream(self, user_input, session_id):
+        """
+        _model_stream 的异步版本。截止时间作用于每次等待模型输出，超时或被取消时会中断正在进行的 HTTP 请求。
+
+        生成:
+            AIMessageChunk: 模型输出的消息片段
+        """
+        deadline = self.request_policy.deadline(time.monotonic())
+        for attempt in itertools.count():
+            started = False
+            turn = {"aborted": False}
+            try:
+                with self._use_backend(session_id) as backend:
+                    stream = self.chatbot_with_history.astream(
+                        [HumanMessage(content=user_input)],
+                        self._run_config(session_id, turn, backend),
+                    )
+                    async with aclosing(stream):
+                        try:
+                            while True:
+                                left = None if deadline is None else max(0.0, deadline - time.monotonic())
+                                try:
+                                    # 只限制等待模型的时间，不影响调用方处理片段
+                                    chunk = await asyncio.wait_for(stream.__anext__(), left)
+                                except StopAsyncIteration:
+                                    return
+                                started = True
+                                yield chunk
+                        except BaseException:
+                            turn["aborted"] = True
+                            raise
+            except Exception as e:
+                delay = self.request_policy.backoff(attempt)
+                if not self.request_policy.should_retry(e, attempt, started) or (
+                    deadline is not None and time.monotonic() + delay > deadline
+                ):
+                    raise translate_error(e) from e
+                RETRIES.inc(agent=self.name)
+                LOG.warning(f"[ChatBot][{self.name}] 连接模型服务失败（{e}），{delay:.2f}s 后重试")
+                await asyncio.sleep(delay)
 
     def chat_with_history(self, user_input, session_id=None):
         """
@@ -75,13 +411,166 @@ class AgentBase(ABC):
         返回:
             str: AI 生成的回复
         """
-        if session_id is None:
-            session_id = self.session_id
+        return "".join(self.stream_with_history(user_input, session_id))  # 复用流式调用的截止时间与重试逻辑
 
-        response = self.chatbot_with_history.invoke(
-            [HumanMessage(content=user_input)],  # 将用户输入封装为 HumanMessage
-            {"configurable": {"session_id": session_id}},  # 传入配置，包括会话ID
+    async def achat_with_history(self, user_input, session_id=None):
+        """
+        chat_with_history 的异步版本，等待模型时不阻塞事件循环。
+
+        参数:
+            user_input (str): 用户输入的消息
+            session_id (str, optional): 会话的唯一标识符
+
+        返回:
+            str: AI 生成的回复
+        """
+        return "".join([chunk async for chunk in self.astream_with_history(user_input, session_id)])
+
+    def stream_with_history(self, user_input, session_id=None, eval_stats=None):
+        """
+        以流式方式处理用户输入，在模型生成的同时逐段返回回复内容。
+        完整的回复会在生成结束后由 RunnableWithMessageHistory 一次性写入会话历史。
+
+        参数:
+            user_input (str): 用户输入的消息
+            session_id (str, optional): 会话的唯一标识符
+            eval_stats (dict, optional): 传入字典时，写入本轮的 token 计数与耗时统计
+
+        生成:
+            str: 模型新生成的文本片段
+        """
+        session_id = self._resolve_session_id(session_id)
+        cache_key, cached, request_messages = self._lookup_cache(user_input, session_id)
+        if cached is not None:
+            yield cached  # 命中回复缓存，一次性返回完整回复
+            return
+
+        start_time = time.perf_counter()
+        first_token_time = None
+        chunks = []
+
+        with track_turn(self.name), model_limiter.slot() as queue_wait:  # 占用模型请求名额，排队已满时抛出 OverloadedError
+            QUEUE_WAIT.observe(queue_wait, agent=self.name)
+            with closing(self._model_stream(user_input, session_id)) as stream:
+                for chunk in stream:
+                    if chunk.response_metadata:
+                        self._record_eval_stats(session_id, chunk.response_metadata, eval_stats)  # 最后一个片段携带统计信息
+                    if not chunk.content:
+                        continue
+                    if first_token_time is None:
+                        first_token_time = time.perf_counter()  # 记录首个 token 到达的时间
+                    chunks.append(chunk.content)
+                    yield chunk.content
+
+        self._log_stream_latency(start_time, first_token_time, chunks)
+        self._store_cache(cache_key, request_messages, "".join(chunks))
+
+    async def astream_with_history(self, user_input, session_id=None, eval_stats=None):
+        """
+        stream_with_history 的异步版本，基于 astream 逐段返回回复内容。
+        调用方提前关闭生成器（例如用户关闭页面）或取消任务时，会一并关闭发往 Ollama 的请求。
+
+        参数:
+            user_input (str): 用户输入的消息
+            session_id (str, optional): 会话的唯一标识符
+            eval_stats (dict, optional): 传入字典时，写入本轮的 token 计数与耗时统计
+
+        生成:
+            str: 模型新生成的文本片段
+        """
+        session_id = self._resolve_session_id(session_id)
+        cache_key, cached, request_messages = self._lookup_cache(user_input, session_id)
+        if cached is not None:
+            yield cached  # 命中回复缓存，一次性返回完整回复
+            return
+
+        start_time = time.perf_counter()
+        first_token_time = None
+        chunks = []
+
+        with track_turn(self.name):
+            async with model_limiter.async_slot() as queue_wait:
+                QUEUE_WAIT.observe(queue_wait, agent=self.name)
+                async with aclosing(self._amodel_stream(user_input, session_id)) as stream:
+                    async for chunk in stream:
+                        if chunk.response_metadata:
+                            self._record_eval_stats(session_id, chunk.response_metadata, eval_stats)  # 最后一个片段携带统计信息
+                        if not chunk.content:
+                            continue
+                        if first_token_time is None:
+                            first_token_time = time.perf_counter()
+                        chunks.append(chunk.content)
+                        yield chunk.content
+
+        self._log_stream_latency(start_time, first_token_time, chunks)
+        self._store_cache(cache_key, request_messages, "".join(chunks))
+
+    def get_history_page(self, session_id=None, start=None, limit=None):
+        """
+        读取会话历史中的一段消息，界面据此分页展示，而不是在每轮请求中来回传输完整的聊天记录。
+
+        参数:
+            session_id (str, optional): 会话的唯一标识符
+            start (int, optional): 起始位置，未指定时返回最新的 limit 条消息
+            limit (int, optional): 最多返回的消息数，None 表示读取到最新一条
+
+        返回:
+            tuple: (起始位置, 消息列表)
+        """
+        history = get_session_history(self._resolve_session_id(session_id))
+        total = count_messages(history)
+        if start is None:
+            start = max(0, total - limit) if limit else 0
+        end = total if limit is None else start + limit
+        return start, get_messages(history, start, end)  # 只转换这一页的消息
+
+    def clear_history(self, session_id=None):
+        """
+        清空会话历史。
+
+        参数:
+            session_id (str, optional): 会话的唯一标识符
+        """
+        get_session_history(self._resolve_session_id(session_id)).clear()
+
+    def prefetch_reply(self, session_id, messages):
+        """
+        利用模型的空闲名额，在后台为会话预生成对 messages 的回复；之后以完全相同的上下文发起请求时直接使用。
+        未启用预生成时不做任何事。
+
+        参数:
+            session_id (str): 解析后的会话ID
+            messages (list): 预计的下一次请求的消息列表（历史消息 + 用户输入）
+        """
+        if self.prefetcher is None:
+            return
+
+        self.prefetcher.submit(
+            session_id,
+            self._request_key(messages),
+            lambda cancelled: self._idle_reply(session_id, messages, cancelled),  # 会话结束或有实时请求排队时放弃
+            step=len(messages) - 1,
         )
 
-        LOG.debug(f"[ChatBot][{self.name}] {response.content}")  # 记录调试日志
-        return response.content  # 返回生成的回复内容
+    def prewarm(self, session_id, messages):
+        """
+        利用模型的空闲名额，在后台用 messages 发送一次只生成 1 个 token 的请求，
+        让 Ollama 提前计算「系统提示 + messages」的 KV 缓存，之后以此为前缀的请求只需计算新增的部分。
+        未启用预生成时不做任何事。
+
+        参数:
+            session_id (str): 解析后的会话ID
+            messages (list): 预计的下一次请求的前缀消息
+        """
+        if self.prefetcher is None:
+            return
+
+        def warm(cancelled):
+            probe = self.model_config.replace(max_tokens=1)
+            with self._use_backend(session_id) as backend:
+                if backend is not None:
+                    probe = probe.replace(base_url=backend.url)
+                model_registry.get(probe).invoke([SystemMessage(content=self.prompt)] + messages)
+            return None
+
+        self.prefetcher.submit(session_id, "warm:" + self._request_key(messages), warm)
@@ -0,0 +1,121 @@
+import asyncio
+import time
+from contextlib import contextmanager
+
+import httpx
+
+from .backend_pool import backend_pool  # 导入多后端的后端池
+from .concurrency import OverloadedError, model_limiter  # 导入模型请求限流器
+from .prefetch import default_prefetcher  # 导入预生成器
+from .response_cache import default_response_cache  # 导入回复缓存
+from .session_history import session_manager  # 导入会话管理器
+from utils.metrics import metrics  # 导入全局指标注册表
+
+# 代理每一轮对话的指标，均以代理名称（agent）为标签
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+MESSAGE_BUCKETS = (0, 2, 4, 8, 16, 32, 64, 128, 256)
+
+QUEUE_WAIT = metrics.histogram("lm_queue_wait_seconds", "请求在模型限流队列中等待的时间", ("agent",))
+TIME_TO_FIRST_TOKEN = metrics.histogram("lm_time_to_first_token_seconds", "流式生成的首 token 延迟", ("agent",))
+GENERATION_TIME = metrics.histogram("lm_generation_seconds", "一轮对话从开始到生成结束的总耗时", ("agent",))
+PROMPT_TOKENS = metrics.histogram("lm_prompt_tokens", "每轮实际计算的提示 token 数", ("agent",), TOKEN_BUCKETS)
+COMPLETION_TOKENS = metrics.histogram("lm_completion_tokens", "每轮生成的 token 数", ("agent",), TOKEN_BUCKETS)
+HISTORY_LENGTH = metrics.histogram("lm_history_messages", "每轮送入历史策略的消息数（含本轮输入）", ("agent",), MESSAGE_BUCKETS)
+SESSION_START_TIME = metrics.histogram("lm_session_start_seconds", "开始或重置会话的耗时", ("agent",))
+
+TURNS = metrics.counter("lm_turns_total", "完成的对话轮数", ("agent",))
+CACHE_HITS = metrics.counter("lm_response_cache_hits_total", "命中回复缓存的对话轮数", ("agent",))
+PREFETCH_HITS = metrics.counter("lm_prefetch_hits_total", "直接使用预生成回复的对话轮数", ("agent",))
+ERRORS = metrics.counter("lm_errors_total", "对话轮次中发生的错误数", ("agent", "type"))
+TIMEOUTS = metrics.counter("lm_timeouts_total", "模型请求超时的次数", ("agent",))
+OVERLOADED = metrics.counter("lm_overloaded_total", "因排队已满或排队超时而被拒绝的请求数", ("agent",))
+CANCELLED = metrics.counter("lm_cancelled_total", "客户端断开等原因被取消的对话轮数", ("agent",))
+RETRIES = metrics.counter("lm_retries_total", "连接模型服务失败后的重试次数", ("agent",))
+
+# 共享组件的当前状态，在导出时读取
+metrics.gauge("lm_model_in_flight", "正在进行的模型请求数", lambda: model_limiter.in_flight)
+metrics.gauge("lm_model_queue_length", "在限流队列中等待的请求数", lambda: model_limiter.waiting)
+metrics.counter_func("lm_model_rejected_total", "被限流器拒绝的请求累计数", lambda: model_limiter.rejected)
+metrics.gauge(
+    "lm_session_store",
+    "会话存储的统计信息",
+    lambda: {(key,): value for key, value in session_manager.stats().items()},
+    ("stat",),
+)
+if default_response_cache is not None:
+    metrics.gauge(
+        "lm_response_cache",
+        "回复缓存的统计信息",
+        lambda: {(key,): value for key, value in default_response_cache.stats().items()},
+        ("stat",),
+    )
+if default_prefetcher is not None:
+    metrics.gauge(
+        "lm_prefetch",
+        "推测式预生成的统计信息",
+        lambda: {(key,): value for key, value in default_prefetcher.stats().items()},
+        ("stat",),
+    )
+if backend_pool is not None:
+    metrics.gauge(
+        "lm_backend_outstanding",
+        "各个 Ollama 后端正在进行的请求数",
+        lambda: {(url,): stats["outstanding"] for url, stats in backend_pool.stats().items()},
+        ("backend",),
+    )
+    metrics.gauge(
+        "lm_backend_healthy",
+        "各个 Ollama 后端是否健康（1 为健康）",
+        lambda: {(url,): int(stats["healthy"]) for url, stats in backend_pool.stats().items()},
+        ("backend",),
+    )
+    metrics.gauge(
+        "lm_backend_sessions",
+        "绑定到各个 Ollama 后端的会话数",
+        lambda: {(url,): stats["sessions"] for url, stats in backend_pool.stats().items()},
+        ("backend",),
+    )
+
+
+def record_failure(agent, error):
+    """
+    按异常类型记录失败的对话轮次：过载、超时、取消或其他错误。
+    """
+    if isinstance(error, OverloadedError):
+        OVERLOADED.inc(agent=agent)
+    elif isinstance(error, (TimeoutError, asyncio.TimeoutError, httpx.TimeoutException)):
+        TIMEOUTS.inc(agent=agent)
+    elif isinstance(error, (GeneratorExit, asyncio.CancelledError)):
+        CANCELLED.inc(agent=agent)
+    else:
+        ERRORS.inc(agent=agent, type=type(error).__name__)
+
+
+@contextmanager
+def track_turn(agent):
+    """
+    记录一轮对话的总耗时与结果，失败时按类型计数后继续抛出异常。
+    也可用于包裹生成器的整个迭代过程。
+    """
+    start_time = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        record_failure(agent, e)
+        raise
+    GENERATION_TIME.observe(time.perf_counter() - start_time, agent=agent)
+    TURNS.inc(agent=agent)
+
+
+@contextmanager
+def track_session_start(agent):
+    """
+    记录开始或重置会话的耗时。
+    """
+    start_time = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        record_failure(agent, e)
+        raise
+    SESSION_START_TIME.observe(time.perf_counter() - start_time, agent=agent)
@@ -0,0 +1,200 @@
+import asyncio
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import httpx
+
+from .resilience import TRANSIENT_ERRORS, ModelUnavailableError  # 导入可重试的连接错误
+from utils.config import env_float, env_int, env_str  # 导入环境变量配置工具
+from utils.logger import LOG  # 导入日志工具
+
+
+class Backend:
+    """
+    单个 Ollama 后端的状态。
+    """
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self.healthy = True
+        self.outstanding = 0  # 正在进行的请求数
+        self.failures = 0  # 连续失败次数
+        self.down_until = 0.0  # 被摘除后，在该时间（time.monotonic）之前不再分配新请求
+        self.requests = 0
+        self.errors = 0
+
+    def available(self, now):
+        return self.healthy or now >= self.down_until
+
+
+class BackendPool:
+    """
+    多个 Ollama 后端组成的后端池。
+    新会话分配给正在进行的请求数最少的健康后端，之后同一会话固定使用该后端，复用其中的提示前缀与 KV 缓存。
+    后端连续失败达到阈值或健康检查失败时被摘除，其上的会话在下一轮自动转移到其他后端；
+    摘除的后端在冷却时间后或健康检查恢复后重新加入。
+    """
+    def __init__(self, urls, failure_threshold=2, cooldown=30.0, health_interval=10.0, max_sticky=10000):
+        if not urls:
+            raise ValueError("后端池至少需要一个 Ollama 地址!")
+        self.backends = [Backend(url) for url in urls]
+        self.failure_threshold = failure_threshold  # 连续失败多少次后摘除后端
+        self.cooldown = cooldown  # 被动摘除后，再次尝试该后端前等待的时间（秒）
+        self.health_interval = health_interval  # 健康检查间隔（秒），0 表示不做主动检查
+        self.max_sticky = max_sticky  # 最多记录的会话与后端的绑定数
+        self._sticky = OrderedDict()  # session_id -> Backend，按最近使用排列
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_env(cls):
+        """
+        根据环境变量创建后端池：LM_OLLAMA_BACKENDS 为逗号分隔的 Ollama 地址列表，未设置时返回 None（使用单个后端）。
+        LM_BACKEND_FAILURE_THRESHOLD、LM_BACKEND_COOLDOWN、LM_BACKEND_HEALTH_INTERVAL 控制摘除与恢复。
+        """
+        urls = [url.strip() for url in env_str("LM_OLLAMA_BACKENDS", "").split(",") if url.strip()]
+        if not urls:
+            return None
+        return cls(
+            urls,
+            failure_threshold=max(1, env_int("LM_BACKEND_FAILURE_THRESHOLD", 2)),
+            cooldown=env_float("LM_BACKEND_COOLDOWN", 30.0),
+            health_interval=env_float("LM_BACKEND_HEALTH_INTERVAL", 10.0),
+        )
+
+    def choose(self, session_id=None):
+        """
+        为会话选择后端：优先使用会话已绑定且可用的后端，否则选择正在进行的请求数最少的可用后端并绑定。
+
+        返回:
+            Backend: 选中的后端
+
+        异常:
+            ModelUnavailableError: 没有可用的后端
+        """
+        now = time.monotonic()
+        with self._lock:
+            if session_id is not None:
+                backend = self._sticky.get(session_id)
+                if backend is not None and backend.available(now):
+                    self._sticky.move_to_end(session_id)
+                    return backend
+
+            candidates = [b for b in self.backends if b.available(now)]
+            if not candidates:
+                raise ModelUnavailableError("没有可用的 Ollama 后端")
+            least = min(b.outstanding for b in candidates)
+            backend = random.choice([b for b in candidates if b.outstanding == least])
+
+            if session_id is not None:
+                self._sticky[session_id] = backend
+                self._sticky.move_to_end(session_id)
+                while len(self._sticky) > self.max_sticky:
+                    self._sticky.popitem(last=False)
+            return backend
+
+    @contextmanager
+    def use(self, session_id=None):
+        """
+        为一次请求占用后端，记录正在进行的请求数与请求结果。
+
+        生成:
+            Backend: 本次请求使用的后端
+        """
+        backend = self.choose(session_id)
+        with self._lock:
+            backend.outstanding += 1
+            backend.requests += 1
+        try:
+            yield backend
+        except Exception as e:
+            if isinstance(e, TRANSIENT_ERRORS) or isinstance(e, (TimeoutError, asyncio.TimeoutError, httpx.TimeoutException)):
+                self.mark_failure(backend, e)
+            raise
+        else:
+            self.mark_success(backend)
+        finally:
+            with self._lock:
+                backend.outstanding -= 1
+
+    def mark_success(self, backend):
+        with self._lock:
+            backend.failures = 0
+            if not backend.healthy:
+                backend.healthy = True
+                LOG.info(f"[BackendPool] 后端 {backend.url} 已恢复")
+
+    def mark_failure(self, backend, error):
+        """
+        记录后端的一次失败，连续失败达到阈值时摘除该后端，并解除其上所有会话的绑定。
+        """
+        with self._lock:
+            backend.failures += 1
+            backend.errors += 1
+            if backend.failures < self.failure_threshold:
+                return
+            drained = backend.healthy
+            backend.healthy = False
+            backend.down_until = time.monotonic() + self.cooldown
+            for session_id in [sid for sid, b in self._sticky.items() if b is backend]:
+                del self._sticky[session_id]
+        if drained:
+            LOG.warning(f"[BackendPool] 后端 {backend.url} 连续失败 {backend.failures} 次，已摘除：{error}")
+
+    def check_health(self, timeout=5.0):
+        """
+        对所有后端发送一次健康检查（GET /api/tags）。
+        """
+        for backend in self.backends:
+            try:
+                httpx.get(f"{backend.url}/api/tags", timeout=timeout).raise_for_status()
+            except Exception as e:
+                backend.failures = max(backend.failures, self.failure_threshold - 1)
+                self.mark_failure(backend, e)
+            else:
+                self.mark_success(backend)
+
+    def _health_loop(self):
+        while not self._stop.wait(self.health_interval):
+            try:
+                self.check_health()
+            except Exception as e:
+                LOG.error(f"[BackendPool] 健康检查失败：{e}")
+
+    def start_health_checks(self):
+        """
+        启动后台线程，定期检查各个后端的健康状态。
+        """
+        if self.health_interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._health_loop, name="backend-health", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        """
+        返回各个后端的状态。
+        """
+        with self._lock:
+            sticky = {}
+            for backend in self._sticky.values():
+                sticky[backend.url] = sticky.get(backend.url, 0) + 1
+            return {
+                backend.url: {
+                    "healthy": backend.healthy,
+                    "outstanding": backend.outstanding,
+                    "requests": backend.requests,
+                    "errors": backend.errors,
+                    "sessions": sticky.get(backend.url, 0),
+                }
+                for backend in self.backends
+            }
+
+
+# 全局后端池，未配置 LM_OLLAMA_BACKENDS 时为 None
+backend_pool = BackendPool.from_env()
@@ -0,0 +1,166 @@
+import sys
+import threading
+
+from langchain_core.chat_history import BaseChatMessageHistory  # 基础聊天消息历史类
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage  # 导入消息类
+
+# 紧凑存储的消息角色编码；其他类型或带有附加字段（例如工具调用）的消息按原对象保存
+HUMAN, AI, SYSTEM, OTHER = 0, 1, 2, 3
+_CLASSES = {HUMAN: HumanMessage, AI: AIMessage, SYSTEM: SystemMessage}
+
+
+def _role(message):
+    # 按类型判断角色：流式生成的回复以 AIMessageChunk（AIMessage 的子类）写入历史，其 type 不是 "ai"
+    for code, cls in _CLASSES.items():
+        if isinstance(message, cls):
+            return code
+    return OTHER
+
+
+def _encode(message):
+    """
+    返回消息的 (角色编码, 保存的内容)。普通的文本消息只保存文本，丢弃 id、response_metadata、
+    usage_metadata 等元数据——它们不会再被发送给模型；其他消息保存原对象。
+    """
+    code = _role(message)
+    if (
+        code == OTHER
+        or not isinstance(message.content, str)
+        or message.additional_kwargs
+        or message.name
+        or getattr(message, "tool_calls", None)
+        or getattr(message, "invalid_tool_calls", None)
+        or getattr(message, "tool_call_chunks", None)
+    ):
+        return OTHER, message
+    return code, message.content
+
+
+def _decode(code, value):
+    # 内容在写入时已经过校验，转换时跳过 pydantic 校验，速度约快一倍
+    return value if code == OTHER else _CLASSES[code].construct(content=value)
+
+
+def _sizeof(code, value):
+    if code == OTHER:
+        return sys.getsizeof(value) + sys.getsizeof(value.__dict__) + sys.getsizeof(value.content)
+    return sys.getsizeof(value)
+
+
+class MessageLog:
+    """
+    紧凑的消息记录：用一个字节数组保存每条消息的角色，用一个列表保存文本内容。
+    每条消息只占一个字节加一个列表槽位，而不是一个 pydantic 消息对象及其属性字典；
+    文本直接引用传入的字符串，不做复制，因此同一个开场白或缓存回复在所有会话中只保存一份。
+    """
+    __slots__ = ("roles", "contents", "content_bytes")
+
+    def __init__(self, messages=()):
+        self.roles = bytearray()
+        self.contents = []
+        self.content_bytes = 0  # 文本内容（以及按原对象保存的消息）占用的字节数，增量维护
+        self.extend(messages)
+
+    def extend(self, messages):
+        for message in messages:
+            code, value = _encode(message)
+            self.roles.append(code)
+            self.contents.append(value)
+            self.content_bytes += _sizeof(code, value)
+
+    def clear(self):
+        self.roles = bytearray()
+        self.contents = []
+        self.content_bytes = 0
+
+    def __len__(self):
+        return len(self.roles)
+
+    def to_messages(self, start=None, stop=None):
+        """
+        将 [start, stop) 范围内的记录转换为 LangChain 消息列表，每次调用都返回新的列表。
+        """
+        indices = range(len(self.roles))[start:stop]
+        return [_decode(self.roles[i], self.contents[i]) for i in indices]
+
+    def nbytes(self):
+        """
+        估算占用的内存（字节）：两个容器本身加上文本内容。被多个会话共享的文本在每个会话中都会计入。
+        """
+        return sys.getsizeof(self.roles) + sys.getsizeof(self.contents) + self.content_bytes
+
+
+class CompactChatMessageHistory(BaseChatMessageHistory):
+    """
+    以 MessageLog 保存消息的聊天历史，兼容 BaseChatMessageHistory。
+    读取 messages 时才转换为 LangChain 消息（每轮对话构建提示时一次）；
+    只需要消息数或部分消息时使用 message_count、get_messages，避免转换整段历史。
+    """
+    def __init__(self, messages=()):
+        self._log = MessageLog(messages)
+        self._lock = threading.Lock()
+
+    @property
+    def log(self):
+        return self._log
+
+    @property
+    def messages(self):
+        with self._lock:
+            return self.log.to_messages()
+
+    def add_messages(self, messages):
+        with self._lock:
+            self.log.extend(messages)
+
+    def clear(self):
+        with self._lock:
+            self.log.clear()
+
+    def message_count(self):
+        return len(self.log)
+
+    def get_messages(self, start=None, stop=None):
+        with self._lock:
+            return self.log.to_messages(start, stop)
+
+    def memory_usage(self):
+        """
+        返回 (消息数, 估算占用的字节数)。
+        """
+        log = self._log  # 只统计内存中已有的内容，不触发加载
+        return len(log), log.nbytes()
+
+    def __str__(self):
+        return "\n".join(m.pretty_repr() for m in self.messages)
+
+
+def count_messages(history):
+    """
+    返回会话历史中的消息数，紧凑存储的历史无需转换消息。
+    """
+    if isinstance(history, CompactChatMessageHistory):
+        return history.message_count()
+    return len(history.messages)
+
+
+def get_messages(history, start=None, stop=None):
+    """
+    返回会话历史中 [start, stop) 范围内的消息，紧凑存储的历史只转换这一段。
+    """
+    if isinstance(history, CompactChatMessageHistory):
+        return history.get_messages(start, stop)
+    return history.messages[start:stop]
+
+
+def memory_usage(history):
+    """
+    估算会话历史占用的内存，返回 (消息数, 字节数)。其他类型的历史按消息对象、属性字典与文本内容估算。
+    """
+    if isinstance(history, CompactChatMessageHistory):
+        return history.memory_usage()
+    messages = history.messages
+    approx_bytes = sys.getsizeof(history) + sum(
+        sys.getsizeof(m) + sys.getsizeof(m.__dict__) + sys.getsizeof(m.content) for m in messages
+    )
+    return len(messages), approx_bytes
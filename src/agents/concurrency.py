@@ -0,0 +1,178 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+from utils.config import env_float, env_int, env_str  # 导入环境变量配置工具
+from utils.workers import worker_share  # 多进程模式下每个工作进程分得的名额
+
+
+# 过载时展示给用户的提示语
+OVERLOADED_MESSAGE = "当前练习的同学较多，老师有点忙不过来，请稍后再试。"
+
+
+class OverloadedError(RuntimeError):
+    """
+    等待队列已满或排队超时时抛出，调用方应提示用户稍后再试。
+    """
+
+
+class _Waiter:
+    """
+    排队中的请求。状态只在限流器的锁内修改：waiting -> granted / abandoned。
+    """
+    __slots__ = ("state", "_event", "_loop", "_future")
+
+    def __init__(self, loop=None):
+        self.state = "waiting"
+        self._loop = loop
+        if loop is None:
+            self._event = threading.Event()  # 同步调用方在线程中等待
+            self._future = None
+        else:
+            self._event = None
+            self._future = loop.create_future()  # 异步调用方在事件循环中等待
+
+    def grant(self):
+        """
+        将名额直接移交给该等待者（需持有限流器的锁）。
+        """
+        self.state = "granted"
+        if self._event is not None:
+            self._event.set()
+        else:
+            self._loop.call_soon_threadsafe(self._wake_future)
+
+    def _wake_future(self):
+        if not self._future.done():
+            self._future.set_result(True)
+
+
+class ConcurrencyLimiter:
+    """
+    限制同时发往模型后端的请求数量，超出的请求进入有界的先进先出等待队列。
+    同步调用（Gradio 工作线程）与异步调用（事件循环）共享同一组名额。
+    """
+    def __init__(self, max_concurrency=4, max_queue=32, queue_timeout=60.0):
+        self.max_concurrency = max_concurrency  # 同时进行的生成数上限
+        self.max_queue = max_queue  # 排队请求数上限，超过后直接拒绝
+        self.queue_timeout = queue_timeout  # 排队等待的最长时间（秒），None 表示不限
+        self._lock = threading.Lock()
+        self._waiters = deque()
+        self.in_flight = 0  # 正在进行的请求数
+        self.rejected = 0  # 因过载被拒绝的请求数
+
+    @classmethod
+    def from_env(cls):
+        """
+        根据环境变量创建限流器：LM_MAX_CONCURRENCY、LM_MAX_QUEUE、LM_QUEUE_TIMEOUT。
+        LM_MAX_CONCURRENCY 是单个 Ollama 后端的并行能力，配置了多个后端（LM_OLLAMA_BACKENDS）时按后端数放大；
+        多进程模式下由各工作进程平分。
+        """
+        queue_timeout = env_float("LM_QUEUE_TIMEOUT", 60.0)
+        backends = max(1, len([url for url in env_str("LM_OLLAMA_BACKENDS", "").split(",") if url.strip()]))
+        return cls(
+            max_concurrency=worker_share(max(1, env_int("LM_MAX_CONCURRENCY", 4)) * backends),
+            max_queue=worker_share(max(0, env_int("LM_MAX_QUEUE", 32))),
+            queue_timeout=queue_timeout if queue_timeout > 0 else None,
+        )
+
+    @property
+    def waiting(self):
+        """
+        当前排队中的请求数。
+        """
+        return len(self._waiters)
+
+    def _acquire_or_enqueue(self, waiter):
+        """
+        有空闲名额时立即占用并返回 True，否则将等待者加入队列并返回 False。
+        """
+        with self._lock:
+            if self.in_flight < self.max_concurrency and not self._waiters:
+                self.in_flight += 1
+                return True
+            if len(self._waiters) >= self.max_queue:
+                self.rejected += 1
+                raise OverloadedError("模型请求排队已满，请稍后再试。")
+            self._waiters.append(waiter)
+            return False
+
+    def _abandon(self, waiter):
+        """
+        放弃排队。若名额已在此之前移交给该等待者，则返回 True，由调用方继续使用或归还。
+        """
+        with self._lock:
+            if waiter.state == "granted":
+                return True
+            waiter.state = "abandoned"
+            self._waiters.remove(waiter)
+            return False
+
+    def release(self):
+        """
+        归还名额；若有排队的请求，则直接移交给队首的等待者。
+        """
+        with self._lock:
+            if self._waiters:
+                self._waiters.popleft().grant()
+            else:
+                self.in_flight -= 1
+
+    def try_acquire(self):
+        """
+        非阻塞地尝试占用一个名额，仅在没有请求排队时成功。成功后需调用 release 归还。
+        """
+        with self._lock:
+            if self.in_flight < self.max_concurrency and not self._waiters:
+                self.in_flight += 1
+                return True
+            return False
+
+    @contextmanager
+    def slot(self):
+        """
+        同步占用一个名额，供工作线程中的调用使用。
+
+        生成:
+            float: 在队列中等待的时间（秒）
+        """
+        start_time = time.perf_counter()
+        waiter = _Waiter()
+        if not self._acquire_or_enqueue(waiter):
+            if not waiter._event.wait(self.queue_timeout) and not self._abandon(waiter):
+                raise OverloadedError("模型请求排队超时，请稍后再试。")
+        try:
+            yield time.perf_counter() - start_time
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def async_slot(self):
+        """
+        异步占用一个名额，等待期间不会阻塞事件循环。
+
+        生成:
+            float: 在队列中等待的时间（秒）
+        """
+        start_time = time.perf_counter()
+        waiter = _Waiter(asyncio.get_running_loop())
+        if not self._acquire_or_enqueue(waiter):
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter._future), self.queue_timeout)
+            except asyncio.TimeoutError:
+                if not self._abandon(waiter):
+                    raise OverloadedError("模型请求排队超时，请稍后再试。")
+            except asyncio.CancelledError:
+                if self._abandon(waiter):
+                    self.release()  # 名额已移交但请求被取消，立即归还
+                raise
+        try:
+            yield time.perf_counter() - start_time
+        finally:
+            self.release()
+
+
+# 所有代理共享的模型请求限流器，对应单个 Ollama 后端的并行能力
+model_limiter = ConcurrencyLimiter.from_env()
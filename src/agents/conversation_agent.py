@@ -8,9 +8,10 @@ class ConversationAgent(AgentBase):
     """
     对话代理类，负责处理与用户的对话。
     """
-    def __init__(self, session_id=None):
+    def __init__(self, session_id=None, **kwargs):
         super().__init__(
             name="conversation",
             prompt_file="prompts/conversation_prompt.txt",
-            session_id=session_id
+            session_id=session_id,
+            **kwargs  # 其他配置，例如 history_policy、model_config
         )
@@ -0,0 +1,259 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from langchain_core.messages import HumanMessage, SystemMessage  # 导入消息类
+
+from .concurrency import model_limiter  # 导入模型请求限流器
+from utils.config import env_int, env_str  # 导入环境变量配置工具
+from utils.logger import LOG  # 导入日志工具
+
+
+@lru_cache(maxsize=8192)
+def estimate_tokens(text):
+    """
+    粗略估算文本的 token 数：英文约 4 个字符一个 token，中文约一个字一个 token。
+    结果按文本缓存，历史消息在多轮对话中只需计算一次。
+
+    参数:
+        text (str): 待估算的文本
+
+    返回:
+        int: 估算的 token 数（包含每条消息约 4 个 token 的固定开销）
+    """
+    cjk = sum(1 for ch in text if "\u4e00" <= ch <= "\u9fff")
+    return (len(text) - cjk) // 4 + cjk + 4
+
+
+def message_tokens(message, token_counter=estimate_tokens):
+    """
+    估算单条消息的 token 数。
+    """
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    return token_counter(content)
+
+
+class HistoryPolicy:
+    """
+    历史消息策略基类：在提示模板之前对「历史消息 + 本轮输入」进行裁剪或压缩。
+    默认保留全部消息。
+    """
+    def bind(self, llm, model_factory=None):
+        """
+        绑定代理使用的模型，需要调用模型的策略（如滚动摘要）可以重写此方法。
+
+        参数:
+            llm: 代理生成回复使用的模型
+            model_factory (callable, optional): 接收 ModelConfig 的字段修改（例如 max_tokens=256），
+                返回在代理模型配置基础上修改后的模型
+        """
+
+    def apply(self, messages, session_id=None):
+        """
+        返回实际送入提示模板的消息列表。最后一条消息为本轮用户输入，必须保留。
+
+        参数:
+            messages (list): 历史消息加上本轮输入
+            session_id (str, optional): 会话的唯一标识符
+
+        返回:
+            list: 处理后的消息列表
+        """
+        return messages
+
+
+class _SessionCursor:
+    """
+    按会话记录「已从窗口前端移出的消息数」及附加状态。
+    保存时同时记录最后一条被移出消息的内容作为锚点，会话历史被清空或替换后自动从头开始。
+    """
+    def __init__(self, max_sessions=1000):
+        self.max_sessions = max_sessions
+        self._states = OrderedDict()  # session_id -> (移出的消息数, 锚点内容, 附加状态)
+        self._lock = threading.Lock()
+
+    def get(self, session_id, messages, default=None):
+        with self._lock:
+            state = self._states.get(session_id)
+            if state is not None:
+                self._states.move_to_end(session_id)
+        if state is None:
+            return 0, default
+        count, anchor, extra = state
+        if count >= len(messages) or messages[count - 1].content != anchor:
+            return 0, default
+        return count, extra
+
+    def set(self, session_id, count, messages, extra=None):
+        if session_id is None or count <= 0:
+            return
+        with self._lock:
+            self._states[session_id] = (count, messages[count - 1].content, extra)
+            self._states.move_to_end(session_id)
+            while len(self._states) > self.max_sessions:
+                self._states.popitem(last=False)
+
+
+def _pinned(messages, pin_first):
+    """
+    返回需要始终保留在窗口最前面的消息数：pin_first 时保留会话的第一条消息（本轮输入除外）。
+    """
+    return 1 if pin_first and len(messages) > 1 else 0
+
+
+class LastTurnsPolicy(HistoryPolicy):
+    """
+    只保留最近 N 轮对话（一问一答为一轮）。
+    窗口每累计 step 轮才整体前移一次，期间保留的消息只追加不变化，便于后端复用已计算的提示前缀。
+    pin_first 时会话的第一条消息（例如列出本关单词的开场消息）始终保留在窗口最前面。
+    """
+    def __init__(self, max_turns=10, step=4, pin_first=False):
+        self.max_turns = max_turns
+        self.step = max(1, step)
+        self.pin_first = pin_first
+
+    def apply(self, messages, session_id=None):
+        overflow = len(messages) - 1 - self.max_turns * 2  # 本轮输入之外超出 2N 条的历史消息数
+        if overflow <= 0:
+            return messages
+        cut = overflow // (self.step * 2) * (self.step * 2)
+        pinned = _pinned(messages, self.pin_first)
+        if cut < pinned:
+            return messages
+        return messages[:pinned] + messages[cut:]
+
+
+class TokenBudgetPolicy(HistoryPolicy):
+    """
+    按 token 预算从最新的消息开始向前保留，超出预算的较早消息被丢弃。
+    超出预算时一次性裁剪到预算的 low_watermark 比例以下，之后窗口只追加不裁剪，
+    直到再次超出预算，从而让提示前缀在多轮之间保持稳定。
+    pin_first 时会话的第一条消息始终保留在窗口最前面，并计入预算。
+    """
+    def __init__(self, max_tokens=3072, token_counter=estimate_tokens, low_watermark=0.7, max_sessions=1000,
+                 pin_first=False):
+        self.max_tokens = max_tokens
+        self.token_counter = token_counter
+        self.low_watermark = low_watermark
+        self.pin_first = pin_first
+        self._cursor = _SessionCursor(max_sessions)
+
+    def apply(self, messages, session_id=None):
+        pinned = _pinned(messages, self.pin_first)
+        cut, _ = self._cursor.get(session_id, messages)
+        cut = max(cut, pinned)
+        head = messages[:pinned]
+        tokens = [message_tokens(m, self.token_counter) for m in messages[cut:]]
+        total = sum(tokens) + sum(message_tokens(m, self.token_counter) for m in head)
+        if total <= self.max_tokens:
+            return head + messages[cut:]
+
+        # 从窗口前端移出消息，直到低于低水位；本轮输入始终保留
+        target = self.max_tokens * self.low_watermark
+        dropped = 0
+        while total > target and dropped < len(tokens) - 1:
+            total -= tokens[dropped]
+            dropped += 1
+        cut += dropped
+        self._cursor.set(session_id, cut, messages)
+        return head + messages[cut:]
+
+
+class SummaryPolicy(HistoryPolicy):
+    """
+    保留最近 N 轮对话原文，将更早的对话压缩为一段滚动摘要。
+    摘要按会话增量更新：每次只把新移出窗口的消息与已有摘要合并，并且每累计若干轮才更新一次，
+    避免每轮都额外调用模型。pin_first 时会话的第一条消息不参与摘要，始终按原文保留在窗口最前面。
+
+    摘要在后台线程中生成，使用最多生成 max_summary_tokens 个 token 的单独模型配置，不占用学习者本轮的等待时间；
+    摘要完成前，本轮及之后的几轮继续以原文发送尚未摘要的消息，完成后从下一轮开始使用新的摘要。
+    """
+    summary_prompt = (
+        "You are summarizing an English tutoring session between a student and the teacher DjangoPeng. "
+        "Update the running summary with the new messages. Keep the scenario, the student's level, "
+        "the words or sentences practised and any mistakes worth revisiting. Reply with the summary only.\n\n"
+        "Current summary:\n{summary}\n\nNew messages:\n{messages}"
+    )
+
+    def __init__(self, llm=None, keep_turns=6, summarize_every=4, max_sessions=1000, pin_first=False,
+                 max_summary_tokens=256):
+        self.llm = llm  # 用于生成摘要的模型，未指定时使用代理模型配置的副本（限制生成的 token 数）
+        self.keep_turns = keep_turns  # 保留原文的最近轮数
+        self.summarize_every = summarize_every  # 每累计多少轮移出窗口的对话才更新一次摘要
+        self.pin_first = pin_first
+        self.max_summary_tokens = max_summary_tokens  # 摘要最多生成的 token 数
+        self._cursor = _SessionCursor(max_sessions)  # 每个会话已摘要的消息数及摘要内容
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-summary")
+        self._pending = set()  # 正在后台更新摘要的会话
+        self._pending_lock = threading.Lock()
+
+    def bind(self, llm, model_factory=None):
+        if self.llm is None:
+            self.llm = model_factory(max_tokens=self.max_summary_tokens) if model_factory is not None else llm
+
+    def _summarize(self, summary, messages):
+        """
+        调用模型，把新移出窗口的消息合并进已有摘要。
+        """
+        transcript = "\n".join(
+            f"{'Student' if isinstance(m, HumanMessage) else 'Teacher'}: {m.content}" for m in messages
+        )
+        prompt = self.summary_prompt.format(summary=summary or "(empty)", messages=transcript)
+        return self.llm.invoke([HumanMessage(content=prompt)]).content.strip()
+
+    def _update(self, session_id, summary, messages, start, stop):
+        """
+        在后台把 messages[start:stop] 合并进摘要，完成后记录到会话的游标中，下一轮起生效。
+        """
+        try:
+            with model_limiter.slot():  # 与学习者的请求共用模型名额
+                summary = self._summarize(summary, messages[start:stop])
+            self._cursor.set(session_id, stop, messages, summary)
+            LOG.debug(f"[SummaryPolicy][{session_id}] 已摘要 {stop} 条消息")
+        except Exception as e:
+            LOG.warning(f"[SummaryPolicy][{session_id}] 更新摘要失败：{e}")
+        finally:
+            with self._pending_lock:
+                self._pending.discard(session_id)
+
+    def apply(self, messages, session_id=None):
+        pinned = _pinned(messages, self.pin_first)
+        head = messages[:pinned]
+        count, summary = self._cursor.get(session_id, messages, default="")
+        count = max(count, pinned)
+        window_start = max(count, len(messages) - (self.keep_turns * 2 + 1))
+
+        # 移出窗口的消息累计到一定轮数后，再在后台批量合并进摘要；同一会话同时只有一个更新任务
+        if window_start - count >= self.summarize_every * 2 and self.llm is not None and session_id is not None:
+            with self._pending_lock:
+                submit = session_id not in self._pending
+                self._pending.add(session_id)
+            if submit:
+                self._executor.submit(self._update, session_id, summary, list(messages), count, window_start)
+
+        if not summary:
+            return head + messages[count:]
+        return head + [SystemMessage(content=f"Summary of the earlier conversation:\n{summary}")] + messages[count:]
+
+
+def create_history_policy(name=None, pin_first=False):
+    """
+    根据名称创建历史消息策略，未指定时读取环境变量 LM_HISTORY_POLICY（默认 token_budget）。
+    可选值：all、last_turns、token_budget、summary。
+    pin_first 为 True 时，裁剪或摘要历史时始终保留会话的第一条消息。
+    """
+    name = name or env_str("LM_HISTORY_POLICY", "token_budget")
+    if name == "all":
+        return HistoryPolicy()
+    if name == "last_turns":
+        return LastTurnsPolicy(max_turns=env_int("LM_HISTORY_MAX_TURNS", 10), pin_first=pin_first)
+    if name == "token_budget":
+        return TokenBudgetPolicy(max_tokens=env_int("LM_HISTORY_TOKEN_BUDGET", 3072), pin_first=pin_first)
+    if name == "summary":
+        return SummaryPolicy(
+            keep_turns=env_int("LM_HISTORY_MAX_TURNS", 6),
+            pin_first=pin_first,
+            max_summary_tokens=env_int("LM_HISTORY_SUMMARY_TOKENS", 256),
+        )
+    raise ValueError(f"未知的历史消息策略 {name}!")
@@ -0,0 +1,337 @@
+import atexit
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from langchain_core.messages import message_to_dict, messages_from_dict  # 消息序列化工具
+
+from .compact_history import CompactChatMessageHistory  # 导入紧凑存储的聊天历史
+from utils.logger import LOG  # 导入日志工具
+
+
+class SQLiteHistoryBackend:
+    """
+    基于本地 SQLite 的会话历史存储。
+    默认写入采用 write-behind：请求路径只把消息放入内存队列，由后台线程批量写入数据库，
+    因此每轮对话不会增加同步的磁盘读写。
+
+    多进程模式下（shared=True），多个工作进程共用同一个数据库文件，任一进程都可能处理某个会话的下一轮对话。
+    此时改为同步写入，并用 (最大消息 id, 消息数) 作为会话的版本号：各进程在使用内存副本前先核对版本，
+    发现其他进程修改过该会话时重新加载。
+
+    浏览器会话标识每次打开页面都不同，已结束的会话不会再被访问。每个会话的最近写入时间记录在 sessions 表中，
+    超过 retention 秒未写入的会话由写入线程（多进程模式下由写入方）每隔 sweep_interval 秒批量删除。
+    """
+    _STOP = object()  # 通知后台线程退出的哨兵
+
+    def __init__(self, path, batch_size=128, flush_interval=0.2, shared=False, retention=7 * 86400.0,
+                 sweep_interval=600.0):
+        self.path = path
+        self.batch_size = batch_size  # 每个事务最多写入的操作数
+        self.flush_interval = flush_interval  # 攒批等待的最长时间（秒）
+        self.shared = shared  # 是否与其他进程共用数据库
+        self.retention = retention  # 会话在最后一次写入后保留的时间（秒），None 表示永久保留
+        self.sweep_interval = sweep_interval  # 清理过期会话的间隔（秒）
+        self._next_sweep = time.monotonic() + min(sweep_interval, 60.0)  # 启动后不久先清理一次停机期间过期的会话
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._read_conn = self._connect()
+        self._read_lock = threading.Lock()
+        self._read_conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                message TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (session_id, id);
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_sessions_access ON sessions (last_access);
+            """
+        )
+        with self._read_conn:
+            # 旧版本的数据库没有 sessions 表，已有的会话从现在开始计算保留时间
+            self._read_conn.execute(
+                "INSERT OR IGNORE INTO sessions (session_id, last_access) SELECT DISTINCT session_id, ? FROM messages",
+                (time.time(),),
+            )
+
+        self._queue = queue.Queue()
+        self._pending = Counter()  # session_id -> 尚未写入数据库的操作数
+        self._pending_lock = threading.Lock()
+        self._writer = threading.Thread(target=self._write_loop, name="history-writer", daemon=True)
+        if shared:
+            self._write_conn = self._connect(isolation_level=None)  # 手动控制事务
+            self._write_lock = threading.Lock()
+        else:
+            self._writer.start()
+        atexit.register(self.close)
+
+    def _connect(self, **kwargs):
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10.0, **kwargs)  # 其他进程写入时最多等待 10 秒
+        conn.execute("PRAGMA journal_mode=WAL")  # 写入时不阻塞读取
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @staticmethod
+    def _touch(conn, session_ids):
+        conn.executemany(
+            "INSERT INTO sessions (session_id, last_access) VALUES (?, ?) "
+            "ON CONFLICT (session_id) DO UPDATE SET last_access = excluded.last_access",
+            [(session_id, time.time()) for session_id in session_ids],
+        )
+
+    def _sweep_due(self):
+        if self.retention is None or time.monotonic() < self._next_sweep:
+            return False
+        self._next_sweep = time.monotonic() + self.sweep_interval
+        return True
+
+    def _sweep(self, conn):
+        """
+        删除超过保留时间未写入的会话及其消息（在调用方的事务中执行）。
+
+        返回:
+            int: 删除的会话数
+        """
+        cutoff = time.time() - self.retention
+        conn.execute(
+            "DELETE FROM messages WHERE session_id IN (SELECT session_id FROM sessions WHERE last_access < ?)",
+            (cutoff,),
+        )
+        return conn.execute("DELETE FROM sessions WHERE last_access < ?", (cutoff,)).rowcount
+
+    def _enqueue(self, op):
+        with self._pending_lock:
+            self._pending[op[1]] += 1
+        self._queue.put(op)
+
+    def append(self, session_id, messages):
+        """
+        异步追加消息到指定会话。
+        """
+        self._enqueue(("append", session_id, self._encode(messages)))
+
+    @staticmethod
+    def _encode(messages):
+        return [json.dumps(message_to_dict(m), ensure_ascii=False) for m in messages]
+
+    def clear(self, session_id):
+        """
+        异步清空指定会话的消息。
+        """
+        self._enqueue(("clear", session_id, None))
+
+    def load(self, session_id):
+        """
+        从数据库读取指定会话的全部消息。若该会话仍有未写入的操作，先等待其落盘。
+
+        返回:
+            tuple: (消息列表, 版本号)
+        """
+        with self._pending_lock:
+            has_pending = self._pending[session_id] > 0
+        if has_pending:
+            self.flush()
+        with self._read_lock:
+            rows = self._read_conn.execute(
+                "SELECT id, message FROM messages WHERE session_id = ? ORDER BY id", (session_id,)
+            ).fetchall()
+        version = (rows[-1][0] if rows else 0, len(rows))
+        return messages_from_dict([json.loads(row[1]) for row in rows]), version
+
+    @staticmethod
+    def _version(conn, session_id):
+        row = conn.execute(
+            "SELECT COALESCE(MAX(id), 0), COUNT(*) FROM messages WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row[0], row[1]
+
+    def version(self, session_id):
+        """
+        返回会话的版本号 (最大消息 id, 消息数)。id 自增且不复用，追加或清空消息后版本号必然变化。
+        """
+        with self._read_lock:
+            return self._version(self._read_conn, session_id)
+
+    def write(self, session_id, messages, clear=False, expected=None):
+        """
+        同步写入（多进程模式）：可选地先清空会话，再追加消息。
+
+        参数:
+            session_id (str): 会话ID
+            messages (list): 要追加的消息
+            clear (bool): 是否先清空会话
+            expected (tuple): 调用方内存副本的版本号
+
+        返回:
+            tuple: 写入后的版本号；写入前的版本与 expected 不一致（其他进程修改过该会话）或写入失败时返回 None，
+                   调用方应在下次使用时重新加载
+        """
+        rows = self._encode(messages)
+        with self._write_lock:
+            conn = self._write_conn
+            try:
+                conn.execute("BEGIN IMMEDIATE")  # 先取得写锁，保证读取版本与写入之间没有其他进程写入
+                try:
+                    before = self._version(conn, session_id)
+                    if clear:
+                        conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                    conn.executemany(
+                        "INSERT INTO messages (session_id, message) VALUES (?, ?)",
+                        [(session_id, row) for row in rows],
+                    )
+                    self._touch(conn, [session_id])
+                    after = self._version(conn, session_id)
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+            except sqlite3.Error as e:
+                LOG.error(f"[SQLiteHistoryBackend] 写入会话 {session_id} 失败：{e}")
+                return None
+            if self._sweep_due():
+                self._sweep_shared(conn)
+        return after if clear or before == expected else None
+
+    def _sweep_shared(self, conn):
+        # 各工作进程都可能执行清理，删除操作可以重复执行
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                removed = self._sweep(conn)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            LOG.error(f"[SQLiteHistoryBackend] 清理过期会话失败：{e}")
+            return
+        if removed:
+            LOG.info(f"[SQLiteHistoryBackend] 已删除 {removed} 个超过保留时间的会话")
+
+    def flush(self):
+        """
+        阻塞直到队列中的所有操作都已写入数据库。
+        """
+        self._queue.join()
+
+    def close(self):
+        """
+        写完剩余的操作后停止后台线程。
+        """
+        if self._writer.is_alive():
+            self._queue.put(self._STOP)
+            self._writer.join()
+        if self.shared:
+            with self._write_lock:
+                self._write_conn.close()
+
+    def _next_batch(self):
+        """
+        取出一批待写入的操作：阻塞等待第一条，然后在 flush_interval 内尽量攒满一批。
+        """
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size and batch[-1] is not self._STOP:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            batch = self._next_batch()
+            ops = [op for op in batch if op is not self._STOP]
+            try:
+                with conn:  # 一批操作在同一个事务中提交
+                    for action, session_id, rows in ops:
+                        if action == "append":
+                            conn.executemany(
+                                "INSERT INTO messages (session_id, message) VALUES (?, ?)",
+                                [(session_id, row) for row in rows],
+                            )
+                        else:
+                            conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                    self._touch(conn, {session_id for _, session_id, _ in ops})
+                    removed = self._sweep(conn) if self._sweep_due() else 0
+                if removed:
+                    LOG.info(f"[SQLiteHistoryBackend] 已删除 {removed} 个超过保留时间的会话")
+            except sqlite3.Error as e:
+                LOG.error(f"[SQLiteHistoryBackend] 批量写入 {len(ops)} 条操作失败：{e}")
+            finally:
+                with self._pending_lock:
+                    for _, session_id, _ in ops:
+                        self._pending[session_id] -= 1
+                        if self._pending[session_id] <= 0:
+                            del self._pending[session_id]
+                for _ in batch:
+                    self._queue.task_done()
+            if len(ops) < len(batch):
+                conn.close()
+                return
+
+
+class SQLiteChatMessageHistory(CompactChatMessageHistory):
+    """
+    SQLite 持久化的聊天历史。首次访问时才从数据库加载消息，之后读取内存中的紧凑副本，
+    新消息先写入内存副本，再交给后台线程落盘。
+    与其他进程共用数据库时，每次使用内存副本前核对版本号，写入则同步完成。
+    """
+    def __init__(self, session_id, backend):
+        super().__init__()
+        self.session_id = session_id
+        self.backend = backend
+        self._version = None  # 内存副本对应的版本号，None 表示尚未加载或需要重新加载
+
+    @property
+    def log(self):
+        if self._version is not None and self.backend.shared and self.backend.version(self.session_id) != self._version:
+            self._version = None  # 其他进程修改过该会话
+        if self._version is None:
+            messages, version = self.backend.load(self.session_id)
+            self._log.clear()
+            self._log.extend(messages)
+            self._version = version
+        return self._log
+
+    def add_messages(self, messages):
+        messages = list(messages)
+        if not self.backend.shared:
+            super().add_messages(messages)
+            self.backend.append(self.session_id, messages)
+            return
+        with self._lock:
+            log = self.log
+            version = self.backend.write(self.session_id, messages, expected=self._version)
+            if version is not None:
+                log.extend(messages)
+            self._version = version
+
+    def clear(self):
+        if not self.backend.shared:
+            with self._lock:
+                self._log.clear()
+                self._version = (0, 0)
+            self.backend.clear(self.session_id)
+            return
+        with self._lock:
+            self._log.clear()
+            self._version = self.backend.write(self.session_id, [], clear=True)
+
+    def memory_usage(self):
+        if self._version is None:
+            return 0, 0  # 尚未从数据库加载，不占用内存
+        return super().memory_usage()
@@ -0,0 +1,140 @@
+import json
+import threading
+import time
+from dataclasses import dataclass, fields, replace
+from typing import Any, Optional, Tuple
+
+from utils.config import env_agent, env_float, env_int, env_str  # 导入环境变量配置工具
+from utils.logger import LOG  # 导入日志工具
+
+
+@dataclass(frozen=True)
+class ModelConfig:
+    """
+    模型配置。配置相同的代理共享同一个模型客户端（以及其中的 HTTP 连接池）。
+    """
+    model: str = "llama3.1:8b-instruct-q8_0"  # 使用的模型名称
+    temperature: float = 0.8  # 随机性配置
+    max_tokens: int = 8192  # 最大生成的 token 数（对应 Ollama 的 num_predict）
+    num_ctx: Optional[int] = None  # 上下文窗口大小，None 表示使用 Ollama 的默认值
+    base_url: Optional[str] = None  # Ollama 服务地址，None 表示使用默认地址
+    keep_alive: Optional[str] = None  # 模型空闲后在 Ollama 中保持加载的时长，例如 "30m"
+    options: Tuple[Tuple[str, Any], ...] = ()  # 透传给 ChatOllama 的其他 Ollama 参数，例如 (("num_gpu", 1),)
+    connect_timeout: float = 10.0  # 连接 Ollama 的超时时间（秒）
+    read_timeout: float = 60.0  # 等待下一段响应的超时时间（秒），防止 Ollama 卡住时请求无限期挂起
+
+    @classmethod
+    def from_env(cls, agent_name=None):
+        """
+        从环境变量读取模型配置。全局配置为 LM_MODEL、LM_TEMPERATURE、LM_MAX_TOKENS、LM_NUM_CTX、
+        LM_OLLAMA_BASE_URL、LM_KEEP_ALIVE、LM_OLLAMA_OPTIONS（JSON 对象）、LM_CONNECT_TIMEOUT、LM_READ_TIMEOUT；
+        可以用代理名称作为前缀单独覆盖，例如 LM_VOCAB_STUDY_MODEL。
+
+        参数:
+            agent_name (str, optional): 代理名称
+
+        返回:
+            ModelConfig: 模型配置
+        """
+        defaults = cls()
+
+        def read(reader, key, default):
+            return env_agent(reader, agent_name, key, default)
+
+        num_ctx = read(env_int, "NUM_CTX", 0)
+        try:
+            options = json.loads(read(env_str, "OLLAMA_OPTIONS", "{}"))
+        except json.JSONDecodeError:
+            raise ValueError("环境变量 LM_OLLAMA_OPTIONS 必须是合法的 JSON 对象!")
+        return cls(
+            model=read(env_str, "MODEL", defaults.model),
+            temperature=read(env_float, "TEMPERATURE", defaults.temperature),
+            max_tokens=read(env_int, "MAX_TOKENS", defaults.max_tokens),
+            num_ctx=num_ctx if num_ctx > 0 else None,
+            base_url=read(env_str, "OLLAMA_BASE_URL", defaults.base_url),
+            keep_alive=read(env_str, "KEEP_ALIVE", defaults.keep_alive),
+            options=tuple(sorted(options.items())),
+            connect_timeout=read(env_float, "CONNECT_TIMEOUT", defaults.connect_timeout),
+            read_timeout=read(env_float, "READ_TIMEOUT", defaults.read_timeout),
+        )
+
+    def replace(self, **changes):
+        """
+        返回修改了部分字段的新配置。
+        """
+        return replace(self, **changes)
+
+    def as_dict(self):
+        return {f.name: getattr(self, f.name) for f in fields(self)}
+
+
+class ModelRegistry:
+    """
+    模型客户端注册表。客户端在首次使用时才创建，配置相同的代理共享同一个实例，
+    从而复用与 Ollama 之间的 HTTP keep-alive 连接。
+    """
+    def __init__(self):
+        self._models = {}  # ModelConfig -> ChatOllama
+        self._last_used = {}  # (模型名称, 服务地址) -> 最近一次请求的时间
+        self._lock = threading.Lock()
+
+    def get(self, config):
+        """
+        获取指定配置的模型客户端，不存在时创建。
+
+        参数:
+            config (ModelConfig): 模型配置
+
+        返回:
+            ChatOllama: 模型客户端
+        """
+        model = self._models.get(config)
+        if model is not None:
+            return model
+        with self._lock:
+            if config not in self._models:
+                self._models[config] = self._create(config)
+            return self._models[config]
+
+    def _create(self, config):
+        import httpx
+        from langchain_ollama.chat_models import ChatOllama  # 导入 ChatOllama 模型
+
+        kwargs = {
+            "model": config.model,
+            "num_predict": config.max_tokens,
+            "temperature": config.temperature,
+        }
+        if config.num_ctx:
+            kwargs["num_ctx"] = config.num_ctx
+        if config.base_url:
+            kwargs["base_url"] = config.base_url
+        if config.keep_alive:
+            kwargs["keep_alive"] = config.keep_alive
+        kwargs["client_kwargs"] = {"timeout": httpx.Timeout(config.read_timeout, connect=config.connect_timeout)}
+        kwargs.update(config.options)
+        LOG.info(f"[ModelRegistry] 创建模型客户端 {config.as_dict()}")
+        return ChatOllama(**kwargs)
+
+    def touch(self, config):
+        """
+        记录某个模型刚刚处理过请求。
+        """
+        self._last_used[(config.model, config.base_url)] = time.monotonic()
+
+    def idle_seconds(self, config):
+        """
+        返回某个模型距离最近一次请求的秒数，从未使用过时返回无穷大。
+        """
+        last_used = self._last_used.get((config.model, config.base_url))
+        return time.monotonic() - last_used if last_used is not None else float("inf")
+
+    def configs(self):
+        """
+        返回当前已创建客户端的所有模型配置。
+        """
+        return list(self._models)
+
+
+# 全局模型注册表
+model_registry = ModelRegistry()
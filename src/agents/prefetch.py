@@ -0,0 +1,173 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from .concurrency import model_limiter  # 导入模型请求限流器
+from utils.config import env_bool, env_float, env_int  # 导入环境变量配置工具
+from utils.logger import LOG  # 导入日志工具
+
+
+class Prefetcher:
+    """
+    推测式预生成。在学习者进行当前练习时，提前生成下一步很可能需要的内容（例如词汇学习下一关的开场回复），
+    结果保存在按会话划分的槽位中，真正需要时直接取用。
+    后台任务只在限流器有空闲名额（try_acquire）时才请求模型，生成过程中有实时请求开始排队时随即放弃，不与实时请求争抢；
+    会话结束时取消该会话尚未完成的任务并清空槽位。
+    """
+    def __init__(self, ttl=1800.0, max_sessions=1000, max_wait=30.0, poll_interval=0.5):
+        self.ttl = ttl  # 预生成结果的有效期（秒）
+        self.max_sessions = max_sessions  # 最多保存槽位的会话数，超出时按 LRU 淘汰
+        self.max_wait = max_wait  # 等待空闲名额的最长时间（秒），超时后放弃本次预生成
+        self.poll_interval = poll_interval  # 检查空闲名额的间隔（秒）
+        self._slots = OrderedDict()  # session_id -> {键: (内容, 写入时间, 步骤)}
+        self._pending = {}  # (session_id, 键) -> 取消事件
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+        self.hits = 0
+        self.misses = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.skipped = 0  # 一直没有空闲名额而放弃的任务数
+
+    @classmethod
+    def from_env(cls):
+        """
+        根据环境变量创建预生成器：LM_PREFETCH 为真时启用，LM_PREFETCH_TTL、LM_PREFETCH_MAX_WAIT 控制有效期与等待空闲名额的时间。
+
+        返回:
+            Prefetcher: 预生成器，未启用时返回 None
+        """
+        if not env_bool("LM_PREFETCH", False):
+            return None
+        return cls(
+            ttl=env_float("LM_PREFETCH_TTL", 1800.0),
+            max_sessions=max(1, env_int("LM_MAX_SESSIONS", 1000)),
+            max_wait=env_float("LM_PREFETCH_MAX_WAIT", 30.0),
+        )
+
+    def put(self, session_id, key, value, step=None):
+        """
+        将内容放入会话的槽位。step 表示推测的是会话中的哪一步（例如请求中历史消息的条数），用于统计推测失败。
+        """
+        with self._lock:
+            slots = self._slots.setdefault(session_id, {})
+            slots[key] = (value, time.monotonic(), step)
+            self._slots.move_to_end(session_id)
+            while len(self._slots) > self.max_sessions:
+                self._slots.popitem(last=False)
+
+    def take(self, session_id, key, step=None):
+        """
+        取出会话槽位中的内容，取出后即从槽位中移除；不存在或已过期时返回 None。
+        只有为同一步（step 相同）推测过内容、但与本次需要的不一致（推测失败）时才计为未命中，
+        这些推测不会再被用到，一并移除；会话中其他步骤的推测（或没有任何推测）不影响统计。
+        """
+        with self._lock:
+            slots = self._slots.get(session_id)
+            if not slots:
+                return None
+            entry = slots.pop(key, None)
+            now = time.monotonic()
+            if entry is not None and now - entry[1] <= self.ttl:
+                self.hits += 1
+                value = entry[0]
+            else:
+                stale = [k for k, (_, _, k_step) in slots.items() if step is not None and k_step == step]
+                if entry is not None or stale:  # 推测的内容已过期，或为这一步推测的上下文不一致
+                    self.misses += 1
+                for k in stale:
+                    del slots[k]
+                value = None
+            if not slots:
+                del self._slots[session_id]
+            return value
+
+    def has_slots(self, session_id):
+        """
+        判断会话是否有预生成的内容，没有时无需计算请求的键即可跳过 take。
+        """
+        with self._lock:
+            return session_id in self._slots
+
+    def peek(self, session_id, key):
+        """
+        查看会话槽位中的内容但不取出，不存在或已过期时返回 None。
+        """
+        with self._lock:
+            entry = self._slots.get(session_id, {}).get(key)
+            if entry is not None and time.monotonic() - entry[1] <= self.ttl:
+                return entry[0]
+            return None
+
+    def submit(self, session_id, key, generate, step=None):
+        """
+        提交一个后台预生成任务，结果放入会话的槽位。同一会话的同一个键只会有一个任务。
+
+        参数:
+            session_id (str): 会话ID
+            key (str): 槽位键
+            generate (callable): 接收取消事件的函数，返回要保存的内容；返回 None 表示无需保存（例如只预热模型）
+            step (optional): 推测的是会话中的哪一步，见 take
+        """
+        with self._lock:
+            if (session_id, key) in self._pending or key in self._slots.get(session_id, {}):
+                return
+            cancelled = threading.Event()
+            self._pending[(session_id, key)] = cancelled
+        self._executor.submit(self._run, session_id, key, generate, cancelled, step)
+
+    def _run(self, session_id, key, generate, cancelled, step=None):
+        try:
+            deadline = time.monotonic() + self.max_wait
+            while not model_limiter.try_acquire():  # 只使用空闲名额
+                if time.monotonic() >= deadline:
+                    self.skipped += 1
+                    return
+                if cancelled.wait(self.poll_interval):
+                    return
+            try:
+                if cancelled.is_set():
+                    return
+                value = generate(cancelled)
+            finally:
+                model_limiter.release()
+            if value is not None and not cancelled.is_set():
+                self.put(session_id, key, value, step)
+                self.completed += 1
+        except Exception as e:
+            LOG.warning(f"[Prefetcher] 会话 {session_id} 的预生成任务 {key[:12]} 失败：{e}")
+        finally:
+            with self._lock:
+                if self._pending.get((session_id, key)) is cancelled:
+                    del self._pending[(session_id, key)]
+
+    def cancel_client(self, client_id):
+        """
+        取消某个浏览器会话在所有代理下的预生成任务，并清空其槽位（会话ID形如 "代理名称:client_id"）。
+        """
+        suffix = f":{client_id}"
+        with self._lock:
+            for pending_key in [k for k in self._pending if k[0].endswith(suffix)]:
+                self._pending.pop(pending_key).set()
+                self.cancelled += 1
+            for session_id in [sid for sid in self._slots if sid.endswith(suffix)]:
+                del self._slots[session_id]
+
+    def stats(self):
+        """
+        返回预生成的统计信息。
+        """
+        return {
+            "sessions": len(self._slots),
+            "pending": len(self._pending),
+            "completed": self.completed,
+            "hits": self.hits,
+            "misses": self.misses,
+            "cancelled": self.cancelled,
+            "skipped": self.skipped,
+        }
+
+
+# 各代理共享的预生成器，未启用时为 None
+default_prefetcher = Prefetcher.from_env()
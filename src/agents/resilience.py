@@ -0,0 +1,108 @@
+import asyncio
+import random
+from dataclasses import dataclass
+
+import httpx
+
+from .concurrency import OVERLOADED_MESSAGE, OverloadedError  # 导入过载异常与提示
+from utils.config import env_agent, env_float, env_int  # 导入环境变量配置工具
+
+# 模型请求失败时返回给用户的提示
+TIMEOUT_MESSAGE = "抱歉，老师这次思考得太久了，请稍后再试一次。"
+UNAVAILABLE_MESSAGE = "抱歉，暂时无法连接到模型服务，请稍后再试。"
+
+
+class ModelTimeoutError(TimeoutError):
+    """
+    模型请求超过了截止时间。
+    """
+
+
+class ModelUnavailableError(ConnectionError):
+    """
+    重试后仍无法连接到模型服务。
+    """
+
+
+# 需要向用户展示兜底提示的模型请求异常
+MODEL_ERRORS = (OverloadedError, ModelTimeoutError, ModelUnavailableError)
+
+# 可以安全重试的连接错误：请求尚未被 Ollama 处理
+TRANSIENT_ERRORS = (
+    httpx.ConnectError,
+    httpx.ConnectTimeout,
+    httpx.RemoteProtocolError,
+    ConnectionError,
+)
+
+
+def fallback_message(error):
+    """
+    返回模型请求异常对应的用户提示。
+    """
+    if isinstance(error, ModelTimeoutError):
+        return TIMEOUT_MESSAGE
+    if isinstance(error, ModelUnavailableError):
+        return UNAVAILABLE_MESSAGE
+    return OVERLOADED_MESSAGE
+
+
+def translate_error(error):
+    """
+    将底层的 HTTP/Ollama 异常转换为 MODEL_ERRORS 中的异常，其他异常原样返回。
+    """
+    if isinstance(error, MODEL_ERRORS):
+        return error
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, httpx.TimeoutException)):
+        return ModelTimeoutError(f"模型请求超时：{error}")
+    if isinstance(error, TRANSIENT_ERRORS):
+        return ModelUnavailableError(f"无法连接到模型服务：{error}")
+    if getattr(error, "status_code", None) == 503:
+        return OverloadedError(f"模型服务繁忙：{error}")  # Ollama 排队已满时返回 503
+    return error
+
+
+@dataclass(frozen=True)
+class RequestPolicy:
+    """
+    模型请求的截止时间与重试策略。
+    只在尚未收到任何响应片段时重试连接类错误，已经开始输出的回复不会重复生成。
+    """
+    timeout: float = 120.0  # 获得模型名额后，一轮生成（含所有重试）的截止时间（秒），0 表示不限制
+    max_retries: int = 2  # 连接错误的最大重试次数
+    backoff_base: float = 0.5  # 首次重试前的等待时间（秒），之后按 2 的指数增长
+    backoff_max: float = 4.0  # 单次等待时间的上限（秒）
+
+    @classmethod
+    def from_env(cls, agent_name=None):
+        """
+        从环境变量读取请求策略：LM_REQUEST_TIMEOUT、LM_RETRY_MAX、LM_RETRY_BACKOFF、LM_RETRY_BACKOFF_MAX，
+        可以用代理名称作为前缀单独覆盖，例如 LM_SCENARIO_REQUEST_TIMEOUT。
+        """
+        defaults = cls()
+        return cls(
+            timeout=env_agent(env_float, agent_name, "REQUEST_TIMEOUT", defaults.timeout),
+            max_retries=max(0, env_agent(env_int, agent_name, "RETRY_MAX", defaults.max_retries)),
+            backoff_base=env_agent(env_float, agent_name, "RETRY_BACKOFF", defaults.backoff_base),
+            backoff_max=env_agent(env_float, agent_name, "RETRY_BACKOFF_MAX", defaults.backoff_max),
+        )
+
+    def deadline(self, now):
+        """
+        根据开始时间计算截止时间（time.monotonic），不限制时返回 None。
+        """
+        return now + self.timeout if self.timeout > 0 else None
+
+    def backoff(self, attempt):
+        """
+        第 attempt 次重试前的等待时间（从 0 开始），带 ±50% 的随机抖动，避免多个请求同时重连。
+        """
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return delay * random.uniform(0.5, 1.5)
+
+    def should_retry(self, error, attempt, started):
+        """
+        判断是否重试：只重试尚未输出任何片段的连接类错误，且次数未超过上限。
+        """
+        return not started and attempt < self.max_retries and isinstance(error, TRANSIENT_ERRORS)
+
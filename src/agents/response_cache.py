@@ -0,0 +1,157 @@
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from .concurrency import model_limiter  # 导入模型请求限流器
+from utils.config import env_bool, env_float, env_int  # 导入环境变量配置工具
+from utils.logger import LOG  # 导入日志工具
+
+
+class ResponseCache:
+    """
+    开场轮次的回复缓存。
+    对于上下文完全相同的请求（例如词汇学习新学习者首关的开场消息），直接返回缓存的回复。
+    每个键保存最多 N 个不同的回复变体，首次生成后在后台利用空闲的模型名额补齐，
+    命中时随机返回其中之一，保证回答仍有变化。缓存条目按 LRU 淘汰，并有过期时间。
+    """
+    def __init__(self, maxsize=256, ttl=3600.0, variants=3, max_opening=1):
+        self.maxsize = maxsize  # 最多缓存的键数
+        self.ttl = ttl  # 条目过期时间（秒）
+        self.variants = variants  # 每个键保存的回复变体数
+        self.max_opening = max_opening  # 开场轮次的历史中最多有几条代理的开场消息（例如场景的初始 AI 消息）
+        self._entries = OrderedDict()  # key -> (回复变体列表, 创建时间)
+        self._filling = set()  # 正在后台补齐变体的键
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="response-cache")
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls):
+        """
+        根据环境变量创建回复缓存：LM_RESPONSE_CACHE 为真时启用，
+        LM_RESPONSE_CACHE_SIZE、LM_RESPONSE_CACHE_TTL、LM_RESPONSE_CACHE_VARIANTS 控制容量、过期时间和变体数。
+
+        返回:
+            ResponseCache: 回复缓存，未启用时返回 None
+        """
+        if not env_bool("LM_RESPONSE_CACHE", False):
+            return None
+        return cls(
+            maxsize=env_int("LM_RESPONSE_CACHE_SIZE", 256),
+            ttl=env_float("LM_RESPONSE_CACHE_TTL", 3600.0),
+            variants=max(1, env_int("LM_RESPONSE_CACHE_VARIANTS", 3)),
+        )
+
+    @staticmethod
+    def make_key(agent_name, prompt, messages, model_config):
+        """
+        根据代理名称、系统提示、规范化后的消息列表和模型参数计算缓存键。
+        """
+        payload = json.dumps(
+            [
+                agent_name,
+                hashlib.sha256(prompt.encode("utf-8")).hexdigest(),
+                [(m.type, " ".join(str(m.content).split())) for m in messages],  # 规范化空白字符
+                model_config.as_dict(),
+            ],
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def cacheable(self, history_messages):
+        """
+        判断当前会话历史是否属于可缓存的开场轮次：历史为空，或只有代理的开场消息、学习者还没有发言。
+        学习者发言之后的上下文因人而异，即使消息条数很少也不缓存。
+        """
+        return len(history_messages) <= self.max_opening and all(m.type == "ai" for m in history_messages)
+
+    def get(self, key):
+        """
+        查询缓存，命中时随机返回一个回复变体，否则返回 None。
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return random.choice(entry[0])
+
+    def add(self, key, response):
+        """
+        将一个回复变体加入缓存。
+
+        返回:
+            int: 该键还缺少的变体数
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = ([], time.monotonic())
+                self._entries[key] = entry
+            if response and response not in entry[0] and len(entry[0]) < self.variants:
+                entry[0].append(response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            return self.variants - len(entry[0])
+
+    def prefill(self, key, generate):
+        """
+        在后台补齐某个键的回复变体。只在模型有空闲名额时生成，不与实时请求争抢。
+
+        参数:
+            key (str): 缓存键
+            generate (callable): 无参函数，返回一个新生成的回复；返回 None 表示为实时请求让出了名额
+        """
+        with self._lock:
+            if key in self._filling:
+                return
+            self._filling.add(key)
+        self._executor.submit(self._fill, key, generate)
+
+    def _fill(self, key, generate):
+        try:
+            missing = self.variants - len(self._entries.get(key, ([], 0))[0])
+            for _ in range(missing):
+                if not model_limiter.try_acquire():
+                    break  # 模型繁忙，留待下次未命中时再补齐
+                try:
+                    response = generate()
+                finally:
+                    model_limiter.release()
+                if response is None:
+                    break  # 有实时请求在排队，留待下次未命中时再补齐
+                if self.add(key, response) <= 0:
+                    break
+        except Exception as e:
+            LOG.warning(f"[ResponseCache] 后台生成回复变体失败：{e}")
+        finally:
+            with self._lock:
+                self._filling.discard(key)
+
+    def stats(self):
+        """
+        返回缓存的统计信息。
+        """
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+# 各代理共享的回复缓存，未启用时为 None
+default_response_cache = ResponseCache.from_env()
@@ -1,24 +1,31 @@
+import asyncio
 import random
 
-from langchain_core.messages import AIMessage  # 导入消息类
+from langchain_core.messages import AIMessage, HumanMessage  # 导入消息类
 
 from .session_history import get_session_history  # 导入会话历史相关方法
+from .compact_history import count_messages, get_messages  # 不转换整段历史即可读取消息数与部分消息
 from .agent_base import AgentBase
-from utils.logger import LOG
+from .agent_metrics import HISTORY_LENGTH, track_session_start  # 导入代理指标
+from .response_cache import default_response_cache  # 导入共享的回复缓存
+from utils.logger import LOG, format_messages
 
 
 class ScenarioAgent(AgentBase):
     """
     场景代理类，负责处理特定场景下的对话。
     """
-    def __init__(self, scenario_name, session_id=None):
+    def __init__(self, scenario_name, session_id=None, **kwargs):
         prompt_file = f"prompts/{scenario_name}_prompt.txt"
         intro_file = f"content/intro/{scenario_name}.json"
+        # 场景开场后的首轮回复上下文固定，默认使用共享的回复缓存（需通过 LM_RESPONSE_CACHE 启用）
+        kwargs.setdefault("response_cache", default_response_cache)
         super().__init__(
             name=scenario_name,
             prompt_file=prompt_file,
             intro_file=intro_file,
-            session_id=session_id
+            session_id=session_id,
+            **kwargs  # 其他配置，例如 history_policy、model_config
         )
 
     def start_new_session(self, session_id=None):
@@ -31,15 +38,55 @@ class ScenarioAgent(AgentBase):
         返回:
             str: 初始 AI 消息
         """
-        if session_id is None:
-            session_id = self.session_id
+        session_id = self._resolve_session_id(session_id)
 
-        history = get_session_history(session_id)
-        LOG.debug(f"[history][{session_id}]:{history}")
+        with track_session_start(self.name):  # 记录开始会话的耗时
+            history = get_session_history(session_id)
+            LOG.opt(lazy=True).debug("[history][{}]:{}", lambda: session_id, lambda: format_messages(history.messages))  # 只在调试级别启用时格式化历史
+            message_count = count_messages(history)
+            HISTORY_LENGTH.observe(message_count, agent=self.name)
 
-        if not history.messages:
-            initial_ai_message = random.choice(self.intro_messages)  # 随机选择初始AI消息
-            history.add_message(AIMessage(content=initial_ai_message))  # 添加初始AI消息到历史记录
-            return initial_ai_message
-        else:
-            return history.messages[-1].content  # 返回历史记录中的最后一条消息
+            if not message_count:
+                initial_ai_message = self._planned_intro(session_id) or random.choice(self.intro_messages)  # 随机选择初始AI消息
+                history.add_message(AIMessage(content=initial_ai_message))  # 添加初始AI消息到历史记录
+                return initial_ai_message
+            else:
+                return get_messages(history, -1)[0].content  # 返回历史记录中的最后一条消息，只转换这一条
+
+    async def astart_new_session(self, session_id=None):
+        """
+        start_new_session 的异步版本，在线程中读取会话历史，避免阻塞事件循环。
+
+        参数:
+            session_id (str, optional): 会话的唯一标识符
+
+        返回:
+            str: 初始 AI 消息
+        """
+        return await asyncio.to_thread(self.start_new_session, session_id)
+
+    def _planned_intro(self, session_id):
+        """
+        取出 prewarm_opening 为会话预先选定的初始AI消息，没有或已失效时返回 None。
+        """
+        if self.prefetcher is None:
+            return None
+        intro = self.prefetcher.take(session_id, "intro")
+        return intro if intro in self.intro_messages else None
+
+    def prewarm_opening(self, session_id=None):
+        """
+        预先为会话选定本场景的初始AI消息，并在后台用它预热模型与提示前缀。
+        学习者切换到本场景后，首轮回复只需计算新增的用户消息。未启用预生成时不做任何事。
+
+        参数:
+            session_id (str, optional): 会话的唯一标识符
+        """
+        if self.prefetcher is None or not self.intro_messages:
+            return
+        session_id = self._resolve_session_id(session_id)
+        intro = self.prefetcher.peek(session_id, "intro")
+        if intro not in self.intro_messages:
+            intro = random.choice(self.intro_messages)
+            self.prefetcher.put(session_id, "intro", intro)
+        self.prewarm(session_id, [AIMessage(content=intro), HumanMessage(content="Hi")])
@@ -1,23 +1,197 @@
-from langchain_core.chat_history import (
-    BaseChatMessageHistory,  # 基础聊天消息历史类
-    InMemoryChatMessageHistory,  # 内存中的聊天消息历史类
-)
+import threading
+import time
+from collections import OrderedDict
 
+from langchain_core.chat_history import BaseChatMessageHistory  # 基础聊天消息历史类
 
-# 用于存储会话历史的字典
-store = {}
+from .compact_history import CompactChatMessageHistory, memory_usage  # 导入紧凑存储的聊天历史
+from .history_store import SQLiteChatMessageHistory, SQLiteHistoryBackend  # 导入持久化历史存储
+from utils.config import env_float, env_int, env_str  # 导入环境变量配置工具
+from utils.logger import LOG  # 导入日志工具
+from utils.workers import shared_state  # 是否与其他工作进程共享会话状态
+
+
+def history_retention():
+    """
+    读取持久化数据的保留时间（秒）：环境变量 LM_HISTORY_RETENTION，默认 7 天，0 表示永久保留。
+    """
+    retention = env_float("LM_HISTORY_RETENTION", 7 * 86400.0)
+    return retention if retention > 0 else None
+
+
+def create_history_factory(backend=None):
+    """
+    根据存储后端创建会话历史的工厂函数。未指定时读取环境变量 LM_HISTORY_BACKEND：
+    memory（默认，仅保存在内存中）或 sqlite（保存到 LM_HISTORY_DB 指定的数据库文件，重启后仍可恢复，
+    超过 LM_HISTORY_RETENTION 秒未写入的会话从数据库中删除）。
+
+    返回:
+        callable: 接收 session_id、返回 BaseChatMessageHistory 的工厂函数
+    """
+    backend = backend or env_str("LM_HISTORY_BACKEND", "memory")
+    if backend == "memory":
+        return lambda session_id: CompactChatMessageHistory()
+    if backend == "sqlite":
+        # 多进程模式下各工作进程共用数据库，改为同步写入并在使用前核对版本
+        sqlite_backend = SQLiteHistoryBackend(
+            env_str("LM_HISTORY_DB", "data/history.db"), shared=shared_state(), retention=history_retention(),
+        )
+        return lambda session_id: SQLiteChatMessageHistory(session_id, sqlite_backend)
+    raise ValueError(f"未知的会话历史存储后端 {backend}!")
+
+
+class SessionManager:
+    """
+    会话管理器，按会话ID保存聊天历史，同时作为持久化后端前面的热缓存。
+    会话总数有上限，超出时按最近最少使用（LRU）淘汰，长时间未访问的会话按空闲超时（TTL）淘汰。
+    """
+    def __init__(self, max_sessions=1000, idle_ttl=3600.0, history_factory=None):
+        self.max_sessions = max_sessions  # 最多保存的会话数
+        self.idle_ttl = idle_ttl  # 会话空闲超时时间（秒），None 表示不按时间淘汰
+        # 根据 session_id 创建会话历史的工厂函数，持久化后端在此处按需加载已保存的历史
+        self.history_factory = history_factory or (lambda session_id: CompactChatMessageHistory())
+        self._sessions = OrderedDict()  # session_id -> [history, 最近访问时间]，按访问时间从旧到新排列
+        self._lock = threading.Lock()
+        self.lru_evictions = 0  # 因容量上限被淘汰的会话数
+        self.ttl_evictions = 0  # 因空闲超时被淘汰的会话数
+
+    @classmethod
+    def from_env(cls):
+        """
+        根据环境变量创建会话管理器：LM_MAX_SESSIONS、LM_SESSION_TTL、LM_HISTORY_BACKEND。
+        """
+        idle_ttl = env_float("LM_SESSION_TTL", 3600.0)
+        return cls(
+            max_sessions=max(1, env_int("LM_MAX_SESSIONS", 1000)),
+            idle_ttl=idle_ttl if idle_ttl > 0 else None,
+            history_factory=create_history_factory(),
+        )
+
+    @property
+    def live_sessions(self):
+        """
+        当前保存的会话数。
+        """
+        return len(self._sessions)
+
+    @property
+    def evictions(self):
+        """
+        累计淘汰的会话数。
+        """
+        return self.lru_evictions + self.ttl_evictions
+
+    def _evict_expired(self, now):
+        """
+        从最久未访问的会话开始，淘汰所有空闲超时的会话（需持有锁）。
+        """
+        if self.idle_ttl is None:
+            return
+        while self._sessions:
+            session_id, (_, last_access) = next(iter(self._sessions.items()))
+            if now - last_access < self.idle_ttl:
+                break
+            del self._sessions[session_id]
+            self.ttl_evictions += 1
+            LOG.debug(f"[SessionManager] 会话 {session_id} 空闲超时，已淘汰")
+
+    def get(self, session_id):
+        """
+        获取指定会话ID的聊天历史，不存在时创建新的聊天历史实例。
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                entry[1] = now
+                self._sessions.move_to_end(session_id)
+                return entry[0]
+
+            history = self.history_factory(session_id)
+            self._sessions[session_id] = [history, now]
+            while len(self._sessions) > self.max_sessions:
+                evicted_id, _ = self._sessions.popitem(last=False)
+                self.lru_evictions += 1
+                LOG.debug(f"[SessionManager] 会话数超过上限，已淘汰 {evicted_id}")
+            return history
+
+    def drop(self, session_id):
+        """
+        从缓存中移除指定会话。
+        """
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def drop_client(self, client_id):
+        """
+        从缓存中移除某个浏览器会话在所有代理下的聊天历史（会话ID形如 "代理名称:client_id"）。
+        使用持久化后端时，数据库中的历史仍然保留（服务重启后浏览器以同一会话标识重新连接时可以恢复），
+        超过 LM_HISTORY_RETENTION 秒未写入后由后端删除。
+        """
+        suffix = f":{client_id}"
+        with self._lock:
+            for session_id in [sid for sid in self._sessions if sid.endswith(suffix)]:
+                del self._sessions[session_id]
+
+    def snapshot(self):
+        """
+        返回当前缓存的所有会话，用于统计和诊断。
+
+        返回:
+            list: (session_id, history) 列表，按最近访问时间从旧到新排列
+        """
+        with self._lock:
+            return [(session_id, entry[0]) for session_id, entry in self._sessions.items()]
+
+    def memory_report(self, top=10):
+        """
+        统计会话存储中聊天历史占用的内存。
+
+        参数:
+            top (int): 列出占用内存最多的会话数
+
+        返回:
+            dict: 会话数、消息总数、估算的总字节数与每个会话的平均字节数，
+                  以及 top 个最大会话的 (session_id, 消息数, 字节数) 列表
+        """
+        usage = [(session_id, *memory_usage(history)) for session_id, history in self.snapshot()]
+        messages = sum(item[1] for item in usage)
+        approx_bytes = sum(item[2] for item in usage)
+        return {
+            "live_sessions": len(usage),
+            "messages": messages,
+            "approx_bytes": approx_bytes,
+            "approx_bytes_per_session": approx_bytes // len(usage) if usage else 0,
+            "largest": sorted(usage, key=lambda item: item[2], reverse=True)[:top],
+        }
+
+    def stats(self):
+        """
+        返回会话存储的统计信息。
+        """
+        report = self.memory_report(top=0)
+        return {
+            "live_sessions": self.live_sessions,
+            "evictions": self.evictions,
+            "lru_evictions": self.lru_evictions,
+            "ttl_evictions": self.ttl_evictions,
+            "history_messages": report["messages"],
+            "history_bytes": report["approx_bytes"],
+        }
+
+
+# 全局会话管理器
+session_manager = SessionManager.from_env()
 
 def get_session_history(session_id: str) -> BaseChatMessageHistory:
     """
     获取指定会话ID的聊天历史。如果该会话ID不存在，则创建一个新的聊天历史实例。
-    
+
     参数:
         session_id (str): 会话的唯一标识符
-    
+
     返回:
         BaseChatMessageHistory: 对应会话的聊天历史对象
     """
-    if session_id not in store:
-        # 如果会话ID不存在于存储中，创建一个新的内存聊天历史实例
-        store[session_id] = InMemoryChatMessageHistory()
-    return store[session_id]
\ No newline at end of file
+    return session_manager.get(session_id)
@@ -1,42 +1,104 @@
-from langchain_core.messages import AIMessage  # 导入 AI 消息类
+import re
+
+from langchain_core.messages import HumanMessage  # 导入消息类
 
 from .session_history import get_session_history  # 导入用于处理会话历史的方法
 from .agent_base import AgentBase  # 导入基础代理类
-from utils.logger import LOG  # 导入日志记录模块
+from .agent_metrics import track_session_start  # 导入代理指标
+from .history_policy import create_history_policy  # 导入历史消息策略
+from .response_cache import default_response_cache  # 导入共享的回复缓存
+from .vocab_engine import vocab_engine as default_vocab_engine  # 导入词汇学习引擎
+from utils.logger import LOG, format_messages  # 导入日志记录模块
+
+# 浏览器生成的学习者标识（保存在 localStorage 中），格式不符时改用会话标识
+LEARNER_ID_PATTERN = re.compile(r"[A-Za-z0-9-]{8,64}")
 
 class VocabAgent(AgentBase):
     """
     词汇学习代理类，负责处理与用户的对话。
     继承自 AgentBase 基类。
     """
-    def __init__(self, session_id=None):
+    def __init__(self, session_id=None, vocab_engine=None, **kwargs):
+        # 同一批单词的开场请求上下文完全相同，默认使用共享的回复缓存（需通过 LM_RESPONSE_CACHE 启用）
+        kwargs.setdefault("response_cache", default_response_cache)
+        # 本关的单词只出现在第一条用户消息中，裁剪历史时必须始终保留它，否则模型在几轮之后就不知道要教哪些单词
+        kwargs.setdefault("history_policy", create_history_policy(pin_first=True))
+        self.vocab_engine = vocab_engine if vocab_engine else default_vocab_engine  # 挑选每关单词并安排复习
         # 调用父类的构造函数，初始化代理名称、提示文件路径以及可选的会话 ID
         super().__init__(
             name="vocab_study",  # 定义代理的名称
             prompt_file="prompts/vocab_study_prompt.txt",  # 提示词文件的路径
-            session_id=session_id  # 会话唯一标识符，默认为 None
+            session_id=session_id,  # 会话唯一标识符，默认为 None
+            **kwargs  # 其他配置，例如 history_policy、model_config
         )
 
-    def restart_session(self, session_id=None):
+    def _learner_key(self, session_id, learner_id):
+        """
+        返回学习进度的键。浏览器会话标识每次打开页面都不同，学习进度按浏览器保存的学习者标识区分，
+        刷新页面后仍能继续之前的复习计划；没有有效的学习者标识时退回到会话标识，进度只在本次页面会话中有效。
+        """
+        if learner_id and LEARNER_ID_PATTERN.fullmatch(learner_id):
+            return f"{self.name}:learner:{learner_id}"
+        return self._resolve_session_id(session_id)
+
+    def restart_session(self, session_id=None, learner_id=None):
         """
-        重新启动会话，清除会话历史。
+        重新启动会话：根据学习者在上一关中的回答更新复习计划，清除会话历史，并为下一关挑选单词。
 
         参数:
             session_id (str, optional): 会话的唯一标识符。如果未提供，将使用当前会话 ID。
+            learner_id (str, optional): 浏览器保存的学习者标识，学习进度按它保存
 
         返回:
             str: 返回清空后的会话历史，作为初始的 AI 消息。
         """
+        learner = self._learner_key(session_id, learner_id)
         # 如果没有传递 session_id，则使用实例中的 session_id
-        if session_id is None:
-            session_id = self.session_id
+        session_id = self._resolve_session_id(session_id)
 
-        # 获取该会话的历史记录对象
-        history = get_session_history(session_id)
-        # 清除该会话的历史记录
-        history.clear()
+        with track_session_start(self.name):  # 记录重置会话的耗时
+            # 获取该会话的历史记录对象
+            history = get_session_history(session_id)
+            # 统计学习者在上一关中练习过的单词（不含列出单词的开场消息），更新复习计划
+            level_message = self.vocab_engine.format_level_message(self.vocab_engine.current_words(learner))
+            answers = [m.content for m in history.messages if isinstance(m, HumanMessage) and m.content != level_message]
+            self.vocab_engine.finish_level(learner, "\n".join(answers))
+            # 清除该会话的历史记录
+            history.clear()
+            # 为下一关挑选单词
+            self.vocab_engine.start_level(learner)
         # 记录清除后的会话历史到日志中
-        LOG.debug(f"[history][{session_id}]:{history}")
+        LOG.opt(lazy=True).debug("[history][{}]:{}", lambda: session_id, lambda: format_messages(history.messages))  # 只在调试级别启用时格式化历史
 
         # 返回清空后的会话历史记录
         return history
+
+    def level_message(self, session_id=None, learner_id=None):
+        """
+        返回本关的开场消息，其中列出了词汇学习引擎挑选的单词。
+
+        参数:
+            session_id (str, optional): 会话的唯一标识符
+            learner_id (str, optional): 浏览器保存的学习者标识
+
+        返回:
+            str: 作为本关第一条用户消息发送给模型的开场消息
+        """
+        return self.vocab_engine.level_message(self._learner_key(session_id, learner_id))
+
+    def prefetch_next_level(self, session_id=None, learner_id=None):
+        """
+        下一关的单词在本关开始时就已确定，在学习者练习本关时，利用模型的空闲名额提前生成下一关的开场回复，
+        点击「下一关」后直接使用。未启用预生成时不做任何事。
+
+        参数:
+            session_id (str, optional): 会话的唯一标识符
+            learner_id (str, optional): 浏览器保存的学习者标识
+        """
+        if self.prefetcher is None:
+            return
+        words = self.vocab_engine.upcoming_words(self._learner_key(session_id, learner_id))
+        session_id = self._resolve_session_id(session_id)
+        if words:
+            # 新的一关从空的会话历史开始，开场请求只包含列出单词的开场消息
+            self.prefetch_reply(session_id, [HumanMessage(content=self.vocab_engine.format_level_message(words))])
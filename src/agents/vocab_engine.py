@@ -0,0 +1,340 @@
+import os
+import re
+import sqlite3
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+from utils.asset_store import asset_store  # 导入资源仓库
+from utils.config import env_float, env_int, env_str  # 导入环境变量配置工具
+from utils.logger import LOG  # 导入日志工具
+from utils.metrics import metrics  # 导入全局指标注册表
+from utils.workers import shared_state  # 是否与其他工作进程共享会话状态
+
+WORD_BANK_FILE = "content/vocab/word_bank.json"
+
+# 间隔重复（Leitner 盒子）：单词在第 i 个盒子中时，下一关之后再隔 REVIEW_INTERVALS[i] 关复习。
+# 下一关的单词在本关开始时就已确定（便于提前生成下一关的开场回复），因此间隔从下一关之后算起。
+# 本关练习过的单词进入下一个盒子，没有练习的单词回到第 0 个盒子；走完所有盒子视为已掌握
+REVIEW_INTERVALS = (1, 2, 4, 8, 16)
+MASTERED = 0xFFFF  # 已掌握单词的复习关数，不再安排复习
+
+_HEADER = struct.Struct("<HHBB")  # 当前关数、下一个新单词的位置、本关单词数、下一关单词数
+_WORD = struct.Struct("<H")  # 本关与下一关单词的编号
+_ENTRY = struct.Struct("<HBH")  # 已学单词的编号、所在盒子、下次复习的关数
+
+
+class WordBank:
+    """
+    词库：按文件中的顺序（由易到难）排列的单词列表，并按单词建立索引。
+    单词的编号即其在文件中的位置，学习进度按编号保存，因此新增单词应追加到文件末尾。
+    """
+    def __init__(self, entries):
+        for entry in entries:
+            if not entry.get("word") or not entry.get("meaning"):
+                raise ValueError("词库中的每个单词都需要 word 和 meaning!")
+        self.entries = list(entries)
+        self.index = {entry["word"].lower(): i for i, entry in enumerate(self.entries)}
+
+    @classmethod
+    def from_assets(cls, rel_path=WORD_BANK_FILE):
+        return cls(asset_store.get(rel_path))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, word_id):
+        return self.entries[word_id]
+
+
+class LearnerProgress:
+    """
+    一个学习者的词汇进度：当前关数、下一个新单词的位置、本关与下一关的单词，以及已学单词的复习计划。
+    """
+    __slots__ = ("level", "cursor", "current", "upcoming", "schedule")
+
+    def __init__(self, level=0, cursor=0, current=None, upcoming=None, schedule=None):
+        self.level = level
+        self.cursor = cursor
+        self.current = current if current is not None else []  # 本关单词的编号
+        self.upcoming = upcoming if upcoming is not None else []  # 已确定的下一关单词的编号
+        self.schedule = schedule if schedule is not None else {}  # 单词编号 -> (盒子, 下次复习的关数)
+
+    def to_bytes(self):
+        """
+        编码为紧凑的二进制格式：每个已学单词占 5 个字节。
+        """
+        parts = [_HEADER.pack(self.level, self.cursor, len(self.current), len(self.upcoming))]
+        parts += [_WORD.pack(word_id) for word_id in self.current + self.upcoming]
+        parts += [_ENTRY.pack(word_id, box, due) for word_id, (box, due) in self.schedule.items()]
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        level, cursor, current_count, upcoming_count = _HEADER.unpack_from(data, 0)
+        offset = _HEADER.size
+        words = [_WORD.unpack_from(data, offset + i * _WORD.size)[0] for i in range(current_count + upcoming_count)]
+        offset += len(words) * _WORD.size
+        schedule = {word_id: (box, due) for word_id, box, due in _ENTRY.iter_unpack(data[offset:])}
+        return cls(level, cursor, words[:current_count], words[current_count:], schedule)
+
+
+class VocabProgressStore:
+    """
+    学习进度存储。内存中按 LRU 保存编码后的进度，指定数据库文件时同时写入 SQLite，重启后仍可恢复。
+    与其他工作进程共用数据库时（shared），读取总是以数据库为准。
+    数据库中超过 retention 秒未更新的进度在保存时每隔 sweep_interval 秒批量删除。
+    """
+    def __init__(self, max_learners=1000, db_path=None, shared=False, retention=None, sweep_interval=600.0):
+        self.max_learners = max_learners
+        self.shared = shared and bool(db_path)
+        self.retention = retention  # 进度在最后一次更新后保留的时间（秒），None 表示永久保留
+        self.sweep_interval = sweep_interval
+        self._next_sweep = 0.0
+        self._cache = OrderedDict()  # 学习者 -> 编码后的进度
+        self._lock = threading.Lock()
+        self._conn = None
+        if db_path:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=10.0)
+            with self._conn:
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS vocab_progress "
+                    "(learner TEXT PRIMARY KEY, progress BLOB NOT NULL, last_access REAL)"
+                )
+                columns = [row[1] for row in self._conn.execute("PRAGMA table_info(vocab_progress)")]
+                if "last_access" not in columns:
+                    # 旧版本的数据库没有 last_access 列，已有的进度从现在开始计算保留时间
+                    self._conn.execute("ALTER TABLE vocab_progress ADD COLUMN last_access REAL")
+                self._conn.execute("UPDATE vocab_progress SET last_access = ? WHERE last_access IS NULL", (time.time(),))
+
+    @classmethod
+    def from_env(cls):
+        """
+        根据环境变量创建进度存储：LM_HISTORY_BACKEND 为 sqlite 时，进度保存在 LM_HISTORY_DB 指定的数据库中，
+        与会话历史一样在 LM_HISTORY_RETENTION 秒未更新后删除。
+        """
+        db_path = None
+        if env_str("LM_HISTORY_BACKEND", "memory") == "sqlite":
+            db_path = env_str("LM_HISTORY_DB", "data/history.db")
+        retention = env_float("LM_HISTORY_RETENTION", 7 * 86400.0)
+        return cls(
+            max_learners=max(1, env_int("LM_MAX_SESSIONS", 1000)),
+            db_path=db_path,
+            shared=shared_state(),
+            retention=retention if retention > 0 else None,
+        )
+
+    def get(self, learner):
+        with self._lock:
+            data = None if self.shared else self._cache.get(learner)
+            if data is not None:
+                self._cache.move_to_end(learner)
+            elif self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT progress FROM vocab_progress WHERE learner = ?", (learner,)
+                ).fetchone()
+                data = row[0] if row else None
+        return LearnerProgress.from_bytes(data) if data else LearnerProgress()
+
+    def save(self, learner, progress):
+        data = progress.to_bytes()
+        with self._lock:
+            self._cache[learner] = data
+            self._cache.move_to_end(learner)
+            while len(self._cache) > self.max_learners:
+                self._cache.popitem(last=False)
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO vocab_progress (learner, progress, last_access) VALUES (?, ?, ?)",
+                        (learner, data, time.time()),
+                    )
+                    if self.retention is not None and time.monotonic() >= self._next_sweep:
+                        self._next_sweep = time.monotonic() + self.sweep_interval
+                        removed = self._conn.execute(
+                            "DELETE FROM vocab_progress WHERE last_access < ?", (time.time() - self.retention,)
+                        ).rowcount
+                        if removed:
+                            LOG.info(f"[VocabProgressStore] 已删除 {removed} 个超过保留时间的学习进度")
+
+    def stats(self):
+        with self._lock:
+            return {"learners": len(self._cache), "bytes": sum(len(data) for data in self._cache.values())}
+
+
+# 以辅音加 y 结尾的单词变形时 y 变为 i 后可接的词尾，例如 studies、studied、happier、happily
+_Y_TO_I_SUFFIXES = ("es", "ed", "er", "est", "ly", "ness")
+
+
+def practiced(word, tokens):
+    """
+    判断学习者是否在回答中使用了某个单词（包括常见的词形变化，例如 innovates、innovating、innovated、studies、studied）。
+    """
+    stem = word.lower()
+    if len(stem) > 4 and stem.endswith("e"):
+        stem = stem[:-1]
+    root = None
+    if len(stem) > 2 and stem.endswith("y") and stem[-2] not in "aeiou":
+        root = stem[:-1] + "i"
+    return any(
+        token.startswith(stem) or (root is not None and token.startswith(root) and token[len(root):] in _Y_TO_I_SUFFIXES)
+        for token in tokens
+    )
+
+
+class VocabEngine:
+    """
+    词汇学习引擎：从词库中为每一关挑选单词，并按学习者在对话中的练习情况安排间隔复习。
+    单词由引擎挑选后写入每一关的开场消息，模型只负责讲解单词和设计对话练习。
+    """
+    def __init__(self, store=None, bank_file=WORD_BANK_FILE, batch_size=5, max_reviews=2):
+        self.store = store if store is not None else VocabProgressStore()
+        self.bank_file = bank_file
+        self.batch_size = batch_size  # 每关的单词数
+        self.max_reviews = max_reviews  # 每关最多安排的复习单词数，其余为新单词
+        self.bank = WordBank.from_assets(bank_file)
+        # 读取、修改、保存进度需要整体加锁，否则同一学习者并发的两次更新（例如两个标签页同时开始新关）会丢失其中之一
+        self._update_lock = threading.RLock()
+        asset_store.subscribe(bank_file, self.reload_bank)  # 词库被修改时自动重新加载
+
+    @classmethod
+    def from_env(cls):
+        """
+        根据环境变量创建词汇学习引擎：LM_VOCAB_BATCH_SIZE、LM_VOCAB_MAX_REVIEWS。
+        """
+        return cls(
+            store=VocabProgressStore.from_env(),
+            batch_size=max(1, env_int("LM_VOCAB_BATCH_SIZE", 5)),
+            max_reviews=max(0, env_int("LM_VOCAB_MAX_REVIEWS", 2)),
+        )
+
+    def reload_bank(self, rel_path=None):
+        try:
+            self.bank = WordBank.from_assets(self.bank_file)
+        except (FileNotFoundError, ValueError) as e:
+            LOG.error(f"[VocabEngine] 重新加载词库失败，继续使用旧版本：{e}")
+            return
+        LOG.info(f"[VocabEngine] 已重新加载词库，共 {len(self.bank)} 个单词")
+
+    def _select(self, progress, level, exclude=()):
+        """
+        挑选第 level 关的单词：先选到期的复习单词（最早到期的优先），再按词库顺序补充新单词；
+        词库学完后用最早到期的单词补足。exclude 中的单词（本关的单词）不会被选中。
+        """
+        bank_size = len(self.bank)
+        schedule = {
+            word_id: entry for word_id, entry in progress.schedule.items()
+            if word_id < bank_size and word_id not in exclude
+        }
+        due = sorted(
+            (entry[1], word_id) for word_id, entry in schedule.items()
+            if entry[1] <= level
+        )
+        batch = [word_id for _, word_id in due[:self.max_reviews]]
+
+        while len(batch) < self.batch_size and progress.cursor < bank_size:
+            if progress.cursor not in progress.schedule and progress.cursor not in exclude:
+                batch.append(progress.cursor)
+            progress.cursor += 1
+
+        if len(batch) < self.batch_size:
+            upcoming = sorted(
+                (entry[1], word_id) for word_id, entry in schedule.items()
+                if entry[1] != MASTERED and word_id not in batch
+            )
+            batch += [word_id for _, word_id in upcoming[:self.batch_size - len(batch)]]
+        return batch
+
+    def finish_level(self, learner, practiced_text):
+        """
+        结束当前关：根据学习者的回答更新本关单词的复习计划。
+
+        参数:
+            learner (str): 学习者标识
+            practiced_text (str): 学习者在本关中发送的全部消息
+        """
+        tokens = re.findall(r"[a-z]+", practiced_text.lower())
+        with self._update_lock:
+            progress = self.store.get(learner)
+            if not progress.current:
+                return
+            for word_id in progress.current:
+                if word_id >= len(self.bank):
+                    continue
+                box, _ = progress.schedule.get(word_id, (0, 0))
+                box = box + 1 if practiced(self.bank[word_id]["word"], tokens) else 0
+                due = MASTERED if box >= len(REVIEW_INTERVALS) else min(progress.level + 1 + REVIEW_INTERVALS[box], MASTERED - 1)
+                progress.schedule[word_id] = (box, due)
+            progress.level += 1
+            progress.current = []
+            self.store.save(learner, progress)
+
+    def start_level(self, learner):
+        """
+        开始新的一关：使用上一关开始时确定的单词（首关时现场挑选），并确定下一关的单词。
+
+        返回:
+            list: 本关的单词条目
+        """
+        with self._update_lock:
+            progress = self.store.get(learner)
+            progress.current = [word_id for word_id in progress.upcoming if word_id < len(self.bank)]
+            if not progress.current:
+                progress.current = self._select(progress, progress.level)
+            progress.upcoming = self._select(progress, progress.level + 1, exclude=progress.current)
+            self.store.save(learner, progress)
+        return self.current_words(learner, progress)
+
+    def current_words(self, learner, progress=None):
+        """
+        返回学习者本关的单词条目，每个条目附带 review 字段表示是否为复习单词。
+        """
+        progress = progress if progress is not None else self.store.get(learner)
+        return self._entries(progress, progress.current)
+
+    def upcoming_words(self, learner):
+        """
+        返回学习者下一关已确定的单词条目。
+        """
+        progress = self.store.get(learner)
+        return self._entries(progress, progress.upcoming)
+
+    def _entries(self, progress, word_ids):
+        return [
+            dict(self.bank[word_id], review=word_id in progress.schedule)
+            for word_id in word_ids if word_id < len(self.bank)
+        ]
+
+    def level_message(self, learner):
+        """
+        生成本关的开场消息，列出引擎挑选的单词，由模型据此讲解单词并开始对话练习。
+        同一批单词的开场消息完全相同，因此新学习者的首关可以命中回复缓存。
+        """
+        with self._update_lock:  # 首次进入时避免并发的请求各自开始一关
+            words = self.current_words(learner)
+            if not words:
+                words = self.start_level(learner)
+        return self.format_level_message(words)
+
+    @staticmethod
+    def format_level_message(words):
+        lines = [f"Let's do it! Today's {len(words)} words:"]
+        for i, entry in enumerate(words, 1):
+            note = "，复习" if entry["review"] else ""
+            lines.append(f"{i}. {entry['word']} ({entry.get('pos', '')}, {entry['meaning']}{note})")
+        return "\n".join(lines)
+
+
+# 全局词汇学习引擎
+vocab_engine = VocabEngine.from_env()
+
+metrics.gauge(
+    "lm_vocab_progress",
+    "词汇学习进度存储的统计信息",
+    lambda: {(key,): value for key, value in vocab_engine.store.stats().items()},
+    ("stat",),
+)
@@ -0,0 +1,99 @@
+import threading
+import time
+
+from langchain_core.messages import HumanMessage, SystemMessage  # 导入消息类
+
+from .backend_pool import backend_pool  # 导入多后端的后端池
+from .model_registry import model_registry  # 导入共享的模型注册表
+from utils.logger import LOG  # 导入日志工具
+
+
+class ModelWarmer:
+    """
+    模型预热与保活。
+    启动时为每个代理发送一次只生成 1 个 token 的请求：既让 Ollama 加载模型，
+    也让各代理固定的系统提示进入 KV 缓存。之后由后台线程定期检查，
+    对空闲时间超过间隔的模型以同样的请求保活，避免 Ollama 在空闲时卸载模型。
+    """
+    def __init__(self, agents, keepalive_interval=240.0):
+        self.agents = list(agents)
+        self.keepalive_interval = keepalive_interval  # 保活检查间隔（秒），0 表示不保活
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _probe_models(self, config):
+        """
+        获取与代理配置相同、但最多只生成 1 个 token 的模型客户端，用于预热和保活。
+        配置了后端池时，为每个后端各返回一个客户端。
+        """
+        probe = config.replace(max_tokens=1)
+        if backend_pool is None:
+            return [model_registry.get(probe)]
+        return [model_registry.get(probe.replace(base_url=backend.url)) for backend in backend_pool.backends]
+
+    def _distinct_configs(self):
+        configs = []
+        for agent in self.agents:
+            if agent.model_config not in configs:
+                configs.append(agent.model_config)
+        return configs
+
+    def prime(self, agent):
+        """
+        用代理的系统提示发送一次最小请求，加载模型并预填充 KV 缓存。
+        """
+        start_time = time.perf_counter()
+        for model in self._probe_models(agent.model_config):
+            model.invoke([SystemMessage(content=agent.prompt), HumanMessage(content="Hi")])
+        model_registry.touch(agent.model_config)
+        LOG.info(f"[ModelWarmer][{agent.name}] 预热完成，耗时 {time.perf_counter() - start_time:.2f}s")
+
+    def warm_up(self):
+        """
+        依次预热所有代理，单个代理预热失败不影响其他代理。
+
+        返回:
+            bool: 是否全部预热成功
+        """
+        ok = True
+        for agent in self.agents:
+            try:
+                self.prime(agent)
+            except Exception as e:
+                ok = False
+                LOG.error(f"[ModelWarmer][{agent.name}] 预热失败：{e}")
+        return ok
+
+    def ping_idle_models(self):
+        """
+        对空闲时间超过保活间隔的模型，用使用该模型的各个代理的系统提示重新预热。
+        保活请求同样以系统提示开头，不会用无关的提示覆盖 Ollama 中已缓存的系统提示前缀。
+        """
+        idle = [c for c in self._distinct_configs() if model_registry.idle_seconds(c) >= self.keepalive_interval]
+        for agent in self.agents:
+            if agent.model_config not in idle:
+                continue
+            try:
+                self.prime(agent)
+                LOG.debug(f"[ModelWarmer] 已向空闲模型 {agent.model_config.model} 发送 {agent.name} 的保活请求")
+            except Exception as e:
+                LOG.warning(f"[ModelWarmer] 模型 {agent.model_config.model} 保活失败：{e}")
+
+    def _keepalive_loop(self):
+        while not self._stop.wait(self.keepalive_interval):
+            self.ping_idle_models()
+
+    def start_keepalive(self):
+        """
+        启动后台保活线程。
+        """
+        if self.keepalive_interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._keepalive_loop, name="model-keepalive", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        停止后台保活线程。
+        """
+        self._stop.set()
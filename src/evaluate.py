@@ -0,0 +1,281 @@
+"""
+离线评测：用脚本化的学习者对话批量回放各个代理，用于在上线前检验提示词的修改。
+
+对话脚本位于 content/eval/<代理名称>.json，每个文件是对话列表：
+    [{"id": "standard_checkin", "turns": ["Hi, I have a reservation ...", ...]}, ...]
+
+每完成一段对话，就把完整的对话记录追加写入 JSONL 文件；再次运行时跳过已成功完成的对话，
+因此中断后可以直接重新执行同一条命令继续。记录按提示词内容的哈希区分，修改提示词后会重新评测。
+
+示例：
+    python src/evaluate.py --output evals/run.jsonl --concurrency 4
+    python src/evaluate.py --targets job_interview hotel_checkin --repeat 3 --report evals/report.json
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+from contextlib import aclosing
+from datetime import datetime, timezone
+
+from utils.stats import percentile  # 与压测共用的百分位数计算
+
+EVAL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "content", "eval")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="LanguageMentor 离线评测")
+    parser.add_argument("--targets", nargs="*", help="要评测的代理（conversation、vocab_study 或场景名称），默认全部")
+    parser.add_argument("--eval-dir", default=EVAL_DIR, help="对话脚本目录")
+    parser.add_argument("--output", default="evals/transcripts.jsonl", help="对话记录输出文件（JSONL，可续跑）")
+    parser.add_argument("--report", help="将统计报告写入 JSON 文件")
+    parser.add_argument("--concurrency", type=int, default=4, help="同时进行的对话数")
+    parser.add_argument("--repeat", type=int, default=1, help="每段对话重复的次数，用于观察回复的稳定性")
+    parser.add_argument("--use-cache", action="store_true", help="允许使用开场轮次的回复缓存（默认关闭，保证每轮都真实生成）")
+    return parser.parse_args(argv)
+
+
+def load_dialogues(eval_dir, targets=None):
+    """
+    读取对话脚本。
+
+    返回:
+        dict: 代理名称 -> 对话列表
+    """
+    dialogues = {}
+    for filename in sorted(os.listdir(eval_dir)):
+        name, ext = os.path.splitext(filename)
+        if ext != ".json" or (targets and name not in targets):
+            continue
+        with open(os.path.join(eval_dir, filename), "r", encoding="utf-8") as file:
+            items = json.load(file)
+        for item in items:
+            if not item.get("id") or not item.get("turns"):
+                raise ValueError(f"对话脚本 {filename} 中的每段对话都需要 id 和 turns!")
+        dialogues[name] = items
+    missing = set(targets or ()) - set(dialogues)
+    if missing:
+        raise ValueError(f"找不到以下代理的对话脚本：{', '.join(sorted(missing))}")
+    return dialogues
+
+
+def create_agent(name):
+    """
+    根据名称创建代理：conversation、vocab_study 或场景名称。
+    """
+    from agents.conversation_agent import ConversationAgent
+    from agents.scenario_agent import ScenarioAgent
+    from agents.vocab_agent import VocabAgent
+
+    if name == "conversation":
+        return ConversationAgent()
+    if name == "vocab_study":
+        return VocabAgent()
+    return ScenarioAgent(name)
+
+
+def prompt_hash(agent):
+    return hashlib.sha256(agent.prompt.encode("utf-8")).hexdigest()[:12]
+
+
+def record_key(target, prompt_sha, dialogue_id, repeat):
+    return f"{target}/{prompt_sha}/{dialogue_id}#{repeat}"
+
+
+def load_finished(path):
+    """
+    读取已有的对话记录，返回已成功完成的记录键集合。忽略中断时可能写了一半的最后一行。
+    """
+    finished = set()
+    if not os.path.exists(path):
+        return finished
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("error") is None:
+                finished.add(record["key"])
+    return finished
+
+
+async def run_dialogue(agent, target, dialogue, repeat, key):
+    """
+    回放一段对话，返回完整的对话记录。
+    """
+    from agents.session_history import session_manager
+
+    session_id = key  # 每段对话使用独立的会话
+    transcript = []
+    turns = []
+    record = {
+        "key": key,
+        "target": target,
+        "prompt_sha": key.split("/")[1],
+        "dialogue_id": dialogue["id"],
+        "repeat": repeat,
+        "model": agent.model_config.model,
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "transcript": transcript,
+        "turns": turns,
+        "error": None,
+    }
+    try:
+        script = dialogue["turns"]
+        if target == "vocab_study":
+            await asyncio.to_thread(agent.restart_session, session_id)
+            script = [agent.level_message(session_id)] + script  # 先发送列出本关单词的开场消息
+        elif target != "conversation":
+            transcript.append({"role": "ai", "content": await agent.astart_new_session(session_id)})
+
+        for user_input in script:
+            transcript.append({"role": "human", "content": user_input})
+            eval_stats = {}
+            chunks = []
+            start = time.perf_counter()
+            first = None
+            async with aclosing(agent.astream_with_history(user_input, session_id, eval_stats=eval_stats)) as stream:
+                async for chunk in stream:
+                    if first is None:
+                        first = time.perf_counter()
+                    chunks.append(chunk)
+            reply = "".join(chunks)
+            transcript.append({"role": "ai", "content": reply})
+            turns.append({
+                "latency": time.perf_counter() - start,
+                "ttft": first - start if first else None,
+                "prompt_tokens": eval_stats.get("prompt_eval_count"),
+                "completion_tokens": eval_stats.get("eval_count"),
+                "reply_chars": len(reply),
+                "reply_words": len(reply.split()),
+            })
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        session_manager.drop_client(session_id)  # 评测会话不需要保留
+    return record
+
+
+def describe(values):
+    values = [v for v in values if v is not None]
+    if not values:
+        return None
+    return {
+        "mean": sum(values) / len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "max": max(values),
+    }
+
+
+def build_report(path):
+    """
+    汇总对话记录文件中的所有记录，按代理和提示词版本分组统计。
+    """
+    groups = {}
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            groups.setdefault((record["target"], record["prompt_sha"]), []).append(record)
+
+    report = []
+    for (target, prompt_sha), records in sorted(groups.items()):
+        # 同一对话重复失败后又成功时，只统计最新的记录
+        latest = {}
+        for record in records:
+            latest[record["key"]] = record
+        ok = [r for r in latest.values() if r["error"] is None]
+        turns = [t for r in ok for t in r["turns"]]
+        report.append({
+            "target": target,
+            "prompt_sha": prompt_sha,
+            "dialogues": len(latest),
+            "failed": len(latest) - len(ok),
+            "turns": len(turns),
+            "latency_s": describe([t["latency"] for t in turns]),
+            "ttft_s": describe([t["ttft"] for t in turns]),
+            "prompt_tokens": describe([t["prompt_tokens"] for t in turns]),
+            "completion_tokens": describe([t["completion_tokens"] for t in turns]),
+            "reply_chars": describe([t["reply_chars"] for t in turns]),
+            "reply_words": describe([t["reply_words"] for t in turns]),
+        })
+    return report
+
+
+def print_report(report):
+    def fmt(stats, key, digits=2):
+        value = stats.get(key) if stats else None
+        return "-" if value is None else f"{value:.{digits}f}"
+
+    print(f"{'代理':<20}{'提示词':<14}{'对话':>6}{'失败':>6}{'轮数':>6}"
+          f"{'延迟p50':>10}{'延迟p95':>10}{'首token p50':>12}{'提示tokens':>12}{'生成tokens':>12}{'回复字符':>10}")
+    for row in report:
+        print(f"{row['target']:<20}{row['prompt_sha']:<14}{row['dialogues']:>6}{row['failed']:>6}{row['turns']:>6}"
+              f"{fmt(row['latency_s'], 'p50'):>10}{fmt(row['latency_s'], 'p95'):>10}{fmt(row['ttft_s'], 'p50'):>12}"
+              f"{fmt(row['prompt_tokens'], 'mean', 0):>12}{fmt(row['completion_tokens'], 'mean', 0):>12}"
+              f"{fmt(row['reply_chars'], 'mean', 0):>10}")
+
+
+async def run(args):
+    from utils.logger import LOG
+
+    dialogues = load_dialogues(args.eval_dir, args.targets)
+    finished = load_finished(args.output)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+
+    jobs = []
+    for target, items in dialogues.items():
+        agent = create_agent(target)
+        sha = prompt_hash(agent)
+        for dialogue in items:
+            for repeat in range(args.repeat):
+                key = record_key(target, sha, dialogue["id"], repeat)
+                if key not in finished:
+                    jobs.append((agent, target, dialogue, repeat, key))
+
+    total = sum(len(items) for items in dialogues.values()) * args.repeat
+    LOG.info(f"[Evaluate] 共 {total} 段对话，已完成 {total - len(jobs)} 段，本次运行 {len(jobs)} 段")
+
+    semaphore = asyncio.Semaphore(max(1, args.concurrency))
+    done = 0
+    with open(args.output, "a", encoding="utf-8") as output:
+        async def worker(job):
+            nonlocal done
+            async with semaphore:
+                record = await run_dialogue(*job)
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")  # 每完成一段对话就写入，便于中断后续跑
+            output.flush()
+            done += 1
+            status = "失败：" + record["error"] if record["error"] else "完成"
+            LOG.info(f"[Evaluate] ({done}/{len(jobs)}) {record['key']} {status}")
+
+        await asyncio.gather(*(worker(job) for job in jobs))
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # 评测使用独立的内存会话，默认不使用回复缓存；需要在导入代理之前设置
+    os.environ["LM_HISTORY_BACKEND"] = "memory"
+    if not args.use_cache:
+        os.environ["LM_RESPONSE_CACHE"] = "false"
+
+    asyncio.run(run(args))
+
+    report = build_report(args.output)
+    print_report(report)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+    return 0 if all(row["failed"] == 0 for row in report) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,169 @@
-import gradio as gr
-from tabs.scenario_tab import create_scenario_tab
-from tabs.conversation_tab import create_conversation_tab
-from tabs.vocab_tab import create_vocab_tab
-from utils.logger import LOG
+import argparse
+import sys
+import threading
 
-def main():
+from utils.startup import startup_timer  # 最先导入，从这里开始记录各阶段的启动耗时
+from utils.workers import current_worker_id, is_primary, run_workers, watch_supervisor, worker_count  # 多进程模式，只依赖标准库
+
+# 多进程模式下主进程只运行粘滞代理，在导入界面之前就启动工作进程
+if __name__ == "__main__" and worker_count(sys.argv[1:]) > 1:
+    sys.exit(run_workers(sys.argv[1:], worker_count(sys.argv[1:])))
+
+with startup_timer.phase("import_gradio"):
+    import gradio as gr
+with startup_timer.phase("import_tabs"):
+    # 各 Tab 只在导入时发现代理的名称，代理及其依赖的 langchain 模块在首次使用时才加载
+    from tabs import conversation_tab, scenario_tab, vocab_tab
+    from tabs.scenario_tab import create_scenario_tab
+    from tabs.conversation_tab import create_conversation_tab
+    from tabs.vocab_tab import create_vocab_tab
+    from agents.backend_pool import backend_pool
+    from agents.prefetch import default_prefetcher
+    from utils.asset_store import asset_store
+    from utils.config import env_bool, env_float, env_int
+    from utils.endpoints import create_routes, readiness
+    from utils.logger import LOG
+
+# 用户关闭或刷新页面时，释放该浏览器会话在所有代理下的聊天历史，并取消为其进行的预生成
+def release_session(request: gr.Request):
+    from agents.session_history import session_manager  # 会话存储随代理一起加载
+
+    session_manager.drop_client(request.session_hash)
+    if default_prefetcher is not None:
+        default_prefetcher.cancel_client(request.session_hash)
+    LOG.debug(f"[main] 浏览器会话 {request.session_hash} 已结束，当前会话数 {session_manager.live_sessions}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="LanguageMentor 英语私教")
+    parser.add_argument(
+        "--warmup",
+        action=argparse.BooleanOptionalAction,
+        default=env_bool("LM_WARMUP", False),
+        help="启动时预热模型，并在预热完成后才将 /ready 标记为就绪（环境变量 LM_WARMUP）",
+    )
+    parser.add_argument(
+        "--keepalive-interval",
+        type=float,
+        default=env_float("LM_KEEPALIVE_INTERVAL", 240.0),
+        help="对空闲模型发送保活请求的间隔秒数，0 表示关闭（环境变量 LM_KEEPALIVE_INTERVAL）",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=env_int("LM_WORKERS", 1),
+        help="工作进程数。大于 1 时主进程只运行按会话粘滞的代理，请求由多个工作进程处理，会话历史通过 SQLite 共享（环境变量 LM_WORKERS）",
+    )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="用 cProfile 分析构建界面与加载全部代理的过程，输出各阶段耗时和最耗时的函数后退出，不启动服务",
+    )
+    parser.add_argument(
+        "--profile-output",
+        help="配合 --profile-startup，将 cProfile 的原始结果保存到文件，可用 snakeviz 等工具查看",
+    )
+    return parser.parse_args(argv)
+
+def get_all_agents():
+    # 收集各个 Tab 使用的代理，尚未创建的代理会在这里创建
+    return [
+        *conversation_tab.agents.values(),
+        *vocab_tab.agents.values(),
+        *scenario_tab.agents.values(),
+    ]
+
+def build_app():
     with gr.Blocks(title="LanguageMentor 英语私教") as language_mentor_app:
         create_scenario_tab()
         create_conversation_tab()
         create_vocab_tab()
-    
-    # 启动应用
-    language_mentor_app.launch(share=True, server_name="0.0.0.0")
+        language_mentor_app.unload(release_session)
+    return language_mentor_app
+
+def load_agents(args):
+    """
+    在服务启动后的后台线程中创建所有代理，然后按需预热模型并启动保活；完成前 /ready 返回 503。
+    创建完成前到达的请求会自行创建所需的代理。
+    """
+    readiness.mark_not_ready("loading agents")
+    try:
+        with startup_timer.phase("load_agents"):
+            from agents.warmup import ModelWarmer
+
+            agents = get_all_agents()
+    except Exception as e:
+        LOG.error(f"[main] 后台加载代理失败：{e}")
+        readiness.mark_not_ready(f"loading agents failed: {e}")
+        return
+    LOG.info(f"[main] 已加载 {len(agents)} 个代理，耗时 {startup_timer.phases['load_agents']:.2f}s")
+
+    # 多进程模式下只由 0 号工作进程预热与保活，模型与 KV 缓存在 Ollama 中由所有进程共享
+    warmer = ModelWarmer(agents, keepalive_interval=args.keepalive_interval if is_primary() else 0)
+    if args.warmup and is_primary():
+        readiness.mark_not_ready("warming up")
+        with startup_timer.phase("warmup"):
+            ok = warmer.warm_up()
+        readiness.mark_ready("ready" if ok else "ready (warm-up incomplete)")  # 预热失败不阻止服务，首个请求将承担加载时间
+    else:
+        readiness.mark_ready()
+    warmer.start_keepalive()
+    LOG.info(startup_timer.report("启动完成"))
+
+def profile_startup(args):
+    """
+    分析构建界面与加载全部代理的耗时，打印报告后返回。
+    入口模块顶层的导入发生在解析参数之前，不在 cProfile 的范围内，其耗时见报告中的 import_* 阶段。
+    """
+    import cProfile
+    import pstats
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    with startup_timer.phase("build_ui"):
+        build_app()
+    with startup_timer.phase("load_agents"):
+        get_all_agents()
+    profiler.disable()
+
+    print(startup_timer.report())
+    print()
+    pstats.Stats(profiler).sort_stats("cumulative").print_stats(30)
+    if args.profile_output:
+        profiler.dump_stats(args.profile_output)
+        print(f"cProfile 结果已保存到 {args.profile_output}")
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.workers > 1 and current_worker_id() is None:
+        return run_workers(sys.argv[1:] if argv is None else argv, args.workers)
+    if args.profile_startup:
+        profile_startup(args)
+        return
+
+    with startup_timer.phase("build_ui"):
+        language_mentor_app = build_app()
+
+    # 先启动界面，再在后台线程中加载代理和预热模型；完成前 /ready 返回 503
+    readiness.mark_not_ready("starting")
+    asset_store.start_watching()  # 监视提示词与页面内容的修改，无需重启即可生效
+    if backend_pool is not None:
+        backend_pool.start_health_checks()  # 定期检查各个 Ollama 后端，摘除或恢复节点
+
+    # 启动应用，并挂载 /healthz、/ready、/metrics 运维接口；
+    # 工作进程只监听本机地址（由代理通过 GRADIO_SERVER_NAME/GRADIO_SERVER_PORT 指定），不创建公开链接
+    worker_id = current_worker_id()
+    if worker_id is not None:
+        watch_supervisor()  # 主进程意外退出时随之退出
+    with startup_timer.phase("launch"):
+        language_mentor_app.launch(
+            share=worker_id is None,
+            server_name="0.0.0.0" if worker_id is None else None,
+            app_kwargs={"routes": create_routes()},
+            prevent_thread_lock=True,
+        )
+    LOG.info(startup_timer.report("界面已启动"))
+    threading.Thread(target=load_agents, args=(args,), name="agent-loader", daemon=True).start()
+    language_mentor_app.block_thread()
 
 if __name__ == "__main__":
     main()
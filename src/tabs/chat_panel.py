@@ -0,0 +1,115 @@
+# tabs/chat_panel.py
+
+import gradio as gr
+from utils.config import env_int
+
+# 聊天窗口每页显示的消息数。每轮对话只展示最新一页，更早的消息按需从服务端的会话历史中分页加载，
+# 浏览器不再在每次请求中上传完整的聊天记录，响应的大小也不随会话变长而增长
+CHAT_PAGE_SIZE = max(2, env_int("LM_CHAT_PAGE_SIZE", 40))
+
+def to_chatbot_pairs(messages):
+    # 将会话历史中的消息转换为 Chatbot 组件使用的 (用户消息, AI 消息) 列表
+    from langchain_core.messages import HumanMessage  # 代理创建后才会用到，避免在启动时导入 langchain
+
+    pairs = []
+    for message in messages:
+        if isinstance(message, HumanMessage):
+            pairs.append([message.content, None])
+        elif pairs and pairs[-1][1] is None and pairs[-1][0] is not None:
+            pairs[-1][1] = message.content  # AI 回复与前一条用户消息显示在同一行
+        else:
+            pairs.append([None, message.content])  # 场景的开场白等没有对应用户消息的 AI 消息
+    return [tuple(pair) for pair in pairs]
+
+def latest_page(agent, session_id):
+    # 读取会话最新一页的聊天记录，返回 (起始位置, 聊天记录)
+    start, messages = agent.get_history_page(session_id, limit=CHAT_PAGE_SIZE)
+    return start, to_chatbot_pairs(messages)
+
+def load_earlier(agent, session_id, start):
+    # 在当前显示的聊天记录之前再加载一页，返回 (新的起始位置, 从新起始位置到最新一条的聊天记录)
+    if start is None:
+        start, _ = agent.get_history_page(session_id, limit=CHAT_PAGE_SIZE)
+    new_start = max(0, start - CHAT_PAGE_SIZE)
+    _, messages = agent.get_history_page(session_id, start=new_start)
+    return new_start, to_chatbot_pairs(messages)
+
+def _submit_input(user_input):
+    # 清空输入框并把消息暂存在服务端状态中，随后由对话处理函数读取；同时回到只显示最新一页
+    return "", user_input, None
+
+def create_chat_panel(chatbot, fn, get_agent, additional_inputs=(), submit_btn="发送", clear_fn=None,
+                      clear_btn="清除历史记录"):
+    """
+    创建聊天输入区域，代替 gr.ChatInterface。
+
+    gr.ChatInterface 会在每次发送时把 Chatbot 中的完整聊天记录从浏览器上传到服务端，
+    而聊天历史实际保存在服务端的会话存储中。这里只上传本轮的用户消息，
+    对话处理函数从会话存储中读取最新一页历史并在其后追加本轮回复，流式输出时 Gradio 只推送增量。
+
+    参数:
+        chatbot (gr.Chatbot): 显示聊天记录的组件
+        fn (callable): 对话处理函数，参数为 (用户消息, *additional_inputs, request)，逐次生成 Chatbot 的值
+        get_agent (callable): 参数为 additional_inputs 的值，返回当前使用的代理，没有可用代理时返回 None
+        additional_inputs (tuple): 额外传给对话处理函数的组件
+        submit_btn (str): 发送按钮文本
+        clear_fn (callable, optional): 清除历史的处理函数，参数为 (*additional_inputs, request)，返回 Chatbot 的值
+        clear_btn (str): 清除历史按钮文本
+
+    返回:
+        gr.State: 当前显示的最早一条消息在会话历史中的位置，None 表示只显示最新一页；
+                  切换场景或重新开始会话时应将其重置为 None
+    """
+    additional_inputs = list(additional_inputs)
+    window_start = gr.State(None)  # 保存在服务端，不随请求往返
+    pending_input = gr.State("")
+
+    earlier_btn = gr.Button("加载更早的消息", size="sm")
+    with gr.Row():
+        textbox = gr.Textbox(show_label=False, placeholder="输入消息...", scale=7, container=False, autofocus=True)
+        send_btn = gr.Button(submit_btn, variant="primary", scale=1, min_width=150)
+    if clear_fn is not None:
+        clear_button = gr.Button(clear_btn, variant="secondary", size="sm")
+
+    gr.on(
+        triggers=[textbox.submit, send_btn.click],
+        fn=_submit_input,
+        inputs=textbox,
+        outputs=[textbox, pending_input, window_start],
+        queue=False,
+        show_api=False,
+    ).then(
+        fn=fn,
+        inputs=[pending_input, *additional_inputs],
+        outputs=chatbot,
+        show_api=False,
+    )
+
+    def show_earlier(request: gr.Request, start, *args):  # 额外输入的数量不定，请求对象放在第一个参数
+        agent = get_agent(*args)
+        if agent is None:
+            return gr.skip(), start
+        new_start, history = load_earlier(agent, request.session_hash, start)
+        return history, new_start
+
+    earlier_btn.click(
+        fn=show_earlier,
+        inputs=[window_start, *additional_inputs],
+        outputs=[chatbot, window_start],
+        show_api=False,
+    )
+
+    if clear_fn is not None:
+        clear_button.click(
+            fn=clear_fn,
+            inputs=additional_inputs,
+            outputs=chatbot,
+            show_api=False,
+        ).then(
+            fn=lambda: None,
+            outputs=window_start,
+            queue=False,
+            show_api=False,
+        )
+
+    return window_start
@@ -1,16 +1,49 @@
 # tabs/conversation_tab.py
 
+import asyncio
+from contextlib import aclosing
+
 import gradio as gr
-from agents.conversation_agent import ConversationAgent
+from agents.resilience import MODEL_ERRORS, fallback_message
+from tabs.chat_panel import create_chat_panel, latest_page
 from utils.logger import LOG
+from utils.startup import LazyAgents
+
+def _create_conversation_agent():
+    from agents.conversation_agent import ConversationAgent  # 导入 langchain，首次使用时才加载
+    return ConversationAgent()
+
+# 对话代理在首次使用时才创建，不拖慢启动
+agents = LazyAgents({"conversation": _create_conversation_agent})
 
-# 初始化对话代理
-conversation_agent = ConversationAgent()
+def get_conversation_agent():
+    return agents["conversation"]
 
-def handle_conversation(user_input, chat_history):
-    bot_message = conversation_agent.chat_with_history(user_input)
-    LOG.info(f"[Conversation ChatBot]: {bot_message}")
-    return bot_message
+async def handle_conversation(user_input, request: gr.Request):
+    if not user_input:
+        yield gr.skip()  # 忽略空消息
+        return
+    conversation_agent = await asyncio.to_thread(get_conversation_agent)  # 首次使用时在线程中创建代理，不阻塞事件循环
+    # 聊天记录从服务端的会话历史中读取最新一页，浏览器只上传本轮的用户消息
+    _, history = await asyncio.to_thread(latest_page, conversation_agent, request.session_hash)
+    bot_message = ""
+    yield history + [(user_input, bot_message)]  # 先展示用户消息
+    try:
+        # 以浏览器会话标识区分不同用户的聊天历史，逐段接收模型输出
+        async with aclosing(conversation_agent.astream_with_history(user_input, request.session_hash)) as stream:  # 用户关闭页面时一并关闭发往模型的请求
+            async for chunk in stream:
+                bot_message += chunk
+                yield history + [(user_input, bot_message)]  # 将已生成的内容实时推送到界面，Gradio 只发送增量
+    except MODEL_ERRORS as e:
+        LOG.warning(f"[Conversation ChatBot]: 模型请求失败：{e}")
+        yield history + [(user_input, fallback_message(e))]  # 过载、超时或模型服务不可用时返回兜底提示
+        return
+    LOG.opt(lazy=True).debug("[Conversation ChatBot]: {}", lambda: bot_message)
+
+# 清除服务端保存的对话历史
+def clear_conversation(request: gr.Request):
+    get_conversation_agent().clear_history(request.session_hash)
+    return []
 
 def create_conversation_tab():
     with gr.Tab("对话"):
@@ -20,18 +53,11 @@ def create_conversation_tab():
             height=800,  # 聊天窗口高度
         )
 
-        # 处理用户对话的函数
-        def handle_conversation(user_input, chat_history):
-            bot_message = conversation_agent.chat_with_history(user_input)  # 获取聊天机器人的回复
-            LOG.info(f"[ChatBot]: {bot_message}")  # 记录聊天机器人的回复
-            return bot_message  # 返回机器人的回复
-
-
-        gr.ChatInterface(
-            fn=handle_conversation,  # 处理对话的函数
+        create_chat_panel(
             chatbot=conversation_chatbot,  # 聊天机器人组件
-            retry_btn=None,  # 不显示重试按钮
-            undo_btn=None,  # 不显示撤销按钮
+            fn=handle_conversation,  # 处理对话的函数
+            get_agent=get_conversation_agent,  # 分页加载历史时使用的代理
+            clear_fn=clear_conversation,  # 清除历史记录
             clear_btn="清除历史记录",  # 清除历史记录按钮文本
             submit_btn="发送",  # 发送按钮文本
-        )
\ No newline at end of file
+        )
@@ -1,39 +1,102 @@
 # tabs/scenario_tab.py
 
+import asyncio
+from contextlib import aclosing
+
 import gradio as gr
-from agents.scenario_agent import ScenarioAgent
+from agents.prefetch import default_prefetcher
+from agents.resilience import MODEL_ERRORS, fallback_message
+from tabs.chat_panel import create_chat_panel, latest_page
+from utils.asset_store import asset_store
 from utils.logger import LOG
+from utils.startup import LazyAgents
 
-# 初始化场景代理
-agents = {
-    "job_interview": ScenarioAgent("job_interview"),
-    "hotel_checkin": ScenarioAgent("hotel_checkin"),
-    # 可以根据需要添加更多场景代理
+# 场景在界面上显示的名称，同时决定单选框中的顺序；未列出的场景使用场景名称
+SCENARIO_LABELS = {
+    "job_interview": "求职面试",
+    "hotel_checkin": "酒店入住",
+    "salary_negotiation": "薪资谈判",
+    "renting": "租房",
 }
 
+def discover_scenarios():
+    # 自动发现同时具有提示词、初始消息和页面介绍的场景，按 SCENARIO_LABELS 的顺序排列
+    found = asset_store.scenarios()
+    ordered = [name for name in SCENARIO_LABELS if name in found]
+    return ordered + [name for name in found if name not in SCENARIO_LABELS]
+
+def _scenario_agent_factory(scenario):
+    def create():
+        from agents.scenario_agent import ScenarioAgent  # 导入 langchain，首次使用时才加载
+        return ScenarioAgent(scenario)
+    return create
+
+# 场景代理，新增场景只需添加对应的提示词、初始消息和页面介绍文件。
+# 启动时只发现场景名称用于构建界面，代理在首次使用时（或服务启动后由后台线程）才创建
+agents = LazyAgents({scenario: _scenario_agent_factory(scenario) for scenario in discover_scenarios()})
+
 def get_page_desc(scenario):
     try:
-        with open(f"content/page/{scenario}.md", "r", encoding="utf-8") as file:
-            scenario_intro = file.read().strip()
-        return scenario_intro
+        return asset_store.get(f"content/page/{scenario}.md")  # 从内存中的资源仓库读取
     except FileNotFoundError:
         LOG.error(f"场景介绍文件 content/page/{scenario}.md 未找到！")
         return "场景介绍文件未找到。"
     
 # 获取场景介绍并启动新会话的函数
-def start_new_scenario_chatbot(scenario):
-    initial_ai_message = agents[scenario].start_new_session()  # 启动新会话并获取初始AI消息
+async def start_new_scenario_chatbot(scenario, session_id):
+    agent = await asyncio.to_thread(agents.get, scenario)  # 首次使用时在线程中创建代理，不阻塞事件循环
+    await agent.astart_new_session(session_id)  # 启动新会话，首次进入时写入初始AI消息
+    _, history = await asyncio.to_thread(latest_page, agent, session_id)  # 回到已有的场景时显示最新一页聊天记录
 
     return gr.Chatbot(
-        value=[(None, initial_ai_message)],  # 设置聊天机器人的初始消息
+        value=history,  # 设置聊天机器人的初始消息
         height=600,  # 聊天窗口高度
     )
 
+# 预热学习者接下来最可能切换到的场景（单选框中的下一个场景），需通过 LM_PREFETCH 启用
+def prewarm_next_scenario(scenario, session_id):
+    if default_prefetcher is None:
+        return  # 未启用时不必为此创建下一个场景的代理
+    names = list(agents)
+    next_scenario = names[(names.index(scenario) + 1) % len(names)]
+    if next_scenario != scenario:
+        agents[next_scenario].prewarm_opening(session_id)
+
+# 切换场景时更新场景介绍并启动新会话，聊天窗口回到只显示最新一页
+async def change_scenario(scenario, request: gr.Request):
+    chatbot = await start_new_scenario_chatbot(scenario, request.session_hash)
+    await asyncio.to_thread(prewarm_next_scenario, scenario, request.session_hash)
+    return get_page_desc(scenario), chatbot, None
+
+# 清除当前场景的聊天历史，并重新开始该场景
+async def clear_scenario(scenario, request: gr.Request):
+    if scenario not in agents:
+        return []
+    agent = await asyncio.to_thread(agents.get, scenario)
+    await asyncio.to_thread(agent.clear_history, request.session_hash)
+    return await start_new_scenario_chatbot(scenario, request.session_hash)
+
 # 场景代理处理函数，根据选择的场景调用相应的代理
-def handle_scenario(user_input, chat_history, scenario):
-    bot_message = agents[scenario].chat_with_history(user_input)  # 获取场景代理的回复
-    LOG.info(f"[ChatBot]: {bot_message}")  # 记录场景代理的回复
-    return bot_message  # 返回场景代理的回复
+async def handle_scenario(user_input, scenario, request: gr.Request):
+    if not user_input or scenario not in agents:
+        yield gr.skip()  # 忽略空消息与未选择场景时的输入
+        return
+    agent = await asyncio.to_thread(agents.get, scenario)  # 首次使用时在线程中创建代理，不阻塞事件循环
+    # 聊天记录从服务端的会话历史中读取最新一页，浏览器只上传本轮的用户消息
+    _, history = await asyncio.to_thread(latest_page, agent, request.session_hash)
+    bot_message = ""
+    yield history + [(user_input, bot_message)]  # 先展示用户消息
+    try:
+        # 以浏览器会话标识区分不同用户的聊天历史，流式获取场景代理的回复
+        async with aclosing(agent.astream_with_history(user_input, request.session_hash)) as stream:  # 用户关闭页面时一并关闭发往模型的请求
+            async for chunk in stream:
+                bot_message += chunk
+                yield history + [(user_input, bot_message)]  # 将已生成的内容实时推送到界面，Gradio 只发送增量
+    except MODEL_ERRORS as e:
+        LOG.warning(f"[ChatBot]: 模型请求失败：{e}")
+        yield history + [(user_input, fallback_message(e))]  # 过载、超时或模型服务不可用时返回兜底提示
+        return
+    LOG.opt(lazy=True).debug("[ChatBot]: {}", lambda: bot_message)  # 记录场景代理的回复
 
 def create_scenario_tab():
     with gr.Tab("场景"):  # 场景标签
@@ -41,12 +104,7 @@ def create_scenario_tab():
 
         # 创建单选框组件
         scenario_radio = gr.Radio(
-            choices=[
-                ("求职面试", "job_interview"),  # 求职面试选项
-                ("酒店入住", "hotel_checkin"),  # 酒店入住选项
-                # ("薪资谈判", "salary_negotiation"),  # 薪资谈判选项（注释掉）
-                # ("租房", "renting")  # 租房选项（注释掉）
-            ], 
+            choices=[(SCENARIO_LABELS.get(scenario, scenario), scenario) for scenario in agents],  # 自动发现的场景
             label="场景"  # 单选框标签
         )
 
@@ -56,20 +114,20 @@ def create_scenario_tab():
             height=600,  # 聊天窗口高度
         )
 
-        # 更新场景介绍并在场景变化时启动新会话
-        scenario_radio.change(
-            fn=lambda s: (get_page_desc(s), start_new_scenario_chatbot(s)),  # 更新场景介绍和聊天机器人
-            inputs=scenario_radio,  # 输入为选择的场景
-            outputs=[scenario_intro, scenario_chatbot],  # 输出为场景介绍和聊天机器人组件
-        )
-
         # 场景聊天界面
-        gr.ChatInterface(
-            fn=handle_scenario,  # 处理场景聊天的函数
+        window_start = create_chat_panel(
             chatbot=scenario_chatbot,  # 聊天机器人组件
-            additional_inputs=scenario_radio,  # 额外输入为场景选择
-            retry_btn=None,  # 不显示重试按钮
-            undo_btn=None,  # 不显示撤销按钮
+            fn=handle_scenario,  # 处理场景聊天的函数
+            get_agent=agents.get,  # 根据选择的场景获取代理，用于分页加载历史
+            additional_inputs=[scenario_radio],  # 额外输入为场景选择
+            clear_fn=clear_scenario,  # 清除历史记录并重新开始场景
             clear_btn="清除历史记录",  # 清除历史记录按钮文本
             submit_btn="发送",  # 发送按钮文本
         )
+
+        # 更新场景介绍并在场景变化时启动新会话
+        scenario_radio.change(
+            fn=change_scenario,  # 更新场景介绍和聊天机器人
+            inputs=scenario_radio,  # 输入为选择的场景
+            outputs=[scenario_intro, scenario_chatbot, window_start],  # 输出为场景介绍、聊天机器人组件和分页位置
+        )
@@ -1,46 +1,100 @@
 # tabs/vocab_tab.py
 
+import asyncio
+from contextlib import aclosing
+
 import gradio as gr
-from agents.vocab_agent import VocabAgent
+from agents.resilience import MODEL_ERRORS, fallback_message
+from tabs.chat_panel import create_chat_panel, latest_page
+from utils.asset_store import asset_store
 from utils.logger import LOG
+from utils.startup import LazyAgents
+
+def _create_vocab_agent():
+    from agents.vocab_agent import VocabAgent  # 导入 langchain 与词库，首次使用时才加载
+    return VocabAgent()
+
+# 词汇代理负责管理词汇学习会话，在首次使用时才创建，不拖慢启动
+agents = LazyAgents({"vocab_study": _create_vocab_agent})
 
-# 初始化词汇代理，负责管理词汇学习会话
-vocab_agent = VocabAgent()
+def get_vocab_agent():
+    return agents["vocab_study"]
 
 # 定义功能名称为“vocab_study”，表示词汇学习模块
 feature = "vocab_study"
 
-# 获取页面描述，从指定的 markdown 文件中读取介绍内容
+# 在浏览器的 localStorage 中读取（首次访问时生成）学习者标识。浏览器会话标识每次打开页面都不同，
+# 词汇学习进度按这个标识保存，刷新页面或重新打开后仍能继续之前的复习计划
+LEARNER_ID_JS = """
+() => {
+    let id = localStorage.getItem("lm_learner_id");
+    if (!id) {
+        id = window.crypto && crypto.randomUUID
+            ? crypto.randomUUID()
+            : Date.now().toString(16) + "-" + Math.random().toString(16).slice(2);
+        localStorage.setItem("lm_learner_id", id);
+    }
+    return id;
+}
+"""
+
+# 获取页面描述，从资源仓库中读取 markdown 介绍内容
 def get_page_desc(feature):
     try:
-        # 打开指定的 markdown 文件来读取词汇学习介绍
-        with open(f"content/page/{feature}.md", "r", encoding="utf-8") as file:
-            scenario_intro = file.read().strip()  # 去除多余空白
-        return scenario_intro
+        return asset_store.get(f"content/page/{feature}.md")
     except FileNotFoundError:
         # 如果找不到文件，记录错误并返回默认消息
         LOG.error(f"词汇学习介绍文件 content/page/{feature}.md 未找到！")
         return "词汇学习介绍文件未找到。"
 
 # 重新启动词汇学习聊天机器人会话
-def restart_vocab_study_chatbot():
-    vocab_agent.restart_session()  # 重启会话
+async def restart_vocab_study_chatbot(learner_id, request: gr.Request):
+    session_id = request.session_hash  # 聊天历史以浏览器会话标识区分，学习进度以学习者标识区分
+    vocab_agent = await asyncio.to_thread(get_vocab_agent)
+    await asyncio.to_thread(vocab_agent.restart_session, session_id, learner_id)  # 重启会话，并由词汇学习引擎挑选本关单词
 
-    # 定义初始消息并与词汇代理交互生成机器人的回应
-    _next_round = "Let's do it"
-    bot_message = vocab_agent.chat_with_history(_next_round)
+    # 以列出本关单词的开场消息与词汇代理交互，流式生成机器人的回应
+    _next_round = vocab_agent.level_message(session_id, learner_id)
+    bot_message = ""
+    yield gr.Chatbot(value=[(_next_round, bot_message)], height=800)  # 先展示初始消息
 
-    # 返回一个带有初始消息和机器回复的聊天机器人界面
-    return gr.Chatbot(
-        value=[(_next_round, bot_message)],
-        height=800,  # 设置聊天机器人组件的高度
-    )
+    try:
+        async with aclosing(vocab_agent.astream_with_history(_next_round, session_id)) as stream:
+            async for chunk in stream:
+                bot_message += chunk
+
+                # 返回一个带有初始消息和当前机器回复的聊天机器人界面
+                yield gr.Chatbot(
+                    value=[(_next_round, bot_message)],
+                    height=800,  # 设置聊天机器人组件的高度
+                )
+    except MODEL_ERRORS as e:
+        LOG.warning(f"[Vocab ChatBot]: 模型请求失败：{e}")
+        yield gr.Chatbot(value=[(_next_round, fallback_message(e))], height=800)
+        return
+    vocab_agent.prefetch_next_level(session_id, learner_id)  # 学习者练习本关时，在后台提前生成下一关的开场回复
 
 # 处理用户输入的单词学习消息，并与词汇代理互动获取机器人的响应
-def handle_vocab(user_input, chat_history):
-    bot_message = vocab_agent.chat_with_history(user_input)  # 获取机器回复
-    LOG.info(f"[Vocab ChatBot]: {bot_message}")  # 记录机器人回应信息
-    return bot_message
+async def handle_vocab(user_input, learner_id, request: gr.Request):
+    if not user_input:
+        yield gr.skip()  # 忽略空消息
+        return
+    vocab_agent = await asyncio.to_thread(get_vocab_agent)  # 首次使用时在线程中创建代理，不阻塞事件循环
+    # 聊天记录从服务端的会话历史中读取最新一页，浏览器只上传本轮的用户消息
+    _, history = await asyncio.to_thread(latest_page, vocab_agent, request.session_hash)
+    bot_message = ""
+    yield history + [(user_input, bot_message)]  # 先展示用户消息
+    try:
+        async with aclosing(vocab_agent.astream_with_history(user_input, request.session_hash)) as stream:  # 用户关闭页面时一并关闭发往模型的请求
+            async for chunk in stream:  # 流式获取机器回复
+                bot_message += chunk
+                yield history + [(user_input, bot_message)]  # 将已生成的内容实时推送到界面，Gradio 只发送增量
+    except MODEL_ERRORS as e:
+        LOG.warning(f"[Vocab ChatBot]: 模型请求失败：{e}")
+        yield history + [(user_input, fallback_message(e))]  # 过载、超时或模型服务不可用时返回兜底提示
+        return
+    LOG.opt(lazy=True).debug("[Vocab ChatBot]: {}", lambda: bot_message)  # 记录机器人回应信息
+    vocab_agent.prefetch_next_level(request.session_hash, learner_id)  # 之前因模型繁忙未能预生成时再次尝试
 
 # 创建词汇学习的 Tab 界面
 def create_vocab_tab():
@@ -60,19 +114,29 @@ def create_vocab_tab():
         # 创建一个按钮，用于重置词汇学习状态，值为“下一关”
         restart_btn = gr.ClearButton(value="下一关")
 
-        # 当用户点击按钮时，调用 restart_vocab_study_chatbot 函数
-        restart_btn.click(
-            fn=restart_vocab_study_chatbot,
-            inputs=None,
-            outputs=vocab_study_chatbot,
-        )
+        # 学习者标识，由浏览器在点击「下一关」时从 localStorage 中填入
+        learner_id = gr.Textbox(visible=False)
 
-        # 创建聊天接口，包含处理用户消息的函数，并关联聊天机器人组件
-        gr.ChatInterface(
-            fn=handle_vocab,  # 处理用户输入的函数
+        # 创建聊天输入区域，包含处理用户消息的函数，并关联聊天机器人组件
+        window_start = create_chat_panel(
             chatbot=vocab_study_chatbot,  # 关联的聊天机器人组件
-            retry_btn=None,  # 不显示重试按钮
-            undo_btn=None,  # 不显示撤销按钮
-            clear_btn=None,  # 学习下一批新单词按钮
+            fn=handle_vocab,  # 处理用户输入的函数
+            get_agent=lambda learner_id: get_vocab_agent(),  # 分页加载历史时使用的代理
+            additional_inputs=[learner_id],
             submit_btn="发送",  # 发送按钮的文本
         )
+
+        # 当用户点击按钮时，先在浏览器中读取学习者标识，再调用 restart_vocab_study_chatbot 函数，聊天窗口回到只显示最新一页
+        restart_btn.click(
+            fn=None,
+            outputs=learner_id,
+            js=LEARNER_ID_JS,
+        ).then(
+            fn=lambda: None,
+            outputs=window_start,
+            queue=False,
+        ).then(
+            fn=restart_vocab_study_chatbot,
+            inputs=learner_id,
+            outputs=vocab_study_chatbot,
+        )
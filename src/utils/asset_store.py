@@ -0,0 +1,165 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+from utils.config import env_float  # 导入环境变量配置工具
+from utils.logger import LOG  # 导入日志工具
+
+# 项目根目录（src 的上一级），资源路径都相对于它解析，不依赖当前工作目录
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class AssetStore:
+    """
+    提示词与页面内容的资源仓库。
+    启动时一次性索引 prompts/、content/intro/、content/page/ 和 content/vocab/ 下的文件并缓存在内存中，
+    之后按修改时间（mtime）定期检查，文件被修改时自动重新加载并通知订阅者。
+    """
+    DIRECTORIES = ("prompts", "content/intro", "content/page", "content/vocab")
+
+    def __init__(self, root=ROOT_DIR, reload_interval=2.0):
+        self.root = root
+        self.reload_interval = reload_interval  # 检查文件变化的间隔（秒），0 表示不自动重新加载
+        self._assets = {}  # 相对路径 -> (内容或解析异常, mtime)
+        self._listeners = defaultdict(list)  # 相对路径 -> 回调函数列表
+        self._lock = threading.Lock()
+        self._thread = None
+        self.scan()
+
+    @classmethod
+    def from_env(cls):
+        """
+        根据环境变量创建资源仓库：LM_ASSET_RELOAD_INTERVAL。
+        """
+        return cls(reload_interval=env_float("LM_ASSET_RELOAD_INTERVAL", 2.0))
+
+    def _iter_files(self):
+        for directory in self.DIRECTORIES:
+            full_dir = os.path.join(self.root, directory)
+            if not os.path.isdir(full_dir):
+                continue
+            for filename in sorted(os.listdir(full_dir)):
+                full_path = os.path.join(full_dir, filename)
+                if os.path.isfile(full_path):
+                    yield f"{directory}/{filename}", full_path
+
+    @staticmethod
+    def _read(rel_path, full_path):
+        """
+        读取单个资源：JSON 文件解析为对象，其他文件读取为去除首尾空白的文本。
+        解析失败时返回异常对象，在读取该资源时再抛出。
+        """
+        with open(full_path, "r", encoding="utf-8") as file:
+            content = file.read()
+        if rel_path.endswith(".json"):
+            try:
+                return json.loads(content)
+            except json.JSONDecodeError:
+                return ValueError(f"资源文件 {rel_path} 包含无效的 JSON!")
+        return content.strip()
+
+    def scan(self):
+        """
+        扫描资源目录，加载新增或修改过的文件，移除已删除的文件，并通知订阅者。
+
+        返回:
+            list: 发生变化的资源相对路径
+        """
+        changed = []
+        seen = set()
+        for rel_path, full_path in self._iter_files():
+            seen.add(rel_path)
+            try:
+                mtime = os.stat(full_path).st_mtime_ns
+                cached = self._assets.get(rel_path)
+                if cached is not None and cached[1] == mtime:
+                    continue
+                value = self._read(rel_path, full_path)
+            except OSError as e:
+                LOG.error(f"[AssetStore] 读取资源 {rel_path} 失败：{e}")
+                continue
+            with self._lock:
+                self._assets[rel_path] = (value, mtime)
+            if cached is not None:
+                changed.append(rel_path)
+
+        for rel_path in [p for p in self._assets if p not in seen]:
+            with self._lock:
+                del self._assets[rel_path]
+            changed.append(rel_path)
+
+        for rel_path in changed:
+            LOG.info(f"[AssetStore] 资源 {rel_path} 已更新")
+            for callback in list(self._listeners.get(rel_path, ())):
+                try:
+                    callback(rel_path)
+                except Exception as e:
+                    LOG.error(f"[AssetStore] 处理资源 {rel_path} 的更新失败：{e}")
+        return changed
+
+    def get(self, rel_path):
+        """
+        读取资源内容。
+
+        参数:
+            rel_path (str): 相对于项目根目录的路径，例如 "prompts/conversation_prompt.txt"
+
+        返回:
+            str | object: 文本内容，或 JSON 解析后的对象
+        """
+        entry = self._assets.get(rel_path.replace(os.sep, "/"))
+        if entry is None:
+            raise FileNotFoundError(f"找不到资源文件 {rel_path}!")
+        if isinstance(entry[0], Exception):
+            raise entry[0]
+        return entry[0]
+
+    def exists(self, rel_path):
+        return rel_path in self._assets
+
+    def subscribe(self, rel_path, callback):
+        """
+        订阅某个资源的变化，资源被修改或删除时调用 callback(rel_path)。
+        """
+        self._listeners[rel_path].append(callback)
+
+    def scenarios(self):
+        """
+        自动发现可用的场景：同时具有提示词、非空的初始消息和非空的页面介绍的场景。
+
+        返回:
+            list: 场景名称列表
+        """
+        names = []
+        for rel_path in sorted(self._assets):
+            if not (rel_path.startswith("prompts/") and rel_path.endswith("_prompt.txt")):
+                continue
+            name = rel_path[len("prompts/"):-len("_prompt.txt")]
+            intro = self._assets.get(f"content/intro/{name}.json", (None,))[0]
+            page = self._assets.get(f"content/page/{name}.md", (None,))[0]
+            if isinstance(intro, list) and intro and isinstance(page, str) and page:
+                names.append(name)
+        return names
+
+    def _watch_loop(self):
+        while True:
+            time.sleep(self.reload_interval)
+            try:
+                self.scan()
+            except Exception as e:
+                LOG.error(f"[AssetStore] 检查资源变化失败：{e}")
+
+    def start_watching(self):
+        """
+        启动后台线程，定期检查资源文件的变化。
+        """
+        if self.reload_interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._watch_loop, name="asset-watcher", daemon=True)
+        self._thread.start()
+
+
+# 全局资源仓库
+asset_store = AssetStore.from_env()
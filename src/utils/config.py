@@ -0,0 +1,57 @@
+import os
+
+# 从环境变量读取配置的辅助函数，所有配置项统一使用 LM_ 前缀
+
+
+def env_str(name, default=None):
+    """
+    读取字符串类型的环境变量。
+    """
+    value = os.environ.get(name)
+    return value if value not in (None, "") else default
+
+
+def env_int(name, default):
+    """
+    读取整数类型的环境变量，无法解析时返回默认值。
+    """
+    try:
+        return int(os.environ[name])
+    except (KeyError, ValueError):
+        return default
+
+
+def env_float(name, default):
+    """
+    读取浮点数类型的环境变量，无法解析时返回默认值。
+    """
+    try:
+        return float(os.environ[name])
+    except (KeyError, ValueError):
+        return default
+
+
+def env_bool(name, default=False):
+    """
+    读取布尔类型的环境变量，支持 1/true/yes/on（不区分大小写）。
+    """
+    value = os.environ.get(name)
+    if value is None or value == "":
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def env_agent(reader, agent_name, key, default):
+    """
+    读取可按代理覆盖的配置：先读取全局的 LM_<KEY>，再用 LM_<代理名称>_<KEY> 覆盖。
+
+    参数:
+        reader (callable): env_str、env_int 等读取函数
+        agent_name (str): 代理名称，为空时只读取全局配置
+        key (str): 配置名，例如 "MODEL"
+        default: 默认值
+    """
+    value = reader(f"LM_{key}", default)
+    if agent_name:
+        value = reader(f"LM_{agent_name.upper()}_{key}", value)
+    return value
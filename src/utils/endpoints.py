@@ -0,0 +1,93 @@
+import hashlib
+import threading
+
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+
+from utils.metrics import metrics  # 导入全局指标注册表
+
+
+class Readiness:
+    """
+    服务就绪状态。负载均衡器通过 /ready 判断是否可以把流量路由到当前实例。
+    """
+    def __init__(self):
+        self._ready = threading.Event()
+        self.detail = "starting"
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def mark_ready(self, detail="ready"):
+        self.detail = detail
+        self._ready.set()
+
+    def mark_not_ready(self, detail):
+        self.detail = detail
+        self._ready.clear()
+
+
+# 全局就绪状态
+readiness = Readiness()
+
+
+async def healthz(request):
+    """
+    存活检查：进程能够响应请求即返回 200。
+    """
+    return JSONResponse({"status": "ok"})
+
+
+async def ready(request):
+    """
+    就绪检查：模型预热完成前返回 503。
+    """
+    return JSONResponse(
+        {"ready": readiness.ready, "detail": readiness.detail},
+        status_code=200 if readiness.ready else 503,
+    )
+
+
+async def metrics_endpoint(request):
+    """
+    以 Prometheus 文本格式导出指标。
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def _mask_session_id(session_id):
+    # 会话ID中的浏览器会话标识可以用来读取该会话的聊天记录，只导出其哈希
+    agent, _, client_id = session_id.rpartition(":")
+    digest = hashlib.sha256(client_id.encode("utf-8")).hexdigest()[:12]
+    return f"{agent}:{digest}" if agent else digest
+
+
+async def session_memory(request):
+    """
+    导出会话存储的内存占用：总量、每个会话的平均值，以及占用最多的若干个会话（?top=N，默认 10）。
+    """
+    from agents.session_history import session_manager  # 会话存储随代理一起加载
+
+    try:
+        top = max(0, int(request.query_params.get("top", 10)))
+    except ValueError:
+        top = 10
+    report = session_manager.memory_report(top=top)
+    report["largest"] = [
+        {"session": _mask_session_id(session_id), "messages": messages, "approx_bytes": approx_bytes}
+        for session_id, messages, approx_bytes in report["largest"]
+    ]
+    return JSONResponse(report)
+
+
+def create_routes():
+    """
+    返回挂载在 Gradio 应用旁边的运维接口路由。
+    """
+    return [
+        Route("/healthz", healthz),
+        Route("/ready", ready),
+        Route("/metrics", metrics_endpoint),
+        Route("/sessions/memory", session_memory),
+    ]
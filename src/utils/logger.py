@@ -1,22 +1,84 @@
 from loguru import logger
+import os
 import sys
 import logging
 
+from utils.config import env_int, env_str  # 导入环境变量配置工具
+
+# 日志配置，均可通过环境变量调整：
+#   LM_LOG_MODE        dev（默认，彩色文本、同步输出）或 production（JSON 行、后台队列写入）
+#   LM_LOG_LEVEL       日志级别，dev 默认 DEBUG，production 默认 INFO
+#   LM_LOG_FILE        日志文件路径（默认为项目根目录下的 logs/app.log），设为 none 时不写文件
+#   LM_LOG_ROTATION    日志文件轮换大小；LM_LOG_RETENTION 保留的轮换文件数
+#   LM_LOG_MAX_PAYLOAD 单条日志消息的最大字符数，超出部分被截断，0 表示不截断
+LOG_MODE = env_str("LM_LOG_MODE", "dev").strip().lower()
+PRODUCTION = LOG_MODE in ("production", "prod")
+LOG_LEVEL = env_str("LM_LOG_LEVEL", "INFO" if PRODUCTION else "DEBUG").strip().upper()
+# 默认的日志文件位于项目根目录下的 logs/，不随启动时的工作目录变化
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+LOG_FILE = env_str("LM_LOG_FILE", os.path.join(PROJECT_ROOT, "logs", "app.log")).strip()
+if LOG_FILE.lower() in ("none", "off", "-"):
+    LOG_FILE = ""
+LOG_ROTATION = env_str("LM_LOG_ROTATION", "1 MB")
+LOG_RETENTION = env_int("LM_LOG_RETENTION", 5)
+MAX_PAYLOAD = env_int("LM_LOG_MAX_PAYLOAD", 2000)
+
 # 定义统一的日志格式字符串
 log_format = "{time:YYYY-MM-DD HH:mm:ss} | {level} | {module}:{function}:{line} - {message}"
 
+
+def truncate(text, limit=None):
+    """
+    截断过长的文本，保留开头部分并注明被省略的字符数。
+
+    参数:
+        text (str): 原始文本
+        limit (int, optional): 最大字符数，默认使用 LM_LOG_MAX_PAYLOAD
+
+    返回:
+        str: 截断后的文本
+    """
+    limit = MAX_PAYLOAD if limit is None else limit
+    text = str(text)
+    if limit <= 0 or len(text) <= limit:
+        return text
+    return f"{text[:limit]}...(省略 {len(text) - limit} 个字符)"
+
+
+def format_messages(messages, limit=200):
+    """
+    将消息列表格式化为简短的多行文本，每条消息截断到 limit 个字符。
+    应配合 LOG.opt(lazy=True) 使用，只在日志级别启用时才会执行。
+    """
+    lines = [f"{getattr(m, 'type', '?')}: {truncate(getattr(m, 'content', m), limit)}" for m in messages]
+    return f"{len(lines)} 条消息\n" + "\n".join(lines) if lines else "0 条消息"
+
+
+def _truncate_patcher(record):
+    # 在写入任何输出之前截断过大的消息，避免单条日志占满磁盘
+    record["message"] = truncate(record["message"])
+
+
 # 配置 Loguru，移除默认的日志配置
 logger.remove()
+logger.configure(patcher=_truncate_patcher)
 
-# 使用统一的日志格式配置标准输出和标准错误输出，支持彩色显示
-logger.add(sys.stdout, level="DEBUG", format=log_format, colorize=True)
-logger.add(sys.stderr, level="ERROR", format=log_format, colorize=True)
+if PRODUCTION:
+    # 生产模式：JSON 行格式，所有输出通过后台队列写入，不阻塞请求处理
+    logger.add(sys.stdout, level=LOG_LEVEL, serialize=True, enqueue=True)
+    if LOG_FILE:
+        logger.add(LOG_FILE, rotation=LOG_ROTATION, retention=LOG_RETENTION, level=LOG_LEVEL, serialize=True, enqueue=True)
+else:
+    # 使用统一的日志格式配置标准输出和标准错误输出，支持彩色显示
+    logger.add(sys.stdout, level=LOG_LEVEL, format=log_format, colorize=True)
+    logger.add(sys.stderr, level="ERROR", format=log_format, colorize=True)
 
-# 同样使用统一的格式配置日志文件输出，设置文件大小为1MB自动轮换
-logger.add("logs/app.log", rotation="1 MB", level="DEBUG", format=log_format)
+    # 同样使用统一的格式配置日志文件输出，设置文件大小为1MB自动轮换
+    if LOG_FILE:
+        logger.add(LOG_FILE, rotation=LOG_ROTATION, retention=LOG_RETENTION, level=LOG_LEVEL, format=log_format)
 
 # 为 logger 设置别名，方便在其他模块中导入和使用
 LOG = logger
 
 # 将 LOG 变量公开，允许其他模块通过 from logger import LOG 来使用它
-__all__ = ["LOG"]
+__all__ = ["LOG", "truncate", "format_messages"]
@@ -0,0 +1,109 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from utils.metrics import metrics  # 导入全局指标注册表
+
+
+class StartupTimer:
+    """
+    启动耗时统计。按阶段记录启动过程中各步骤的耗时（导入界面、构建页面、启动服务、加载代理等），
+    启动完成后输出报告，并通过 /metrics 的 lm_startup_seconds 导出。
+    """
+    def __init__(self):
+        self.origin = time.perf_counter()  # 开始计时的时间，即本模块被导入的时间
+        self.phases = {}  # 阶段名称 -> 耗时（秒），按记录顺序排列
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        """
+        记录一个阶段的耗时，同名阶段的耗时累加。
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.phases[name] = self.phases.get(name, 0.0) + elapsed
+
+    def elapsed(self):
+        """
+        返回从开始计时到现在的秒数。
+        """
+        return time.perf_counter() - self.origin
+
+    def report(self, title="启动耗时"):
+        """
+        生成各阶段耗时的文本报告。
+        """
+        with self._lock:
+            phases = list(self.phases.items())
+        lines = [f"{title}（自进程导入入口模块起 {self.elapsed():.2f}s）："]
+        lines += [f"  {name:<16}{seconds:>8.3f}s" for name, seconds in phases]
+        return "\n".join(lines)
+
+
+class LazyAgents:
+    """
+    按名称延迟创建的代理集合。名称在启动时就已确定（用于构建界面），代理及其依赖的 langchain 模块
+    在首次通过 [] 或 get 访问时才导入和创建，也可以在服务启动后由后台线程调用 load_all 提前创建。
+    用法与字典相同：in、迭代和 len 只使用名称，不会触发创建。
+    """
+    def __init__(self, factories):
+        self._factories = dict(factories)  # 名称 -> 创建代理的函数
+        self._agents = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name):
+        agent = self._agents.get(name)
+        if agent is not None:
+            return agent
+        factory = self._factories[name]
+        with self._lock:
+            if name not in self._agents:
+                self._agents[name] = factory()
+            return self._agents[name]
+
+    def get(self, name, default=None):
+        return self[name] if name in self._factories else default
+
+    def __contains__(self, name):
+        return name in self._factories
+
+    def __iter__(self):
+        return iter(self._factories)
+
+    def __len__(self):
+        return len(self._factories)
+
+    def keys(self):
+        return self._factories.keys()
+
+    def values(self):
+        """
+        返回所有代理，尚未创建的代理会被创建。
+        """
+        return [self[name] for name in self._factories]
+
+    def load_all(self):
+        """
+        创建所有尚未创建的代理。
+        """
+        return self.values()
+
+    @property
+    def loaded(self):
+        return len(self._agents)
+
+
+# 全局启动耗时统计
+startup_timer = StartupTimer()
+
+metrics.gauge(
+    "lm_startup_seconds",
+    "启动过程中各阶段的耗时",
+    lambda: {(name,): seconds for name, seconds in startup_timer.phases.items()},
+    ("phase",),
+)
@@ -0,0 +1,19 @@
+import math
+
+
+def percentile(values, q):
+    """
+    最近秩法计算百分位数，离线评测与压测共用，保证两者报告的 p50/p95 口径一致。
+
+    参数:
+        values (list): 观测值
+        q (float): 百分位（0~100）
+
+    返回:
+        float: 百分位数，values 为空时返回 None
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(q * len(ordered) / 100.0) - 1))  # 第 ceil(q% × n) 小的值
+    return ordered[index]
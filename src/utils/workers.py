@@ -0,0 +1,370 @@
+"""
+多进程模式：主进程只运行一个按会话粘滞的反向代理，把请求转发给 N 个各自运行 Gradio 的工作进程，
+提示词拼装、日志、历史处理与 Gradio 序列化等 Python 侧的工作因此可以用满多个 CPU 核。
+
+工作进程之间通过 SQLite 共享会话历史与词汇学习进度（见 agents.history_store 的 shared 模式），
+任一工作进程都能处理任何学习者的下一轮对话。代理仍按浏览器会话标识（session_hash）把同一会话的请求
+固定转发给同一个工作进程：Gradio 的排队事件流、gr.State 与页面关闭事件都保存在处理该会话的进程中；
+该进程不可用时，请求转给下一个工作进程，会话历史从数据库中恢复。
+
+本模块只在启动代理时才导入 httpx、starlette 与 uvicorn，主进程不导入界面与代理。
+"""
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+
+# 不转发的逐跳首部
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te", "trailer",
+    "transfer-encoding", "upgrade", "content-length",
+}
+
+
+def current_worker_id():
+    """
+    返回当前工作进程的编号，不是多进程模式下的工作进程时返回 None。
+    """
+    worker_id = os.environ.get("LM_WORKER_ID")
+    return int(worker_id) if worker_id not in (None, "") else None
+
+
+def shared_state():
+    """
+    是否与其他工作进程共享会话状态（会话历史与学习进度必须保存在共用的数据库中）。
+    """
+    return current_worker_id() is not None
+
+
+def is_primary():
+    """
+    是否为负责全局后台任务（模型预热与保活）的进程：单进程模式或 0 号工作进程。
+    """
+    return current_worker_id() in (None, 0)
+
+
+def worker_share(total):
+    """
+    多进程模式下每个工作进程分得的名额（例如发往模型的并发数），保证所有进程合计不少于 total。
+    """
+    if current_worker_id() is None:
+        return total
+    workers = max(1, int(os.environ.get("LM_WORKERS", "1") or 1))
+    return max(1, math.ceil(total / workers)) if total > 0 else total
+
+
+def worker_count(argv=None):
+    """
+    从命令行参数（--workers）或环境变量 LM_WORKERS 读取工作进程数。工作进程自身总是返回 1。
+    """
+    if current_worker_id() is not None:
+        return 1
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("LM_WORKERS", "1") or 1))
+    args, _ = parser.parse_known_args(argv)
+    return args.workers
+
+
+def session_key(path, query_params, headers, body, client_host):
+    """
+    从请求中找出用于粘滞转发的键：Gradio 的浏览器会话标识（位于查询参数、心跳路径或 JSON 请求体中），
+    只带有事件标识的请求（例如 /reset 的请求体只有 event_id）使用事件标识，都找不到时使用客户端地址。
+    查询参数 worker=N 可以指定转发给第 N 个工作进程（例如读取其 /metrics）。
+
+    返回:
+        tuple: ("worker", 编号)、("event", 事件标识) 或 ("key", 字符串)
+    """
+    worker = query_params.get("worker")
+    if worker is not None and worker.isdigit():
+        return "worker", int(worker)
+    for name in ("session_hash", "upload_id"):
+        if query_params.get(name):
+            return "key", query_params[name]
+    if "/heartbeat/" in path:
+        return "key", path.rstrip("/").rsplit("/", 1)[-1]
+    if body and headers.get("content-type", "").startswith("application/json"):
+        try:
+            data = json.loads(body)
+        except ValueError:
+            data = None
+        if isinstance(data, dict) and data.get("session_hash"):
+            return "key", str(data["session_hash"])
+        if isinstance(data, dict) and data.get("event_id"):
+            return "event", str(data["event_id"])
+    return "key", client_host or ""
+
+
+class WorkerTarget:
+    """
+    代理转发的一个工作进程。
+    """
+    def __init__(self, index, url):
+        self.index = index
+        self.url = url
+        self.down_until = 0.0  # 连接失败后暂时跳过该进程，直到这个时间
+
+    def available(self, now):
+        return now >= self.down_until
+
+
+class StickyProxy:
+    """
+    按会话粘滞的反向代理。同一会话总是转发给同一个工作进程，该进程连接失败时依次尝试后续进程。
+    响应以流的形式原样转发，Gradio 的 SSE 事件流不会被缓冲；客户端断开时同时关闭与工作进程的连接，
+    工作进程据此触发页面关闭事件。
+    排队事件由 /queue/join 在某个工作进程中创建，代理记录事件标识与该进程的对应关系，
+    只带有事件标识的后续请求（例如 /reset）转发给创建该事件的进程。
+    """
+    def __init__(self, worker_urls, retry_after=2.0, max_events=10000):
+        self.workers = [WorkerTarget(i, url) for i, url in enumerate(worker_urls)]
+        self.retry_after = retry_after  # 连接失败的工作进程被跳过的时间（秒）
+        self.max_events = max_events  # 最多记录的事件数，超出时丢弃最早的记录
+        self.events = OrderedDict()  # 事件标识 -> 创建该事件的工作进程编号
+        self.client = None
+
+    def record_event(self, body, worker):
+        """
+        从 /queue/join 的响应中读取事件标识，记录创建该事件的工作进程。
+        """
+        try:
+            event_id = json.loads(body).get("event_id")
+        except (ValueError, AttributeError):
+            return
+        if event_id:
+            self.events[str(event_id)] = worker.index
+            while len(self.events) > self.max_events:
+                self.events.popitem(last=False)
+
+    def candidates(self, key):
+        """
+        返回按优先顺序排列的工作进程：先是会话对应的进程，之后依次是环上的下一个进程。
+        已记录的事件只转发给创建它的进程，未记录的事件按事件标识选择进程。
+        """
+        kind, value = key
+        if kind == "event":
+            index = self.events.get(value)
+            if index is not None:
+                return [self.workers[index]]
+            kind = "key"
+        first = value if kind == "worker" else zlib.crc32(value.encode("utf-8"))
+        first %= len(self.workers)
+        order = [self.workers[(first + i) % len(self.workers)] for i in range(len(self.workers))]
+        if kind == "worker":
+            return order[:1]
+        now = time.monotonic()
+        return [w for w in order if w.available(now)] or order
+
+    def create_app(self, on_shutdown=()):
+        import httpx
+        from starlette.applications import Starlette
+        from starlette.background import BackgroundTask
+        from starlette.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+        from starlette.routing import Route
+
+        from utils.logger import LOG
+
+        async def healthz(request):
+            return JSONResponse({"status": "ok"})
+
+        async def ready(request):
+            # 至少一个工作进程就绪即可接收流量，不可用的进程由代理绕过
+            states = []
+            for worker in self.workers:
+                try:
+                    response = await self.client.get(f"{worker.url}/ready", timeout=2.0)
+                    states.append(response.json())
+                except (httpx.HTTPError, ValueError) as e:
+                    states.append({"ready": False, "detail": f"unreachable: {type(e).__name__}"})
+            is_ready = any(state.get("ready") for state in states)
+            return JSONResponse({"ready": is_ready, "workers": states}, status_code=200 if is_ready else 503)
+
+        async def relay(response):
+            # 工作进程中途退出时结束转发，客户端随后重新连接，由其他工作进程接手
+            try:
+                async for chunk in response.aiter_raw():
+                    yield chunk
+            except httpx.HTTPError as e:
+                LOG.warning(f"[StickyProxy] 转发 {response.request.url.path} 的响应时连接中断：{type(e).__name__}")
+
+        async def forward(request):
+            body = await request.body()
+            key = session_key(
+                request.url.path, request.query_params, request.headers, body,
+                request.client.host if request.client else None,
+            )
+            headers = [(k, v) for k, v in request.headers.raw if k.decode("latin-1").lower() not in HOP_BY_HOP_HEADERS]
+            if request.client:
+                headers.append((b"x-forwarded-for", request.client.host.encode("latin-1")))
+            for worker in self.candidates(key):
+                upstream = self.client.build_request(
+                    request.method,
+                    worker.url + request.url.path,
+                    params=request.url.query,
+                    headers=headers,  # 保留原始的 Host，Gradio 据此生成页面中的地址
+                    content=body,
+                )
+                try:
+                    response = await self.client.send(upstream, stream=True)
+                except (httpx.ConnectError, httpx.ConnectTimeout):
+                    worker.down_until = time.monotonic() + self.retry_after
+                    continue
+                response_headers = [  # 逐条保留，同名首部（例如多个 Set-Cookie）不会被合并
+                    (k, v) for k, v in response.headers.raw if k.decode("latin-1").lower() not in HOP_BY_HOP_HEADERS
+                ]
+                if request.url.path.rstrip("/").endswith("/queue/join") and response.status_code == 200:
+                    # 加入队列的响应很短，读完后记录事件由哪个工作进程创建
+                    try:
+                        content = b"".join([chunk async for chunk in response.aiter_raw()])  # 保持原始编码，与首部一致
+                    finally:
+                        await response.aclose()
+                    self.record_event(content, worker)
+                    joined = Response(content, status_code=response.status_code)
+                    joined.raw_headers = response_headers + [(b"content-length", str(len(content)).encode("latin-1"))]
+                    return joined
+                streaming = StreamingResponse(
+                    relay(response),
+                    status_code=response.status_code,
+                    background=BackgroundTask(response.aclose),
+                )
+                streaming.raw_headers = response_headers
+                return streaming
+            return PlainTextResponse("没有可用的工作进程", status_code=503)
+
+        async def startup():
+            # 事件流可能持续很久，不设置读取超时
+            self.client = httpx.AsyncClient(timeout=httpx.Timeout(None, connect=5.0), limits=httpx.Limits(max_connections=None))
+
+        async def shutdown():
+            await self.client.aclose()
+            for callback in on_shutdown:
+                callback()
+
+        methods = ["GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS"]
+        return Starlette(
+            routes=[
+                Route("/healthz", healthz),
+                Route("/ready", ready),
+                Route("/{path:path}", forward, methods=methods),
+            ],
+            on_startup=[startup],
+            on_shutdown=[shutdown],
+        )
+
+
+class WorkerSupervisor:
+    """
+    启动并看护工作进程：每个工作进程以相同的命令行参数运行 main.py，通过环境变量得知自己的编号与端口；
+    异常退出的进程会被重新启动。
+    """
+    def __init__(self, argv, workers, base_port, restart_delay=2.0):
+        self.argv = list(argv)
+        self.ports = [base_port + i for i in range(workers)]
+        self.restart_delay = restart_delay
+        self._processes = [None] * workers
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def urls(self):
+        return [f"http://127.0.0.1:{port}" for port in self.ports]
+
+    def _spawn(self, index):
+        from utils.logger import LOG
+
+        env = dict(
+            os.environ,
+            LM_WORKER_ID=str(index),
+            LM_WORKERS=str(len(self.ports)),
+            GRADIO_SERVER_NAME="127.0.0.1",
+            GRADIO_SERVER_PORT=str(self.ports[index]),
+        )
+        self._processes[index] = subprocess.Popen([sys.executable, MAIN_SCRIPT, *self.argv], env=env)
+        LOG.info(f"[WorkerSupervisor] 工作进程 {index} 已启动（pid {self._processes[index].pid}，端口 {self.ports[index]}）")
+
+    def start(self):
+        for index in range(len(self.ports)):
+            self._spawn(index)
+        self._thread = threading.Thread(target=self._monitor, name="worker-supervisor", daemon=True)
+        self._thread.start()
+
+    def _monitor(self):
+        from utils.logger import LOG
+
+        while not self._stop.wait(1.0):
+            for index, process in enumerate(self._processes):
+                code = process.poll()
+                if code is None or self._stop.is_set():
+                    continue
+                LOG.error(f"[WorkerSupervisor] 工作进程 {index} 已退出（退出码 {code}），{self.restart_delay:.0f} 秒后重启")
+                if self._stop.wait(self.restart_delay):
+                    return
+                self._spawn(index)
+
+    def stop(self, timeout=10.0):
+        """
+        停止所有工作进程，超时仍未退出的进程被强制结束。可以重复调用。
+        """
+        self._stop.set()
+        for process in self._processes:
+            if process is not None and process.poll() is None:
+                process.terminate()
+        deadline = time.monotonic() + timeout
+        for process in self._processes:
+            if process is None:
+                continue
+            try:
+                process.wait(max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def run_workers(argv, workers):
+    """
+    多进程模式的入口：启动 workers 个工作进程，并在 GRADIO_SERVER_PORT（默认 7860）上运行粘滞代理。
+    工作进程使用其后的端口。会话历史必须保存在各进程共用的 SQLite 数据库中。
+    """
+    import uvicorn
+
+    from utils.logger import LOG
+
+    backend = os.environ.setdefault("LM_HISTORY_BACKEND", "sqlite")
+    if backend != "sqlite":
+        LOG.warning(f"[main] 多进程模式下 LM_HISTORY_BACKEND={backend}，会话历史不在进程间共享，工作进程不可用时会话将丢失")
+
+    port = int(os.environ.get("GRADIO_SERVER_PORT", "7860"))
+    supervisor = WorkerSupervisor(argv, workers, base_port=port + 1)
+    supervisor.start()
+    proxy = StickyProxy(supervisor.urls)
+    LOG.info(f"[main] 多进程模式：{workers} 个工作进程，代理监听 0.0.0.0:{port}")
+    try:
+        # uvicorn 在平滑退出后会重新发出收到的 SIGTERM，finally 不一定有机会执行，因此在应用关闭时停止工作进程
+        uvicorn.run(proxy.create_app(on_shutdown=[supervisor.stop]), host="0.0.0.0", port=port, log_level="warning")
+    finally:
+        supervisor.stop()
+    return 0
+
+
+def watch_supervisor(interval=2.0):
+    """
+    在工作进程中启动后台线程：主进程意外退出（例如被强制结束）后，工作进程随之退出，不留下无人管理的进程。
+    """
+    parent = os.getppid()
+
+    def watch():
+        from utils.logger import LOG
+
+        while True:
+            time.sleep(interval)
+            if os.getppid() != parent:
+                LOG.warning(f"[main] 主进程 {parent} 已退出，工作进程 {current_worker_id()} 随之退出")
+                os._exit(0)
+
+    threading.Thread(target=watch, name="supervisor-watch", daemon=True).start()
@@ -0,0 +1,34 @@
+import itertools
+
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables.history import RunnableWithMessageHistory
+
+from agents.compact_history import AI, HUMAN, OTHER, CompactChatMessageHistory, MessageLog
+
+
+def test_streamed_turn_is_stored_compactly():
+    history = CompactChatMessageHistory()
+    prompt = ChatPromptTemplate.from_messages([MessagesPlaceholder(variable_name="messages")])
+    llm = GenericFakeChatModel(messages=itertools.cycle(["Nice to meet you too!"]))
+    chatbot = RunnableWithMessageHistory(prompt | llm, lambda session_id: history)
+
+    chunks = list(chatbot.stream([HumanMessage(content="Nice to meet you")], {"configurable": {"session_id": "s"}}))
+
+    assert "".join(chunk.content for chunk in chunks) == "Nice to meet you too!"
+    assert list(history.log.roles) == [HUMAN, AI]
+    assert all(type(content) is str for content in history.log.contents)
+    assert history.log.contents[1] == "Nice to meet you too!"
+
+
+def test_chunk_metadata_is_dropped():
+    log = MessageLog([
+        AIMessageChunk(content="hi", id="run-1", response_metadata={"eval_count": 3}),
+        AIMessage(content="tool", tool_calls=[{"name": "f", "args": {}, "id": "1"}]),
+    ])
+
+    assert list(log.roles) == [AI, OTHER]
+    assert log.contents[0] == "hi"
+    restored = log.to_messages()[0]
+    assert isinstance(restored, AIMessage) and restored.response_metadata == {}
@@ -0,0 +1,13 @@
+from langchain_core.messages import AIMessage, HumanMessage
+
+from agents.response_cache import ResponseCache
+
+
+def test_only_opening_turns_are_cacheable():
+    cache = ResponseCache()
+
+    assert cache.cacheable([])  # 词汇学习的第一轮：列出单词的开场消息
+    assert cache.cacheable([AIMessage(content="Welcome to the hotel.")])  # 场景的初始 AI 消息之后
+    # 学习者发言之后的上下文因人而异
+    assert not cache.cacheable([HumanMessage(content="words: apple"), AIMessage(content="Let's start!")])
+    assert not cache.cacheable([HumanMessage(content="hello")])
@@ -0,0 +1,10 @@
+from utils.stats import percentile
+
+
+def test_percentile_uses_nearest_rank():
+    values = list(range(1, 21))
+    assert percentile(values, 50) == 10
+    assert percentile(values, 95) == 19
+    assert percentile(values, 100) == 20
+    assert percentile([3.0], 99) == 3.0
+    assert percentile([], 50) is None
@@ -0,0 +1,34 @@
+import threading
+
+from agents.vocab_engine import VocabEngine, VocabProgressStore, practiced
+
+
+def test_practiced_matches_y_to_i_forms():
+    assert practiced("study", ["she", "studies", "daily"])
+    assert practiced("study", ["studied"])
+    assert practiced("happy", ["happily"])
+    assert not practiced("study", ["studio"])
+    assert practiced("innovate", ["innovated"])
+
+
+def test_concurrent_level_updates_are_not_lost():
+    engine = VocabEngine(store=VocabProgressStore(), batch_size=2)
+    store_get = engine.store.get
+    barrier = threading.Barrier(2, timeout=0.2)
+
+    def slow_get(learner):
+        progress = store_get(learner)
+        try:
+            barrier.wait()  # 没有加锁时两个线程会读到同一份进度
+        except threading.BrokenBarrierError:
+            pass
+        return progress
+
+    engine.store.get = slow_get
+    threads = [threading.Thread(target=engine.start_level, args=("learner",)) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert store_get("learner").cursor == 6  # 每次开始新关都确定下一关的 2 个新单词